@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scraping', 'src', 'pipelines'))
+import storage
+import sentiment
+from feature_store import FeatureStore
+from lexicon_matcher import load_matcher
+from stance import STANCE_MAPPING, fit_document_frequency, score_stance
+from embeddings import document_vectors, embed_articles
+from word2vec_training import train_word2vec, load_word_vectors
+from streaming_clustering import CLUSTER_MODELS, fit_model
+
+REGISTRY_DIR = 'data/models/artifacts'
+ARTIFACT_FILE, METADATA_FILE = 'artifact.joblib', 'metadata.json'
+
+class ArtifactRegistry:
+    def __init__(self, root=REGISTRY_DIR):
+        """
+        Versioned store of fitted transformers and models. Every artifact is saved in
+        `<root>/<name>/v<version>/` as a joblib file plus a metadata.json with its config,
+        the hash of the corpus it was fitted on and the creation date.
+
+        Args:
+            root (str): Directory of the registry.
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._loaded = {}
+
+    def names(self):
+        return sorted(name for name in os.listdir(self.root) if self.versions(name))
+
+    def versions(self, name):
+        directory = os.path.join(self.root, name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(int(version[1:]) for version in os.listdir(directory)
+                      if version.startswith('v') and os.path.exists(os.path.join(directory, version, METADATA_FILE)))
+
+    def _directory(self, name, version):
+        return os.path.join(self.root, name, f"v{version}")
+
+    def metadata(self, name, version=None):
+        """
+        Returns the metadata of a version of an artifact (the latest one by default).
+        """
+        versions = self.versions(name)
+        if not versions:
+            raise KeyError(f"No artifact '{name}' in {self.root}")
+        version = versions[-1] if version is None else version
+        with open(os.path.join(self._directory(name, version), METADATA_FILE), 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def save(self, name, artifact, config=None, corpus_hash=None):
+        """
+        Saves a new version of an artifact, unless the latest version was fitted with the
+        same config on the same corpus (then that version is kept).
+
+        Returns:
+            int: Version of the artifact.
+        """
+        import joblib
+
+        config = config or {}
+        versions = self.versions(name)
+        if versions:
+            latest = self.metadata(name)
+            if latest['config'] == json.loads(json.dumps(config)) and latest['corpus_hash'] == corpus_hash:
+                return latest['version']
+
+        version = versions[-1] + 1 if versions else 1
+        directory = self._directory(name, version)
+        os.makedirs(directory)
+        joblib.dump(artifact, os.path.join(directory, ARTIFACT_FILE))
+        # Metadata written last: a version without it is ignored
+        with open(os.path.join(directory, METADATA_FILE), 'w', encoding='utf-8') as file:
+            json.dump({'name': name, 'version': version, 'config': config, 'corpus_hash': corpus_hash,
+                       'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds')}, file, indent=4)
+        return version
+
+    def load(self, name, version=None):
+        """
+        Loads a version of an artifact (the latest one by default). Loaded artifacts are
+        kept in memory, so every one is only read from disk once per process.
+        """
+        import joblib
+
+        version = self.metadata(name, version)['version']
+        if (name, version) not in self._loaded:
+            self._loaded[(name, version)] = joblib.load(os.path.join(self._directory(name, version), ARTIFACT_FILE))
+        return self._loaded[(name, version)]
+
+#Function to get the hash of the corpus (ids and content hashes of all the articles)
+def corpus_hash(conn, batch_size=50_000):
+    storage.refresh_content_hashes(conn)
+    digest = hashlib.sha256()
+    cursor = conn.execute('SELECT id, content_hash FROM content ORDER BY id')
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return digest.hexdigest()
+        digest.update(''.join(f"{article_id}:{content_hash}\n" for article_id, content_hash in rows).encode('utf-8'))
+
+#Function to fit and register every artifact of the bias-scoring pipeline
+def fit_artifacts(db_path, registry, store, pca_components=2, chunk_size=10_000, **word2vec_params):
+    """
+    Fits the lexicon IDF, the Word2Vec model (cached by word2vec_training), the PCA of the
+    document vectors and the bias clusterings on the current corpus, and registers them.
+    Artifacts whose config and corpus did not change keep their version.
+
+    Args:
+        db_path (str): Path to the SQLite database.
+        registry (ArtifactRegistry): Registry to save the artifacts to.
+        store (FeatureStore): Store for the document vectors and the clustering features.
+        pca_components (int): Number of components of the PCA.
+        chunk_size (int): Rows read at a time by the PCA and the clusterings.
+        **word2vec_params: Arguments of train_word2vec (parameters, cache_dir).
+    """
+    from sklearn.decomposition import IncrementalPCA
+
+    conn = storage.get_connection(db_path)
+    corpus = corpus_hash(conn)
+
+    matcher = load_matcher()
+    idf = fit_document_frequency(conn, matcher).idf()
+    stance_idf_version = registry.save('stance_idf', {'matcher': matcher, 'idf': idf},
+                                       {'lexicon': matcher.name, 'lexicon_version': matcher.version}, corpus)
+    print(f"stance_idf v{stance_idf_version}")
+
+    # The model itself stays in the Word2Vec cache; the registry keeps a reference to it
+    model, model_dir = train_word2vec(db_path, **word2vec_params)
+    version = registry.save('word2vec', {'model_dir': model_dir}, {'model_dir': model_dir}, corpus)
+    print(f"word2vec v{version}")
+
+    embed_articles(db_path, model.wv, store)
+    vectors = store.load('word2vec')[1]
+    pca = IncrementalPCA(n_components=pca_components)
+    for start in range(0, len(vectors), chunk_size):
+        batch = vectors[start:start + chunk_size]
+        if len(batch) >= pca_components:
+            pca.partial_fit(batch)
+    version = registry.save('pca', pca, {'n_components': pca_components, 'word2vec': model_dir}, corpus)
+    print(f"pca v{version}")
+
+    # The clusterings are refitted on every run, on features that come from other artifacts
+    # and stages: their config includes those, so a new version is saved when they change
+    upstream = {'word2vec': model_dir, 'stance_idf': stance_idf_version,
+                'sentiment': [sentiment.SENTIMENT_VERSION, sentiment.stage_config(sentiment.DEFAULT_SCORERS)]}
+    for name, config in CLUSTER_MODELS.items():
+        clustering = fit_model(db_path, store, name, chunk_size=chunk_size)
+        version = registry.save(f"cluster_{name}", clustering, {**config, 'upstream': upstream}, corpus)
+        print(f"cluster_{name} v{version}")
+
+class ArticleScorer:
+    def __init__(self, registry, scorers=sentiment.DEFAULT_SCORERS):
+        """
+        Scores articles with the registered artifacts. Everything is loaded once, when the
+        scorer is created; scoring does not refit anything.
+
+        Args:
+            registry (ArtifactRegistry): Registry with the fitted artifacts (fit_artifacts).
+            scorers (tuple): Sentiment scorers (see sentiment.SCORERS).
+        """
+        stance_idf = registry.load('stance_idf')
+        self.matcher, self.idf = stance_idf['matcher'], stance_idf['idf']
+        self.wv = load_word_vectors(registry.load('word2vec')['model_dir'])
+        self.pca = registry.load('pca')
+        self.clusterings = {name: registry.load(f"cluster_{name}") for name in CLUSTER_MODELS}
+        self.scorers = tuple(scorers)
+        sentiment.init_worker(self.scorers)
+
+    def score(self, clean_texts, index=None):
+        """
+        Scores a batch of clean texts.
+
+        Returns:
+            pd.DataFrame: Sentiment, lexicon stance, PCA coordinates and bias clusters of every text.
+        """
+        clean_texts = list(clean_texts)
+        scores = score_stance(clean_texts, self.matcher, self.idf, index=index)
+        sentiment_scores = sentiment.score_texts(clean_texts, self.scorers)
+        for position, name in enumerate(self.scorers):
+            scores[sentiment.SCORER_COLUMNS[name]] = [score[position] for score in sentiment_scores]
+
+        blocks = {'word2vec': document_vectors(clean_texts, self.wv)}
+        coordinates = self.pca.transform(blocks['word2vec'])
+        for component in range(coordinates.shape[1]):
+            scores[f"pca_{component + 1}"] = coordinates[:, component]
+
+        # Features of the clusterings, computed as the FEATURES expressions of streaming_clustering
+        # (and the word2vec block from the same vectors as the PCA)
+        features = pd.DataFrame({
+            'sentiment_score': scores.get('sentiment_score_vader', 0),
+            'pro_immigration_tfidf': scores['pro_immigration_tfidf'],
+            'anti_immigration_tfidf': scores['anti_immigration_tfidf'],
+        }, index=scores.index)
+        features['stance_tfidf'] = scores['stance_tfidf'].map(STANCE_MAPPING)
+        features['sentiment_stance'] = (features['sentiment_score'] + features['pro_immigration_tfidf']
+                                        - features['anti_immigration_tfidf'])
+        for name, clustering in self.clusterings.items():
+            config = CLUSTER_MODELS[name]
+            X = np.hstack([blocks[block] for block in config['blocks']] + [features[config['features']].to_numpy()])
+            scores[f"cluster_{name}"] = clustering.predict(X)[0]
+        return scores
+
+#Function to score articles of the database with the registered artifacts
+def score_articles(ids, db_path='data/processed/articles.db', registry=None, scorer=None, batch_size=1000):
+    """
+    Scores the given articles in batches with the registered artifacts. Articles that
+    have not been cleaned yet are cleaned on the fly.
+
+    Args:
+        ids (iterable): Content ids.
+        db_path (str): Path to the SQLite database.
+        registry (ArtifactRegistry): Registry to load the artifacts from (default location if None).
+        scorer (ArticleScorer): Already loaded scorer, to reuse between calls.
+        batch_size (int): Number of articles scored at a time.
+
+    Returns:
+        pd.DataFrame: Scores indexed by content id.
+    """
+    from preprocessing import clean_and_filter
+
+    scorer = scorer or ArticleScorer(registry or ArtifactRegistry())
+    conn = storage.get_connection(db_path)
+    ids = [int(article_id) for article_id in ids]
+
+    results = []
+    for start in range(0, len(ids), batch_size):
+        batch_ids = ids[start:start + batch_size]
+        placeholders = ', '.join(['?'] * len(batch_ids))
+        df = storage.read_frame(f'SELECT id, text, clean_text FROM content WHERE id IN ({placeholders})',
+                                batch_ids, db=conn).set_index('id')
+        clean = [clean_text if pd.notna(clean_text) else clean_and_filter(text or '')
+                 for text, clean_text in zip(df['text'], df['clean_text'])]
+        results.append(scorer.score(clean, index=df.index))
+
+    if not results:
+        return pd.DataFrame()
+    return pd.concat(results).reindex(ids)
+
+if __name__ == "__main__":
+    db_path = 'data/processed/articles.db'
+    registry = ArtifactRegistry()
+    fit_artifacts(db_path, registry, FeatureStore('data/features'))
+    latest = [row[0] for row in storage.get_connection(db_path).execute('SELECT id FROM content ORDER BY id DESC LIMIT 10')]
+    print(score_articles(latest, db_path, registry))
@@ -0,0 +1,183 @@
+import numpy as np
+
+# Default size of the distance blocks: 2048 x 2048 float64 distances are 32 MB
+CHUNK_SIZE = 2048
+SAMPLE_SIZE = 2_000
+REFERENCE_SIZE = 50_000
+
+#Function to get the euclidean distances between two blocks of rows
+def _block_distances(A, B, A_norms, B_norms):
+    distances = A_norms[:, None] + B_norms[None, :] - 2 * (A @ B.T)
+    np.maximum(distances, 0, out=distances)
+    return np.sqrt(distances, out=distances)
+
+#Function to sum the distances of some rows to the members of every cluster, block by block
+def cluster_distance_sums(queries, reference, reference_labels, n_clusters, chunk_size=CHUNK_SIZE):
+    """
+    Returns the (queries, clusters) matrix of the sums of the distances of every query row
+    to the reference rows of every cluster. Distances are computed in chunk_size x chunk_size
+    blocks and only their per-cluster sums are kept, so memory is
+    O(chunk_size² + queries * clusters).
+    """
+    queries = np.asarray(queries, dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+    query_norms = np.einsum('ij,ij->i', queries, queries)
+    reference_norms = np.einsum('ij,ij->i', reference, reference)
+    one_hot = np.zeros((len(reference), n_clusters))
+    one_hot[np.arange(len(reference)), reference_labels] = 1
+
+    sums = np.zeros((len(queries), n_clusters))
+    for row in range(0, len(queries), chunk_size):
+        rows = slice(row, row + chunk_size)
+        for column in range(0, len(reference), chunk_size):
+            columns = slice(column, column + chunk_size)
+            distances = _block_distances(queries[rows], reference[columns], query_norms[rows], reference_norms[columns])
+            sums[rows] += distances @ one_hot[columns]
+    return sums
+
+#Function to get the silhouette of every row of X with bounded memory
+def silhouette_samples_chunked(X, labels, chunk_size=CHUNK_SIZE):
+    """
+    Computes the exact silhouette of every sample, as sklearn's silhouette_samples,
+    without materializing the n x n distance matrix (see cluster_distance_sums): memory
+    is O(chunk_size² + n * clusters) whatever n is, time is still O(n²).
+
+    Args:
+        X (np.ndarray): Samples (n, features).
+        labels (np.ndarray): Cluster of every sample (at least 2 clusters).
+        chunk_size (int): Rows of the distance blocks.
+
+    Returns:
+        np.ndarray: Silhouette of every sample (0 for samples alone in their cluster).
+    """
+    clusters, labels = _encode_labels(labels, len(X))
+    sums = cluster_distance_sums(X, X, labels, len(clusters), chunk_size)
+    return _silhouette_from_sums(sums, labels, np.bincount(labels, minlength=len(clusters)))
+
+def _encode_labels(labels, n_samples):
+    clusters, labels = np.unique(labels, return_inverse=True)
+    if not 2 <= len(clusters) <= n_samples - 1:
+        raise ValueError(f"Number of labels is {len(clusters)}. Valid values are 2 to n_samples - 1 (inclusive)")
+    return clusters, labels
+
+def _silhouette_from_sums(cluster_sums, labels, cluster_sizes):
+    """
+    Silhouettes of rows that belong to the reference set of cluster_sums (so the own
+    cluster has cluster_sizes - 1 other members).
+    """
+    rows = np.arange(len(labels))
+    own_sizes = cluster_sizes[labels]
+    # Mean distance to the other members of the own cluster (the distance to itself is 0)
+    a = cluster_sums[rows, labels] / np.maximum(own_sizes - 1, 1)
+    # Mean distance to the nearest other cluster
+    means = cluster_sums / cluster_sizes
+    means[rows, labels] = np.inf
+    b = means.min(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        silhouette = (b - a) / np.maximum(a, b)
+    silhouette[own_sizes == 1] = 0
+    return np.nan_to_num(silhouette)
+
+#Function to get the exact mean silhouette with bounded memory
+def silhouette_score_chunked(X, labels, chunk_size=CHUNK_SIZE):
+    return float(silhouette_samples_chunked(X, labels, chunk_size).mean())
+
+#Function to draw a sample stratified by cluster (proportional allocation, at least 2 per cluster)
+def stratified_sample(labels, sample_size, random_state=42):
+    rng = np.random.default_rng(random_state)
+    clusters, labels = np.unique(labels, return_inverse=True)
+    sizes = np.bincount(labels)
+    allocation = np.minimum(sizes, np.maximum(2, np.round(sample_size * sizes / len(labels)).astype(int)))
+
+    members = np.argsort(labels, kind='stable')
+    starts = np.concatenate(([0], np.cumsum(sizes)))
+    sample = [rng.choice(members[starts[cluster]:starts[cluster + 1]], allocation[cluster], replace=False)
+              for cluster in range(len(clusters))]
+    return np.sort(np.concatenate(sample))
+
+#Function to estimate the mean silhouette from a stratified sample, with a confidence interval
+def silhouette_score_sampled(X, labels, sample_size=SAMPLE_SIZE, reference_size=REFERENCE_SIZE, confidence=0.95,
+                             random_state=42, chunk_size=CHUNK_SIZE):
+    """
+    Estimates the mean silhouette from a sample stratified by cluster, so small clusters
+    are always represented. The silhouette of every sampled row is measured against a
+    larger stratified reference set (the whole data when n <= reference_size), which
+    costs O(sample_size * reference_size) whatever n is. The estimates of the clusters are
+    combined with their share of the full data (stratified mean), and the confidence
+    interval comes from the stratified variance.
+
+    Args:
+        X (np.ndarray): Samples (n, features).
+        labels (np.ndarray): Cluster of every sample.
+        sample_size (int): Approximate number of rows whose silhouette is measured.
+        reference_size (int): Approximate number of rows the distances are measured to.
+        confidence (float): Level of the confidence interval.
+        random_state (int): Seed of the samples.
+        chunk_size (int): Rows of the distance blocks.
+
+    Returns:
+        dict: silhouette (estimate), silhouette_low, silhouette_high and sample_size.
+    """
+    from scipy.stats import norm
+
+    X = np.asarray(X)
+    clusters, labels = _encode_labels(labels, len(X))
+    population_sizes = np.bincount(labels)
+    if len(labels) <= sample_size:
+        score = silhouette_score_chunked(X, labels, chunk_size)
+        return {'silhouette': score, 'silhouette_low': score, 'silhouette_high': score, 'sample_size': len(labels)}
+
+    # The sampled rows are drawn from the reference rows, so their own cluster excludes themselves
+    reference = np.arange(len(labels)) if len(labels) <= reference_size else stratified_sample(labels, reference_size, random_state)
+    sample = reference[stratified_sample(labels[reference], sample_size, random_state)]
+
+    sums = cluster_distance_sums(X[sample], X[reference], labels[reference], len(clusters), chunk_size)
+    sample_labels = labels[sample]
+    values = _silhouette_from_sums(sums, sample_labels, np.bincount(labels[reference], minlength=len(clusters)))
+
+    # Stratified mean and its variance (with the finite population correction)
+    weights = population_sizes / len(labels)
+    sample_sizes = np.bincount(sample_labels, minlength=len(clusters))
+    means = np.bincount(sample_labels, weights=values, minlength=len(clusters)) / sample_sizes
+    squares = np.bincount(sample_labels, weights=(values - means[sample_labels]) ** 2, minlength=len(clusters))
+    variances = squares / np.maximum(sample_sizes - 1, 1)
+    estimate = float(weights @ means)
+    standard_error = float(np.sqrt(np.sum(weights ** 2 * variances / sample_sizes * (1 - sample_sizes / population_sizes))))
+    margin = float(norm.ppf(0.5 + confidence / 2)) * standard_error
+    return {'silhouette': estimate, 'silhouette_low': estimate - margin, 'silhouette_high': estimate + margin,
+            'sample_size': len(sample)}
+
+#Function to evaluate a clustering with the silhouette, Davies-Bouldin and Calinski-Harabasz scores
+def evaluate_clustering(X, labels, mode='exact', sample_size=SAMPLE_SIZE, reference_size=REFERENCE_SIZE,
+                        chunk_size=CHUNK_SIZE, random_state=42):
+    """
+    Scores a clustering. Davies-Bouldin and Calinski-Harabasz are linear in n and always
+    exact; the silhouette is exact in bounded memory ('exact') or estimated from a
+    stratified sample with a 95% confidence interval ('sampled').
+
+    Args:
+        X (np.ndarray): Samples (n, features).
+        labels (np.ndarray): Cluster of every sample (at least 2 clusters).
+        mode (str): 'exact' or 'sampled'.
+        sample_size (int): Rows whose silhouette is measured in 'sampled' mode.
+        reference_size (int): Rows the distances are measured to in 'sampled' mode.
+        chunk_size (int): Rows of the distance blocks.
+        random_state (int): Seed of the sample.
+
+    Returns:
+        dict: silhouette, silhouette_low, silhouette_high, davies_bouldin and calinski_harabasz.
+    """
+    from sklearn.metrics import davies_bouldin_score, calinski_harabasz_score
+
+    if mode == 'exact':
+        score = silhouette_score_chunked(X, labels, chunk_size)
+        scores = {'silhouette': score, 'silhouette_low': score, 'silhouette_high': score}
+    elif mode == 'sampled':
+        scores = silhouette_score_sampled(X, labels, sample_size, reference_size, random_state=random_state, chunk_size=chunk_size)
+        scores.pop('sample_size')
+    else:
+        raise ValueError(f"Unknown silhouette mode '{mode}' (use 'exact' or 'sampled')")
+
+    scores['davies_bouldin'] = float(davies_bouldin_score(X, labels))
+    scores['calinski_harabasz'] = float(calinski_harabasz_score(X, labels))
+    return scores
@@ -0,0 +1,210 @@
+import os
+import sys
+import time
+import uuid
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scraping', 'src', 'pipelines'))
+import storage
+from feature_store import FeatureStore
+from cluster_evaluation import evaluate_clustering
+
+# Per-article features read from the content table (name -> SQL expression)
+DB_FEATURES = {
+    'sentiment_score': 'sentiment_score_vader',
+    'pro_immigration_tfidf': 'pro_immigration_tfidf',
+    'anti_immigration_tfidf': 'anti_immigration_tfidf',
+    'stance_tfidf': "CASE stance_tfidf WHEN 'PRO' THEN 1 WHEN 'ANTI' THEN -1 WHEN 'NEU' THEN 0 END",
+}
+BIAS_FEATURES = ['sentiment_score', 'pro_immigration_tfidf', 'anti_immigration_tfidf']
+NER_FEATURES = ['persons_vec', 'locations_vec', 'organizations_vec']
+
+#Function to mark the blocks the notebook stacked without min-max scaling them
+def raw(feature):
+    return (feature, False)
+
+# Feature configurations of the notebook (models_puebas_1): name -> blocks stacked in
+# order, each one a feature of the FeatureStore (document or entity vectors) or a
+# DB_FEATURES column. Blocks are min-max scaled unless wrapped in raw(), as in the notebook:
+#   X_embeddings_scaled   word2vec, scaled
+#   df_additional_scaled  BIAS_FEATURES + NER_FEATURES, scaled
+#   X_combined_scaled     X_embeddings_scaled + df_additional_scaled (the notebook's
+#                         "no_ner" and "all_combined" tests both ran on it)
+#   X_<entity>            X_embeddings_scaled + the raw entity vectors
+#   all_features          X_embeddings_scaled + X_combined_scaled (DBSCAN test F: the
+#                         embeddings twice)
+COMBINED_SCALED = ['word2vec'] + BIAS_FEATURES + NER_FEATURES
+CONFIGURATIONS = {
+    'embeddings': ['word2vec'],
+    'no_ner': COMBINED_SCALED,
+    'persons': ['word2vec', raw('persons_vec')],
+    'locations': ['word2vec', raw('locations_vec')],
+    'organizations': ['word2vec', raw('organizations_vec')],
+    'all_combined': COMBINED_SCALED,
+    'all_features': ['word2vec'] + COMBINED_SCALED,
+    'bias': ['word2vec'] + BIAS_FEATURES + ['stance_tfidf'],
+    'bias_only': BIAS_FEATURES,
+}
+
+# Grid of the sweep
+N_CLUSTERS = [2, 3, 4, 5, 6, 7]
+DBSCAN_GRID = [(0.5, 5)]  # (eps, min_samples)
+
+#Function to scale the columns of a matrix to [0, 1] (as MinMaxScaler)
+def min_max_scale(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    low, high = matrix.min(axis=0), matrix.max(axis=0)
+    span = np.where(high > low, high - low, 1)
+    return (matrix - low) / span
+
+class FeatureMatrices:
+    def __init__(self, db_path, store, base='word2vec'):
+        """
+        Builds the feature matrices of the configurations once and caches them in the
+        feature store (as `sweep_<configuration>`), so the worker processes memory-map
+        them instead of receiving a pickled copy with every job.
+
+        Every block is read (and scaled to [0, 1] when the configuration asks for it) once
+        and shared by all the configurations that use it. All the matrices have the rows of
+        the `base` feature, in the same order.
+
+        Args:
+            db_path (str): Path to the SQLite database.
+            store (FeatureStore): Store with the document/entity vectors; also holds the cache.
+            base (str): Feature whose content ids define the rows.
+        """
+        self.db_path = db_path
+        self.store = store
+        self.ids = store.load(base)[0]
+        self._blocks = {}
+        self._db_frame = None
+
+    def _db_block(self, name):
+        if self._db_frame is None:
+            columns = ', '.join(f'{expression} AS {feature}' for feature, expression in DB_FEATURES.items())
+            frame = storage.read_frame(f'SELECT id, {columns} FROM content', db=self.db_path)
+            self._db_frame = frame.set_index('id').reindex(self.ids).fillna(0)
+        return self._db_frame[[name]].to_numpy()
+
+    def block(self, name, scaled=True):
+        if (name, scaled) not in self._blocks:
+            if name in DB_FEATURES:
+                matrix = self._db_block(name)
+            elif name in self.store.names():
+                matrix = self.store.take(name, self.ids)
+            else:
+                raise KeyError(f"Unknown feature '{name}' (not in the feature store nor in DB_FEATURES)")
+            self._blocks[(name, scaled)] = min_max_scale(matrix) if scaled else np.asarray(matrix, dtype=np.float32)
+        return self._blocks[(name, scaled)]
+
+    def build(self, configuration, blocks):
+        """
+        Stacks the blocks of a configuration (names, or raw() for unscaled blocks) and caches
+        the matrix. Returns its feature name.
+        """
+        name = f"sweep_{configuration}"
+        blocks = [block if isinstance(block, tuple) else (block, True) for block in blocks]
+        self.store.save(name, self.ids, np.hstack([self.block(block, scaled) for block, scaled in blocks]))
+        return name
+
+#Function to fit one clustering job on a cached feature matrix (runs in the worker processes)
+def run_job(store_root, matrix_name, algorithm, params, silhouette_mode='exact'):
+    from sklearn.cluster import KMeans, DBSCAN
+
+    start = time.perf_counter()
+    X = FeatureStore(store_root).load(matrix_name)[1]
+    result = {'algorithm': algorithm, 'n_samples': len(X), **params}
+
+    if algorithm == 'kmeans':
+        model = KMeans(n_clusters=params['n_clusters'], random_state=42).fit(X)
+        labels = model.labels_
+        result['inertia'] = float(model.inertia_)
+    else:
+        labels = DBSCAN(eps=params['eps'], min_samples=params['min_samples']).fit_predict(X)
+        result['n_outliers'] = int((labels == -1).sum())
+        result['n_clusters'] = int(len(set(labels)) - (-1 in labels))
+
+    # Scores of the clustered points (DBSCAN noise excluded); undefined with less than 2 clusters
+    clustered = labels != -1
+    if len(set(labels[clustered])) > 1:
+        result.update(evaluate_clustering(X[clustered], labels[clustered], mode=silhouette_mode))
+
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+#Function to store the results of a sweep
+def save_results(conn, run_id, results):
+    created_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    columns = ['configuration', 'algorithm', 'n_clusters', 'eps', 'min_samples', 'silhouette', 'silhouette_low',
+               'silhouette_high', 'davies_bouldin', 'calinski_harabasz', 'inertia', 'n_outliers', 'n_samples', 'seconds']
+    rows = ((run_id, *(result.get(column) for column in columns), created_at) for result in results)
+    storage.write_batches(f'''
+        INSERT INTO clustering_results (run_id, {', '.join(columns)}, created_at)
+        VALUES ({', '.join(['?'] * (len(columns) + 2))})
+    ''', rows, conn)
+
+#Function to run the clustering sweep
+def run_sweep(db_path, store, configurations=None, n_clusters=N_CLUSTERS, dbscan_grid=DBSCAN_GRID, workers=None,
+              silhouette_mode='exact'):
+    """
+    Fits K-Means for every k and DBSCAN for every (eps, min_samples) on every feature
+    configuration, spreading the jobs over a process pool, and stores the silhouette,
+    Davies-Bouldin, Calinski-Harabasz and inertia of each fit in the clustering_results table.
+
+    Args:
+        db_path (str): Path to the SQLite database.
+        store (FeatureStore): Store with the document/entity vectors.
+        configurations (dict): Name -> feature blocks (defaults to CONFIGURATIONS).
+        n_clusters (list): Values of k for K-Means.
+        dbscan_grid (list): (eps, min_samples) pairs for DBSCAN.
+        workers (int): Number of worker processes (defaults to the number of cores).
+        silhouette_mode (str): 'exact' (bounded memory) or 'sampled' (estimate with a
+            confidence interval, for large corpora); see cluster_evaluation.
+
+    Returns:
+        pd.DataFrame: Results of the sweep, best silhouette first.
+    """
+    configurations = configurations or CONFIGURATIONS
+    matrices = FeatureMatrices(db_path, store)
+
+    # Every matrix is built once, before any job is sent
+    jobs = []
+    for configuration, blocks in configurations.items():
+        try:
+            matrix_name = matrices.build(configuration, blocks)
+        except KeyError as e:
+            print(f"Skipping configuration {configuration}: {e}")
+            continue
+        jobs += [(configuration, matrix_name, 'kmeans', {'n_clusters': k}) for k in n_clusters]
+        jobs += [(configuration, matrix_name, 'dbscan', {'eps': eps, 'min_samples': min_samples})
+                 for eps, min_samples in dbscan_grid]
+
+    run_id = uuid.uuid4().hex[:12]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_job, store.root, matrix_name, algorithm, params, silhouette_mode): configuration
+                   for configuration, matrix_name, algorithm, params in jobs}
+        for future in as_completed(futures):
+            try:
+                result = {'configuration': futures[future], **future.result()}
+            except Exception as e:
+                print(f"Error in a {futures[future]} job: {e}")
+                continue
+            results.append(result)
+            print(f"{result['configuration']} | {result['algorithm']} | n_clusters: {result.get('n_clusters')} | "
+                  f"Silhouette Score: {result.get('silhouette')} | Davies-Bouldin: {result.get('davies_bouldin')}")
+
+    save_results(storage.get_connection(db_path), run_id, results)
+    print(f"Stored {len(results)} results of sweep {run_id} in clustering_results.")
+    results = pd.DataFrame(results)
+    # No fit has a silhouette when every one of them found a single cluster
+    if 'silhouette' not in results:
+        return results
+    return results.sort_values('silhouette', ascending=False, na_position='last')
+
+if __name__ == "__main__":
+    results = run_sweep('data/processed/articles.db', FeatureStore('data/features'))
+    print(results.head(10))
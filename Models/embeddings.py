@@ -0,0 +1,166 @@
+import os
+import sys
+import numpy as np
+import tqdm
+from itertools import repeat
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scraping', 'src', 'pipelines'))
+import storage
+from feature_store import FeatureStore
+from stance import DocumentFrequency
+
+WORD2VEC_PATH = 'word2vec_news.model'
+
+# Entity vector features (as persons_vec, locations_vec and organizations_vec in the notebooks)
+ENTITY_FEATURES = {'persons_vec': 'PER', 'locations_vec': 'LOC', 'organizations_vec': 'ORG'}
+
+#Function to load the word vectors of a trained Word2Vec model (memory-mapped)
+def load_word_vectors(model_path=WORD2VEC_PATH):
+    from gensim.models import Word2Vec
+    return Word2Vec.load(model_path, mmap='r').wv
+
+#Function to map the words of many documents to vocabulary ids as a sparse count matrix
+def token_count_matrix(docs, key_to_index):
+    """
+    Builds the document x vocabulary matrix of word counts of a batch of documents.
+    Every word is looked up once in the vocabulary dict; words outside it are dropped.
+    Repeated words are kept as duplicated entries (call sum_duplicates() to merge them).
+
+    Args:
+        docs (iterable): Texts (split on whitespace) or lists of tokens.
+        key_to_index (dict): Word -> row of the vector matrix (wv.key_to_index).
+
+    Returns:
+        scipy.sparse.csr_matrix: float32 matrix of shape (len(docs), len(key_to_index)).
+    """
+    from scipy.sparse import csr_matrix
+
+    get = key_to_index.get
+    indptr, ids = [0], []
+    for doc in docs:
+        tokens = doc.split() if isinstance(doc, str) else doc
+        ids.extend(map(get, tokens, repeat(-1)))
+        indptr.append(len(ids))
+
+    ids = np.fromiter(ids, dtype=np.int32, count=len(ids))
+    # Drop the unknown words and shift the row boundaries accordingly
+    known = ids >= 0
+    indptr = np.concatenate(([0], np.cumsum(known)))[indptr]
+    # Repeated words stay as duplicated entries, which add up in products and sums
+    return csr_matrix((np.ones(indptr[-1], dtype=np.float32), ids[known], indptr),
+                      shape=(len(indptr) - 1, len(key_to_index)))
+
+#Function to average the rows of a vector matrix weighted by a sparse count matrix
+def weighted_mean(counts, vectors, idf=None):
+    """
+    Computes the (optionally TF-IDF weighted) mean of the word vectors of every document
+    as one sparse x dense product, with no per-word Python work.
+
+    Args:
+        counts (scipy.sparse.csr_matrix): Document x vocabulary counts (token_count_matrix).
+        vectors (np.ndarray): Vocabulary x dimension matrix (wv.vectors).
+        idf (np.ndarray): IDF of every vocabulary word (fit_idf), or None for a plain mean.
+
+    Returns:
+        np.ndarray: float32 matrix (documents, dimension); zeros for documents without known words.
+    """
+    if idf is not None:
+        counts = counts.copy()
+        counts.data *= idf[counts.indices]
+
+    totals = np.asarray(counts.sum(axis=1)).ravel()
+    means = np.asarray(counts @ vectors, dtype=np.float32)
+    means *= np.divide(1, totals, out=np.zeros_like(totals), where=totals > 0)[:, None]
+    return means
+
+#Function to get the document vectors of many texts
+def document_vectors(docs, wv, idf=None):
+    """
+    Averages the word vectors of every document. Without idf the result is the mean of
+    model.wv[word] over the known words, as get_article_vector in the notebooks.
+
+    Args:
+        docs (iterable): Texts or lists of tokens.
+        wv (KeyedVectors): Word vectors (model.wv).
+        idf (np.ndarray): IDF of every vocabulary word (fit_idf), or None for a plain mean.
+
+    Returns:
+        np.ndarray: float32 matrix (len(docs), vector_size).
+    """
+    return weighted_mean(token_count_matrix(docs, wv.key_to_index), wv.vectors, idf)
+
+#Function to fit the IDF of the vocabulary over batches of documents
+def fit_idf(batches, wv):
+    document_frequency = DocumentFrequency(len(wv.key_to_index))
+    for docs in batches:
+        document_frequency.partial_fit(idf_counts(token_count_matrix(docs, wv.key_to_index)))
+    return document_frequency.idf().astype(np.float32)
+
+#Function to merge the repeated words of a count matrix (one entry per document and word)
+def idf_counts(counts):
+    counts = counts.copy()
+    counts.sum_duplicates()
+    return counts
+
+#Function to store the document vectors of the cleaned articles in the feature store
+def embed_articles(db_path, wv, store, name='word2vec', column='clean_text', tfidf=False, batch_size=5000):
+    """
+    Streams a text column of the database and writes the document vectors of every
+    article to a float32 feature (one row per content id, in id order).
+
+    Args:
+        db_path (str): Path to the SQLite database.
+        wv (KeyedVectors): Word vectors (load_word_vectors).
+        store (FeatureStore): Destination store.
+        name (str): Feature name.
+        column (str): Text column (clean_text, lemma_text...).
+        tfidf (bool): Weight the words by their IDF over the column (one extra pass).
+        batch_size (int): Number of articles read at a time.
+    """
+    conn = storage.get_connection(db_path)
+    where = f'{column} IS NOT NULL'
+
+    def batches():
+        return storage.iter_batches([column], where=where, batch_size=batch_size, db=conn)
+
+    idf = fit_idf((df[column] for df in batches()), wv) if tfidf else None
+
+    ids = [row[0] for row in conn.execute(f'SELECT id FROM content WHERE {where} ORDER BY id')]
+    matrix = store.create(name, ids, wv.vector_size, np.float32)
+    row = 0
+    for df in tqdm.tqdm(batches(), desc="Embedding articles"):
+        matrix[row:row + len(df)] = document_vectors(df[column], wv, idf)
+        row += len(df)
+
+    matrix.flush()
+    print(f"Stored the {name} vectors of {row} articles in {store.root}")
+
+#Function to store the mean vector of the named entities of every article
+def embed_entities(db_path, wv, store, label, name, batch_size=5000):
+    """
+    Averages the word vectors of the (lowercased) words of the entities of a label found
+    in every cleaned article (entities table of the NER stage). The rows are the same as
+    in embed_articles; articles without entities get a zero vector.
+    """
+    conn = storage.get_connection(db_path)
+    ids = [row[0] for row in conn.execute('SELECT id FROM content WHERE clean_text IS NOT NULL ORDER BY id')]
+    entities = storage.read_frame('''
+        SELECT article_id AS id, group_concat(text, ' ') AS entities
+        FROM entities WHERE label = ? GROUP BY article_id
+    ''', (label,), db=conn).set_index('id')['entities'].reindex(ids).fillna('')
+
+    matrix = store.create(name, ids, wv.vector_size, np.float32)
+    for start in range(0, len(ids), batch_size):
+        docs = entities.iloc[start:start + batch_size].str.lower()
+        matrix[start:start + len(docs)] = document_vectors(docs, wv)
+    matrix.flush()
+    print(f"Stored the {name} vectors of {len(ids)} articles in {store.root}")
+
+if __name__ == "__main__":
+    from word2vec_training import train_word2vec
+    db_path = 'data/processed/articles.db'
+    model, model_dir = train_word2vec(db_path)  # Cached model, only retrained if the corpus changed
+    store = FeatureStore('data/features')
+    embed_articles(db_path, model.wv, store)
+    for name, label in ENTITY_FEATURES.items():
+        embed_entities(db_path, model.wv, store, label, name)
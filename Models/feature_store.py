@@ -0,0 +1,129 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scraping', 'src', 'pipelines'))
+import storage
+
+class FeatureStore:
+    def __init__(self, root='data/features'):
+        """
+        On-disk store of per-article matrices (token ids, embeddings...) keyed by content.id.
+
+        Every feature is kept as two .npy files in `root`: `<name>.npy` with the matrix
+        (one row per article) and `<name>.ids.npy` with the content ids of the rows, so
+        features can be memory-mapped and sliced without copying or re-parsing them.
+
+        Args:
+            root (str): Directory holding the .npy files.
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _paths(self, name):
+        return os.path.join(self.root, f"{name}.npy"), os.path.join(self.root, f"{name}.ids.npy")
+
+    def names(self):
+        """
+        Returns the names of the stored features.
+        """
+        return sorted(file[:-len('.ids.npy')] for file in os.listdir(self.root) if file.endswith('.ids.npy'))
+
+    def save(self, name, ids, matrix, dtype=np.float32):
+        """
+        Stores a matrix with one row per content id (replacing the feature if it exists).
+
+        Args:
+            name (str): Feature name (e.g. 'word2vec', 'persons_vec').
+            ids (array-like): Content ids of the rows.
+            matrix (array-like): 2D matrix, or a list/Series of 1D vectors of the same length.
+            dtype: Stored dtype (float32 for embeddings, int32 for token ids).
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        matrix = np.asarray(matrix)
+        if matrix.dtype == object or matrix.ndim == 1:
+            # Column of vectors (e.g. df["vector"]) or of scalars
+            matrix = np.vstack(list(matrix))
+        matrix = matrix.astype(dtype, copy=False)
+        if matrix.shape[0] != len(ids):
+            raise ValueError(f"{name}: {matrix.shape[0]} rows for {len(ids)} ids")
+
+        output = self.create(name, ids, matrix.shape[1], dtype)
+        output[:] = matrix
+        output.flush()
+        del output
+
+    def create(self, name, ids, width, dtype=np.float32):
+        """
+        Creates an empty feature and returns it as a writable memory map, so large
+        matrices (e.g. 1M x N) can be filled in chunks without holding them in memory.
+        """
+        matrix_path, ids_path = self._paths(name)
+        ids = np.asarray(ids, dtype=np.int64)
+        np.save(ids_path, ids)
+        return np.lib.format.open_memmap(matrix_path, mode='w+', dtype=dtype, shape=(len(ids), width))
+
+    def load(self, name, mmap_mode='r'):
+        """
+        Loads a feature. With the default mmap_mode the matrix is memory-mapped, so
+        nothing is read until rows are accessed.
+
+        Returns:
+            tuple: (ids, matrix).
+        """
+        matrix_path, ids_path = self._paths(name)
+        return np.load(ids_path), np.load(matrix_path, mmap_mode=mmap_mode)
+
+    def take(self, name, content_ids):
+        """
+        Returns the rows of the given content ids, in the given order.
+        """
+        ids, matrix = self.load(name)
+        order = np.argsort(ids)
+        positions = np.searchsorted(ids, content_ids, sorter=order)
+        positions = order[np.minimum(positions, len(ids) - 1)]
+        missing = ids[positions] != np.asarray(content_ids)
+        if missing.any():
+            raise KeyError(f"{name}: ids not stored {np.asarray(content_ids)[missing][:10].tolist()}")
+        return matrix[positions]
+
+#Function to export the token ids of the database as a fixed-width int32 matrix
+def export_token_ids(db_path, store, name='token_ids', width=512, pad_id=0, chunk_size=10000):
+    """
+    Copies content.token_ids (int32 BLOBs written by update_tokens_column) into the
+    feature store, padded or cut to `width` columns. Also stores the lengths as a
+    one-column feature `<name>_length`.
+
+    Args:
+        db_path (str): Path to the SQLite database.
+        store (FeatureStore): Destination store.
+        name (str): Feature name.
+        width (int): Number of columns (512 for BERT inputs).
+        pad_id (int): Id used for padding ([PAD] is 0 in the BERT vocabularies).
+        chunk_size (int): Number of rows read and written at a time.
+    """
+    conn = storage.get_connection(db_path)
+    ids = [row[0] for row in conn.execute('SELECT id FROM content WHERE token_ids IS NOT NULL ORDER BY id')]
+
+    matrix = store.create(name, ids, width, np.int32)
+    lengths = store.create(f"{name}_length", ids, 1, np.int32)
+    matrix[:] = pad_id
+
+    cursor = conn.execute('SELECT token_ids FROM content WHERE token_ids IS NOT NULL ORDER BY id')
+    row = 0
+    while True:
+        blobs = cursor.fetchmany(chunk_size)
+        if not blobs:
+            break
+        for (blob,) in blobs:
+            tokens = np.frombuffer(blob, dtype=np.int32)[:width]
+            matrix[row, :len(tokens)] = tokens
+            lengths[row, 0] = len(tokens)
+            row += 1
+
+    matrix.flush()
+    lengths.flush()
+    print(f"Exported the token ids of {len(ids)} articles to {store.root}")
+
+if __name__ == "__main__":
+    export_token_ids('data/processed/articles.db', FeatureStore('data/features'))
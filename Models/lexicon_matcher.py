@@ -0,0 +1,184 @@
+import os
+import re
+import json
+import numpy as np
+import pandas as pd
+from collections import Counter
+
+MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+LEXICONS_DIR = os.path.join(MODELS_DIR, 'lexicons')
+
+# Lexicon files are named <name>_v<version>.json (e.g. immigration_v1.json)
+LEXICON_FILE_PATTERN = re.compile(r'^(?P<name>.+)_v(?P<version>\d+)\.json$')
+
+# Key of the trie nodes that holds the entry ending at that node
+END = None
+
+class LexiconMatcher:
+    def __init__(self, categories, name=None, version=None):
+        """
+        Phrase matcher compiled into a token trie, so single-word and multi-word entries
+        ("derechos humanos", "marea migratoria") are found in one pass over the words of a text.
+
+        Texts are matched word by word (text.split()), so they should be normalized like the
+        entries: clean_text output (lowercase, no punctuation) works as is. When several entries
+        start at the same word the longest one wins and matching continues after it, so
+        "derechos humanos" counts once and is not also counted as "derechos".
+
+        Args:
+            categories (dict): Category name -> list of entries (e.g. {"pro_immigration": [...]}).
+            name (str): Name of the lexicon.
+            version (int): Version of the lexicon.
+        """
+        self.name = name
+        self.version = version
+        self.categories = list(categories)
+        self.entries = []          # Entry phrases, in column order of count_matrix
+        self.entry_category = []   # Category of each entry
+        self.trie = {}
+
+        for category, phrases in categories.items():
+            for phrase in phrases:
+                words = phrase.lower().split()
+                if not words:
+                    continue
+                node = self.trie
+                for word in words:
+                    node = node.setdefault(word, {})
+                if END in node:
+                    raise ValueError(f"Duplicated lexicon entry '{phrase}' ({self.entry_category[node[END]]} and {category})")
+                node[END] = len(self.entries)
+                self.entries.append(' '.join(words))
+                self.entry_category.append(category)
+
+        # Position of the category of every entry, used to sum the entry counts per category
+        self._category_index = np.array([self.categories.index(category) for category in self.entry_category], dtype=np.intp)
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Loads a matcher from a lexicon file ({"name", "version", "categories": {category: [entries]}}).
+        """
+        with open(path, 'r', encoding='utf-8') as file:
+            lexicon = json.load(file)
+        return cls(lexicon['categories'], name=lexicon.get('name'), version=lexicon.get('version'))
+
+    def match_ids(self, text):
+        """
+        Yields the index (in self.entries) of every lexicon hit of the text, in order.
+        """
+        trie = self.trie
+        words = text.split()
+        n_words = len(words)
+        i = 0
+        while i < n_words:
+            node = trie.get(words[i])
+            if node is None:
+                i += 1
+                continue
+            # Follow the trie as far as the text allows, remembering the longest entry seen
+            match, end = node.get(END), i + 1
+            j = i + 1
+            while j < n_words:
+                node = node.get(words[j])
+                if node is None:
+                    break
+                j += 1
+                if END in node:
+                    match, end = node[END], j
+            if match is None:
+                i += 1
+            else:
+                yield match
+                i = end
+
+    def count(self, text):
+        """
+        Returns the frequency of every lexicon entry found in the text.
+
+        Returns:
+            Counter: Entry phrase -> number of hits.
+        """
+        return Counter(self.entries[match] for match in self.match_ids(text))
+
+    def count_categories(self, text):
+        """
+        Returns the number of hits of every category in the text.
+
+        Returns:
+            dict: Category -> number of hits (0 for categories without hits).
+        """
+        counts = dict.fromkeys(self.categories, 0)
+        for match in self.match_ids(text):
+            counts[self.entry_category[match]] += 1
+        return counts
+
+    def count_batch(self, texts):
+        """
+        Returns count(text) for every text of a column (or any iterable of texts).
+        """
+        return [self.count(text) for text in texts]
+
+    def count_matrix(self, texts):
+        """
+        Builds the document x entry matrix of hit frequencies of a batch of texts, without
+        densifying it: memory is proportional to the number of distinct hits per text.
+
+        Args:
+            texts (iterable): Texts to match.
+
+        Returns:
+            scipy.sparse.csr_matrix: int32 matrix of shape (len(texts), len(self.entries)).
+        """
+        from scipy.sparse import csr_matrix
+
+        indptr, indices, data = [0], [], []
+        for text in texts:
+            counts = Counter(self.match_ids(text))
+            indices.extend(counts.keys())
+            data.extend(counts.values())
+            indptr.append(len(indices))
+        matrix = csr_matrix((np.array(data, dtype=np.int32), np.array(indices, dtype=np.int32), np.array(indptr)),
+                            shape=(len(indptr) - 1, len(self.entries)))
+        matrix.sort_indices()
+        return matrix
+
+    def count_frame(self, texts, index=None):
+        """
+        Counts the hits of every category for a column of texts.
+
+        Args:
+            texts (iterable): Texts to match (e.g. df["clean_text"]).
+            index: Index of the returned DataFrame (e.g. df.index).
+
+        Returns:
+            pd.DataFrame: One `<category>_count` column per category (e.g. pro_immigration_count).
+        """
+        matrix = self.count_matrix(texts)
+        counts = np.zeros((matrix.shape[0], len(self.categories)), dtype=np.int64)
+        for position in range(len(self.categories)):
+            counts[:, position] = np.asarray(matrix[:, self._category_index == position].sum(axis=1)).ravel()
+        return pd.DataFrame(counts, columns=[f"{category}_count" for category in self.categories], index=index)
+
+#Function to get the path of a lexicon file (latest version unless one is given)
+def lexicon_path(name='immigration', version=None, directory=LEXICONS_DIR):
+    if version is not None:
+        return os.path.join(directory, f"{name}_v{version}.json")
+
+    versions = []
+    for file in os.listdir(directory):
+        found = LEXICON_FILE_PATTERN.match(file)
+        if found and found.group('name') == name:
+            versions.append(int(found.group('version')))
+    if not versions:
+        raise FileNotFoundError(f"No lexicon '{name}' in {directory}")
+    return os.path.join(directory, f"{name}_v{max(versions)}.json")
+
+#Function to load a compiled matcher from the versioned lexicon files
+def load_matcher(name='immigration', version=None, directory=LEXICONS_DIR):
+    return LexiconMatcher.from_file(lexicon_path(name, version, directory))
+
+if __name__ == "__main__":
+    matcher = load_matcher()
+    print(f"Lexicon {matcher.name} v{matcher.version}: {len(matcher.entries)} entries")
+    print(matcher.count("crisis de los derechos humanos y de la seguridad social marea migratoria crisis"))
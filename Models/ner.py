@@ -0,0 +1,118 @@
+import os
+import sys
+import tqdm
+from functools import lru_cache
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scraping', 'src', 'pipelines'))
+import storage
+
+# Version of the NER stage: bump it when the model or the extraction changes
+NER_STAGE, NER_VERSION = 'ner', 1
+NER_MODEL = "es_core_news_sm"
+
+# spaCy labels of the Spanish models: persons, locations, organizations and miscellaneous
+NER_LABELS = ("PER", "LOC", "ORG", "MISC")
+
+# Load spaCy model with only the NER component running (only when first used)
+@lru_cache(maxsize=None)
+def get_ner_nlp():
+    import spacy
+    nlp = spacy.load(NER_MODEL)
+    # The NER of the trained pipelines has its own tok2vec, so everything else can be skipped
+    nlp.select_pipes(enable=["ner"])
+    return nlp
+
+#Function to extract the named entities of many texts with nlp.pipe
+def extract_entities(texts, batch_size=64, n_process=1):
+    """
+    Streams texts through nlp.pipe with only the NER component enabled, yielding the
+    entities of each text in input order.
+
+    Args:
+        texts (iterable): Raw texts (the original text finds more entities than clean_text,
+            which lost its capital letters and punctuation).
+        batch_size (int): Number of texts processed together by spaCy.
+        n_process (int): Number of spaCy worker processes.
+
+    Yields:
+        list: (label, text, start, end) of every entity, with character offsets.
+    """
+    nlp = get_ner_nlp()
+    for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process):
+        yield [(ent.label_, ent.text, ent.start_char, ent.end_char) for ent in doc.ents]
+
+#Function to rebuild the entity_counts table from the entities table
+def refresh_entity_counts(conn):
+    with conn:
+        conn.execute('DELETE FROM entity_counts')
+        conn.execute('''
+        INSERT INTO entity_counts (label, text, mentions, articles)
+        SELECT label, text, COUNT(*), COUNT(DISTINCT article_id)
+        FROM entities
+        GROUP BY label, text
+        ''')
+
+#Function to store the named entities of the new or changed articles
+def update_entities(conn, batch_size=64, n_process=1, full=False, read_batch_size=5000):
+    try:
+        # Articles whose text changed since their entities were extracted, read in batches
+        batches = storage.iter_stale_batches(NER_STAGE, NER_VERSION, ['text'], force=full,
+                                             batch_size=read_batch_size, db=conn)
+        total = mentions = 0
+        for df in batches:
+            ids = df['id'].tolist()
+            entities = extract_entities(df['text'].fillna(''), batch_size, n_process)
+
+            # Entities of a previous run of these articles are replaced
+            storage.write_batches('DELETE FROM entities WHERE article_id = ?', ((article_id,) for article_id in ids), conn)
+            rows = [(article_id, *entity)
+                    for doc_entities, article_id in zip(tqdm.tqdm(entities, total=len(df), desc="Extracting entities"), ids)
+                    for entity in doc_entities]
+            mentions += storage.write_batches('INSERT INTO entities (article_id, label, text, start, end) VALUES (?, ?, ?, ?, ?)',
+                                              rows, conn)
+            storage.mark_processed(NER_STAGE, NER_VERSION, df['id'], df['input_hash'], conn)
+            total += len(df)
+
+        if total:
+            refresh_entity_counts(conn)
+            print(f"Successfully stored {mentions} entities of {total} articles in the database.")
+        else:
+            print("No new or changed articles to extract entities from.")
+
+    except Exception as e:
+        print(f"Error updating entities: {e}")
+
+#Function to get the most mentioned entities of a label (as Counter.most_common)
+def top_entities(conn, label, n=10, newspaper=None):
+    """
+    Returns the n most mentioned entities of a label, e.g. top_entities(conn, "PER").
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        label (str): Entity label (see NER_LABELS).
+        n (int): Number of entities.
+        newspaper (str): Only count the articles of this newspaper.
+
+    Returns:
+        list: (entity, mentions) tuples, most mentioned first.
+    """
+    if newspaper is None:
+        query = 'SELECT text, mentions FROM entity_counts WHERE label = ? ORDER BY mentions DESC, text LIMIT ?'
+        return conn.execute(query, (label, n)).fetchall()
+
+    query = '''
+    SELECT entities.text, COUNT(*) AS mentions
+    FROM entities JOIN links ON entities.article_id = links.id
+    WHERE entities.label = ? AND links.newspaper = ?
+    GROUP BY entities.text
+    ORDER BY mentions DESC, entities.text
+    LIMIT ?
+    '''
+    return conn.execute(query, (label, newspaper, n)).fetchall()
+
+if __name__ == "__main__":
+    db_path = 'data/processed/articles.db'
+    conn = storage.get_connection(db_path)
+    update_entities(conn)
+    for label in ("PER", "LOC", "ORG"):
+        print(f"Most mentioned {label}:", top_entities(conn, label))
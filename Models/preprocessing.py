@@ -1,35 +1,56 @@
+import os
+import sys
 import sqlite3 as sql
 import pandas as pd
-import spacy
-import nltk
 import re
 import tqdm
-from nltk.corpus import stopwords
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 
-# Download and load stopwords
-nltk.download('stopwords')
-stop_words = set(stopwords.words('spanish'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scraping', 'src', 'pipelines'))
+import storage
 
-# Load spaCy model for lemmatization
-nlp = spacy.load("es_core_news_sm")
+# Load stopwords (only downloaded if they are not in the local nltk_data yet)
+@lru_cache(maxsize=None)
+def get_stop_words():
+    import nltk
+    from nltk.corpus import stopwords
+    try:
+        return frozenset(stopwords.words('spanish'))
+    except LookupError:
+        nltk.download('stopwords')
+        return frozenset(stopwords.words('spanish'))
+
+# Load spaCy model for lemmatization (only when first used)
+@lru_cache(maxsize=None)
+def get_nlp():
+    import spacy
+    return spacy.load("es_core_news_sm")
 
 #Function to connect to the database
 def connect_to_db(db_path):
     try:
-        conn = sql.connect(db_path)
+        conn = storage.get_connection(db_path)
         return conn
     except Exception as e:
         print(f"Error connecting to database: {e}")
         return None
  
-#Function to fetch the data from the database
-def fetch_text_data(conn):
+# Versions of the derived stages: bump them when their logic changes so every article is reprocessed
+CLEAN_STAGE, CLEAN_VERSION = 'clean', 1
+LEMMA_STAGE, LEMMA_VERSION = 'lemma', 1
+
+#Function to fetch the data from the database (only new or changed articles unless full=True)
+def fetch_text_data(conn, full=False):
     if conn is None:
         return pd.DataFrame()  # Return an empty DataFrame if connection failed
-    query = 'SELECT id, title, text FROM content'
-    df = pd.read_sql_query(query, conn)
+    df = storage.stale_rows(CLEAN_STAGE, CLEAN_VERSION, ['title', 'text'], force=full, db=conn)
     return df
 
+#Function to stream the data from the database in batches (only new or changed articles unless full=True)
+def fetch_text_batches(conn, full=False, batch_size=5000):
+    return storage.iter_stale_batches(CLEAN_STAGE, CLEAN_VERSION, ['title', 'text'], force=full, batch_size=batch_size, db=conn)
+
 #Function to clean text
 def clean_text(text):
     text = text.lower()  # Convert to lowercase
@@ -41,68 +62,138 @@ def clean_text(text):
 
 #Function to remove stopwords (optimized: stopwords loaded once)
 def remove_stopwords(text):
+    stop_words = get_stop_words()
+    return ' '.join([word for word in text.split() if word not in stop_words])
+
+# URLs, numbers and punctuation (accents kept) in a single compiled pass. Every
+# alternative starts on a different kind of character (h/w, digit, non-word), so
+# removing them together gives the same result as the four passes of clean_text.
+CLEAN_PATTERN = re.compile(r'http\S+|www.\S+|\d+|[^\w\sáéíóúüñ]')
+
+#Function to clean text and remove stopwords in one sweep (same output as remove_stopwords(clean_text(text)))
+def clean_and_filter(text):
+    stop_words = get_stop_words()
+    text = CLEAN_PATTERN.sub('', text.lower())
+    # split() also collapses and strips the whitespace
     return ' '.join([word for word in text.split() if word not in stop_words])
 
+#Function to clean a whole column (or any iterable) of texts
+def clean_texts(texts, workers=None, chunksize=500):
+    """
+    Batch version of clean_and_filter. Large inputs are split in chunks of `chunksize`
+    texts and cleaned by a pool of processes; the output keeps the input order.
+
+    Args:
+        texts (iterable): Texts to clean (e.g. a DataFrame column).
+        workers (int): Number of processes (defaults to the CPU count, 1 disables the pool).
+        chunksize (int): Number of texts sent to a process at a time.
+
+    Returns:
+        list: Cleaned texts.
+    """
+    texts = list(texts)
+    if workers == 1 or len(texts) <= chunksize:
+        return [clean_and_filter(text) for text in texts]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(tqdm.tqdm(executor.map(clean_and_filter, texts, chunksize=chunksize),
+                              total=len(texts), desc="Cleaning texts"))
+
+# Lemmatization only needs the tagger, morphologizer and lemmatizer
+LEMMA_DISABLED_PIPES = ["parser", "ner"]
+LEMMA_POS = {"NOUN", "ADJ", "VERB"}
+
+#Function to lemmatize a spaCy doc
+def doc_to_lemmas(doc):
+    return " ".join([token.lemma_ for token in doc if token.is_alpha and token.pos_ in LEMMA_POS])
+
 #Function for lemmatization
-#def lemmatize_text(text):
-#   doc = nlp(text)
-#  return " ".join([token.lemma_ for token in doc if token.is_alpha and token.pos_ in ["NOUN", "ADJ", "VERB"]])
+def lemmatize_text(text):
+    return next(lemmatize_texts([text]))
 
-#Function to add clean columns if they don’t exist
-def add_clean_columns(conn):
-    cursor = conn.cursor()
-    try:
-        cursor.execute('ALTER TABLE content ADD COLUMN clean_text TEXT')
-        cursor.execute('ALTER TABLE content ADD COLUMN clean_title TEXT')
-        conn.commit()
-        print("Columns added successfully.")
-    except sql.OperationalError:
-        print("Columns already exist.")
-
-#Function to update database efficiently
-def update_clean_columns(conn, df):
+#Function to lemmatize many texts with nlp.pipe
+def lemmatize_texts(texts, batch_size=64, n_process=1):
+    """
+    Streams texts through nlp.pipe with the parser and NER disabled, yielding the
+    lemmas (nouns, adjectives and verbs) of each text in input order.
+
+    Args:
+        texts (iterable): Texts to lemmatize.
+        batch_size (int): Number of texts processed together by spaCy.
+        n_process (int): Number of spaCy worker processes.
+
+    Yields:
+        str: Lemmatized text.
+    """
+    nlp = get_nlp()
+    for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process, disable=LEMMA_DISABLED_PIPES):
+        yield doc_to_lemmas(doc)
+
+#Function to update database efficiently (the clean columns are created by the storage migrations)
+def update_clean_columns(conn, df, workers=None):
     try:
-        add_clean_columns(conn)
-
-        cleaned_data = []
-        for _, row in tqdm.tqdm(df.iterrows(), total=len(df), desc="Processing articles"):
-            clean_text_value = clean_text(row['text'])
-            clean_title_value = clean_text(row['title'])
-            clean_text_value = remove_stopwords(clean_text_value)
-            clean_title_value = remove_stopwords(clean_title_value)
-            #clean_text_value = lemmatize_text(clean_text_value)
-            #clean_title_value = lemmatize_text(clean_title_value)
-            
-            cleaned_data.append((clean_text_value, clean_title_value, row['id']))
+        clean_text_values = clean_texts(df['text'], workers)
+        clean_title_values = clean_texts(df['title'], workers)
+
+        cleaned_data = zip(clean_text_values, clean_title_values, df['id'].tolist())
 
         # Bulk update for efficiency
-        cursor = conn.cursor()
-        cursor.executemany('''
+        storage.write_batches('''
         UPDATE content 
         SET clean_text = ?, clean_title = ? 
         WHERE id = ?
-        ''', cleaned_data)
+        ''', cleaned_data, conn)
+        storage.mark_processed(CLEAN_STAGE, CLEAN_VERSION, df['id'], df['input_hash'], conn)
 
-        conn.commit()
         print("Successfully updated clean columns in the database.")
 
     except Exception as e:
         print(f"Error updating clean columns: {e}")
 
+#Function to store the lemmatized clean text (the lemma_text column is created by the storage migrations)
+def update_lemma_column(conn, batch_size=64, n_process=None, full=False, read_batch_size=5000):
+    try:
+        # One spaCy process per core unless told otherwise
+        n_process = n_process or os.cpu_count() or 1
+        # Articles whose clean text changed since they were last lemmatized, read in batches
+        batches = storage.iter_stale_batches(LEMMA_STAGE, LEMMA_VERSION, ['clean_text'], upstream=CLEAN_STAGE,
+                                             force=full, batch_size=read_batch_size, db=conn)
+        total = 0
+        for df in batches:
+            lemmas = lemmatize_texts(df['clean_text'], batch_size, n_process)
+            lemma_data = zip(tqdm.tqdm(lemmas, total=len(df), desc="Lemmatizing articles"), df['id'].tolist())
+
+            # Written in batches while spaCy is still processing the next texts
+            storage.write_batches('UPDATE content SET lemma_text = ? WHERE id = ?', lemma_data, conn)
+            storage.mark_processed(LEMMA_STAGE, LEMMA_VERSION, df['id'], df['input_hash'], conn)
+            total += len(df)
+
+        if total:
+            print(f"Successfully updated lemma column of {total} articles in the database.")
+        else:
+            print("No new or changed articles to lemmatize.")
+
+    except Exception as e:
+        print(f"Error updating lemma column: {e}")
+
 #Main function
-def main(db_path):
+def main(db_path, lemmatize=False, full=False, batch_size=5000, n_process=None):
     conn = connect_to_db(db_path)
     if conn:
-        df = fetch_text_data(conn)
-        if not df.empty:
-            print('Data fetched from the database.')
-            pd.set_option('display.max_colwidth', None)
+        # Stream the new or changed articles, so memory does not grow with the corpus
+        total = 0
+        pd.set_option('display.max_colwidth', None)
+        for df in fetch_text_batches(conn, full, batch_size):
+            print(f'Data fetched from the database ({len(df)} new or changed articles).')
             update_clean_columns(conn, df)
-        else:
-            print("No data fetched from the database.")
+            total += len(df)
+        if not total:
+            print("No new or changed articles to clean.")
+        if lemmatize:
+            update_lemma_column(conn, n_process=n_process, full=full, read_batch_size=batch_size)
     else:
         print("Failed to connect to the database.")
 
 if __name__ == "__main__":
-    db_path = 'Code/data/processed/articles.db'
+    db_path = 'data/processed/articles.db'
     main(db_path)
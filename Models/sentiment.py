@@ -0,0 +1,142 @@
+import os
+import sys
+import tqdm
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scraping', 'src', 'pipelines'))
+import storage
+
+MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+POSITIVE_WORDS_PATH = os.path.join(MODELS_DIR, 'spanish_positive_words.txt')
+NEGATIVE_WORDS_PATH = os.path.join(MODELS_DIR, 'spanish_negative_words.txt')
+
+# Version of the sentiment stage: bump it when a scorer changes (the set of scorers is
+# part of the input of the stage, see stage_config)
+SENTIMENT_STAGE, SENTIMENT_VERSION = 'sentiment', 1
+
+# content column written by each scorer (created by the storage migrations)
+SCORER_COLUMNS = {
+    'vader': 'sentiment_score_vader',        # VADER compound score, -1 to 1
+    'lexicon': 'sentiment_lexicon',          # Spanish word lists, -1/0/1
+    'textblob': 'sentiment_score_textblob',  # TextBlob polarity, -1 to 1
+}
+DEFAULT_SCORERS = ('vader', 'lexicon')
+
+# Analyzers and lexicons of the current process, loaded once by init_worker
+_resources = {}
+
+#Function to load a lexicon (one word per line)
+def load_lexicon(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return frozenset(file.read().splitlines())
+
+#Function to load the resources of the scorers (runs once in every worker process)
+def init_worker(scorers, positive_path=POSITIVE_WORDS_PATH, negative_path=NEGATIVE_WORDS_PATH):
+    _resources.clear()
+    _resources['scorers'] = tuple(scorers)
+    if 'vader' in scorers:
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+        _resources['vader'] = SentimentIntensityAnalyzer()
+    if 'lexicon' in scorers:
+        _resources['positive'] = load_lexicon(positive_path)
+        _resources['negative'] = load_lexicon(negative_path)
+    if 'textblob' in scorers:
+        from textblob import TextBlob
+        _resources['textblob'] = TextBlob
+
+#Function to get the VADER sentiment score
+def vader_score(text):
+    return _resources['vader'].polarity_scores(text)['compound']  # Range: [-1, 1]
+
+#Function to get the lexicon sentiment (1 positive, -1 negative, 0 neutral)
+def lexicon_score(text):
+    positive_words = _resources['positive']
+    negative_words = _resources['negative']
+    words = text.split()
+    pos_count = sum(1 for word in words if word in positive_words)
+    neg_count = sum(1 for word in words if word in negative_words)
+
+    if pos_count > neg_count:
+        return 1
+    elif neg_count > pos_count:
+        return -1
+    else:
+        return 0
+
+#Function to get the TextBlob sentiment score
+def textblob_score(text):
+    return _resources['textblob'](text).sentiment.polarity  # -1 (negative) to +1 (positive)
+
+SCORERS = {
+    'vader': vader_score,
+    'lexicon': lexicon_score,
+    'textblob': textblob_score,
+}
+
+#Function to get the configuration of the sentiment stage for a set of scorers
+def stage_config(scorers):
+    # Part of the input hashes: running other scorers makes every article stale, so their columns are never left NULL
+    return ','.join(sorted(scorers))
+
+#Function to score a chunk of texts with every scorer
+def score_chunk(texts, scorers):
+    return [tuple(SCORERS[name](text) for name in scorers) for text in texts]
+
+#Function to score many texts
+def score_texts(texts, scorers=DEFAULT_SCORERS, executor=None, chunksize=500):
+    """
+    Scores texts with the given scorers. With an executor (see create_pool) the texts
+    are split in chunks scored by the worker processes; the output keeps the input order.
+
+    Args:
+        texts (iterable): Texts to score.
+        scorers (tuple): Names of the scorers (keys of SCORERS).
+        executor (ProcessPoolExecutor): Pool created by create_pool with the same scorers.
+        chunksize (int): Number of texts sent to a worker at a time.
+
+    Returns:
+        list: One tuple of scores per text, in the order of `scorers`.
+    """
+    texts = list(texts)
+    if executor is None:
+        if _resources.get('scorers') != tuple(scorers):
+            init_worker(scorers)
+        return score_chunk(texts, scorers)
+
+    chunks = [texts[i:i + chunksize] for i in range(0, len(texts), chunksize)]
+    scores = []
+    for chunk_scores in executor.map(score_chunk, chunks, repeat(scorers)):
+        scores.extend(chunk_scores)
+    return scores
+
+#Function to create the pool of scoring processes
+def create_pool(scorers=DEFAULT_SCORERS, workers=None):
+    # The lexicons and analyzers are loaded once per worker, not once per chunk
+    return ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(scorers,))
+
+#Function to store the sentiment scores of the new or changed articles
+def update_sentiment_columns(conn, scorers=DEFAULT_SCORERS, workers=None, full=False, batch_size=5000):
+    try:
+        columns = ', '.join(f'{SCORER_COLUMNS[name]} = ?' for name in scorers)
+        query = f'UPDATE content SET {columns} WHERE id = ?'
+
+        # Clean texts that changed since they were last scored (output of the 'clean' stage), read in batches
+        batches = storage.iter_stale_batches(SENTIMENT_STAGE, SENTIMENT_VERSION, ['clean_text'], upstream='clean',
+                                             force=full, batch_size=batch_size, config=stage_config(scorers), db=conn)
+        total = 0
+        with create_pool(scorers, workers) as executor:
+            for df in tqdm.tqdm(batches, desc="Scoring sentiment"):
+                scores = score_texts(df['clean_text'], scorers, executor)
+                storage.write_batches(query, (score + (article_id,) for score, article_id in zip(scores, df['id'].tolist())), conn)
+                storage.mark_processed(SENTIMENT_STAGE, SENTIMENT_VERSION, df['id'], df['input_hash'], conn)
+                total += len(df)
+
+        print(f"Successfully updated the sentiment of {total} articles in the database.")
+
+    except Exception as e:
+        print(f"Error updating sentiment columns: {e}")
+
+if __name__ == "__main__":
+    db_path = 'data/processed/articles.db'
+    update_sentiment_columns(storage.get_connection(db_path))
@@ -0,0 +1,214 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scraping', 'src', 'pipelines'))
+import storage
+from lexicon_matcher import load_matcher
+
+PRO_CATEGORY, ANTI_CATEGORY = 'pro_immigration', 'anti_immigration'
+STANCE_LABELS = ("PRO", "ANTI", "NEU")
+STANCE_MAPPING = {"PRO": 1, "ANTI": -1, "NEU": 0}
+
+# Version of the stance stage: bump it when the scoring changes (the lexicon is part of
+# the input of the stage, see stage_config)
+STANCE_STAGE, STANCE_VERSION = 'stance', 1
+
+class DocumentFrequency:
+    def __init__(self, n_terms):
+        """
+        Document frequencies of the lexicon entries, accumulated batch by batch so the
+        IDF of the whole corpus is fitted without holding it in memory.
+
+        Args:
+            n_terms (int): Number of entries of the lexicon (columns of the count matrices).
+        """
+        self.n_documents = 0
+        self.counts = np.zeros(n_terms, dtype=np.int64)
+
+    def partial_fit(self, counts):
+        """
+        Adds a batch of documents (sparse document x entry count matrix of LexiconMatcher.count_matrix).
+        """
+        self.n_documents += counts.shape[0]
+        # Column indices of the stored non-zeros: one per (document, entry) with hits
+        self.counts += np.bincount(counts.indices, minlength=len(self.counts))
+        return self
+
+    def idf(self, smooth_idf=True):
+        """
+        Returns the IDF of every entry, with the formula of sklearn's TfidfVectorizer:
+        ln((1 + n) / (1 + df)) + 1 when smooth_idf, ln(n / df) + 1 otherwise.
+        """
+        n_documents, counts = self.n_documents, self.counts.astype(np.float64)
+        if smooth_idf:
+            n_documents, counts = n_documents + 1, counts + 1
+        with np.errstate(divide='ignore'):
+            return np.log(n_documents / counts) + 1
+
+#Function to weight a sparse count matrix with the IDF (l2-normalized rows, as TfidfVectorizer)
+def tfidf_transform(counts, idf):
+    from sklearn.preprocessing import normalize
+    tfidf = counts.astype(np.float64)
+    tfidf.data *= idf[tfidf.indices]
+    return normalize(tfidf, norm='l2', copy=False)
+
+#Function to get the indicator vector of a lexicon category (1 for its entries, 0 otherwise)
+def category_vector(matcher, category):
+    return np.array([entry_category == category for entry_category in matcher.entry_category], dtype=np.float64)
+
+#Function to classify the stance of every article from its pro/anti scores
+def classify_stance(pro_scores, anti_scores):
+    pro_scores, anti_scores = np.asarray(pro_scores), np.asarray(anti_scores)
+    return np.select([pro_scores > anti_scores, anti_scores > pro_scores], STANCE_LABELS[:2], default=STANCE_LABELS[2])
+
+#Function to get the configuration of the stance stage for a lexicon
+def stage_config(matcher):
+    # Part of the input hashes: another lexicon (or version of it) rematches every article
+    return f"{matcher.name}:{matcher.version}"
+
+#Function to score the stance of a batch of texts
+def score_stance(texts, matcher, idf, index=None):
+    """
+    Computes the lexicon counts, the pro/anti TF-IDF scores and the stance of a batch of
+    texts. The TF-IDF matrix stays sparse: the category scores are sparse matrix-vector
+    products with the category indicator vectors, so memory grows with the number of hits
+    and not with articles x lexicon entries.
+
+    Args:
+        texts (iterable): Clean texts.
+        matcher (LexiconMatcher): Lexicon with the pro_immigration and anti_immigration categories.
+        idf (np.ndarray): IDF of the entries (DocumentFrequency.idf()).
+        index: Index of the returned DataFrame.
+
+    Returns:
+        pd.DataFrame: pro/anti_immigration_count, pro/anti_immigration_tfidf and stance_tfidf.
+    """
+    return score_counts(matcher.count_matrix(texts), matcher, idf, index)
+
+#Function to score the stance of a batch of lexicon count matrices (same output as score_stance)
+def score_counts(counts, matcher, idf, index=None):
+    tfidf = tfidf_transform(counts, idf)
+    pro_vector, anti_vector = category_vector(matcher, PRO_CATEGORY), category_vector(matcher, ANTI_CATEGORY)
+
+    pro_tfidf, anti_tfidf = tfidf @ pro_vector, tfidf @ anti_vector
+    return pd.DataFrame({
+        "pro_immigration_count": (counts @ pro_vector).astype(np.int64),
+        "anti_immigration_count": (counts @ anti_vector).astype(np.int64),
+        "pro_immigration_tfidf": pro_tfidf,
+        "anti_immigration_tfidf": anti_tfidf,
+        "stance_tfidf": classify_stance(pro_tfidf, anti_tfidf),
+    }, index=index)
+
+#Function to fit the document frequencies of the lexicon over the clean texts of the database
+def fit_document_frequency(conn, matcher, batch_size=5000):
+    document_frequency = DocumentFrequency(len(matcher.entries))
+    batches = storage.iter_batches(['clean_text'], where='clean_text IS NOT NULL', batch_size=batch_size, db=conn)
+    for df in tqdm.tqdm(batches, desc="Fitting lexicon IDF"):
+        document_frequency.partial_fit(matcher.count_matrix(df['clean_text']))
+    return document_frequency
+
+#Function to get the document frequencies of the lexicon from the stored counts of the stance stage
+def stored_document_frequency(conn, n_terms):
+    # Same result as fit_document_frequency once every cleaned article is matched: one
+    # stance_counts row per (article, entry) with hits
+    document_frequency = DocumentFrequency(n_terms)
+    document_frequency.n_documents = conn.execute('SELECT COUNT(*) FROM content WHERE clean_text IS NOT NULL').fetchone()[0]
+    for entry, frequency in conn.execute('SELECT entry, COUNT(*) FROM stance_counts GROUP BY entry'):
+        document_frequency.counts[entry] = frequency
+    return document_frequency
+
+#Function to read the stored lexicon counts of a batch of articles (sorted ids) as a count matrix
+def stored_counts(conn, ids, n_terms):
+    from scipy.sparse import csr_matrix
+
+    ids = pd.Index(ids)
+    # A range of ids instead of an IN list, so the batch size is not limited by the bound parameters
+    rows = storage.read_frame('SELECT content_id, entry, count FROM stance_counts WHERE content_id BETWEEN ? AND ?',
+                              (int(ids[0]), int(ids[-1])), db=conn)
+    rows = rows[rows['content_id'].isin(ids)]
+    counts = csr_matrix((rows['count'].to_numpy(dtype=np.int32), (ids.get_indexer(rows['content_id']), rows['entry'].to_numpy())),
+                        shape=(len(ids), n_terms))
+    counts.sort_indices()
+    return counts
+
+#Function to store the lexicon stance of the new or changed articles
+def update_stance_columns(conn, matcher=None, batch_size=5000, full=False):
+    """
+    Scores the lexicon stance of the cleaned articles incrementally:
+
+    1. Only the new or changed articles (derived_state) are matched against the lexicon.
+       Their hits are stored in stance_counts and their scores reset to NULL.
+    2. The IDF depends on the whole corpus, so it is refitted on every run, but from the
+       stored counts (one SQL aggregate) and not from the texts.
+    3. Only the articles with NULL scores and the ones with an entry whose IDF changed
+       since the last run (stance_idf) are rescored, from their stored counts.
+
+    The smoothed IDF depends on the number of articles, so a new article changes the weight
+    of every entry: the articles with lexicon hits are then rescored (without rereading
+    their text), and the ones without hits are not. Returns the number of rescored
+    articles (None if the scoring failed).
+    """
+    try:
+        matcher = matcher or load_matcher()
+        n_terms = len(matcher.entries)
+
+        batches = storage.iter_stale_batches(STANCE_STAGE, STANCE_VERSION, ['clean_text'], upstream='clean', force=full,
+                                             batch_size=batch_size, config=stage_config(matcher), db=conn)
+        matched = 0
+        for df in tqdm.tqdm(batches, desc="Matching lexicon"):
+            counts = matcher.count_matrix(df['clean_text'].fillna('')).tocoo()
+            ids = df['id'].to_numpy()
+            storage.write_batches('DELETE FROM stance_counts WHERE content_id = ?', ((int(i),) for i in ids), conn)
+            storage.write_batches('INSERT INTO stance_counts (content_id, entry, count) VALUES (?, ?, ?)',
+                                  zip(ids[counts.row].tolist(), counts.col.tolist(), counts.data.tolist()), conn)
+            # NULL scores are rescored below, even by a later run if this one stops before
+            storage.write_batches('''UPDATE content SET pro_immigration_count = NULL, anti_immigration_count = NULL,
+                                     pro_immigration_tfidf = NULL, anti_immigration_tfidf = NULL, stance_tfidf = NULL
+                                     WHERE id = ?''', ((int(i),) for i in ids), conn)
+            storage.mark_processed(STANCE_STAGE, STANCE_VERSION, df['id'], df['input_hash'], conn)
+            matched += len(df)
+
+        idf = stored_document_frequency(conn, n_terms).idf()
+        previous = dict(conn.execute('SELECT entry, idf FROM stance_idf'))
+        changed = [entry for entry, value in enumerate(idf.tolist()) if previous.get(entry) != value]
+
+        # Articles to rescore: the NULL ones (all with full) and the ones with a changed entry
+        with conn:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS stance_changed (entry INTEGER PRIMARY KEY)')
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS stance_rescore (id INTEGER PRIMARY KEY)')
+            conn.execute('DELETE FROM temp.stance_changed')
+            conn.execute('DELETE FROM temp.stance_rescore')
+            conn.executemany('INSERT INTO temp.stance_changed (entry) VALUES (?)', ((entry,) for entry in changed))
+            conn.execute('''INSERT OR IGNORE INTO temp.stance_rescore (id)
+                            SELECT id FROM content WHERE clean_text IS NOT NULL AND (? OR pro_immigration_tfidf IS NULL)''', (full,))
+            conn.execute('''INSERT OR IGNORE INTO temp.stance_rescore (id)
+                            SELECT DISTINCT content_id FROM stance_counts WHERE entry IN (SELECT entry FROM temp.stance_changed)''')
+
+        query = '''UPDATE content SET pro_immigration_count = ?, anti_immigration_count = ?,
+                   pro_immigration_tfidf = ?, anti_immigration_tfidf = ?, stance_tfidf = ? WHERE id = ?'''
+        batches = storage.iter_batches([], table='temp.stance_rescore', batch_size=batch_size, db=conn)
+        total = 0
+        for df in tqdm.tqdm(batches, desc="Scoring stance"):
+            scores = score_counts(stored_counts(conn, df['id'], n_terms), matcher, idf)
+            scores['id'] = df['id']
+            storage.write_batches(query, scores.itertuples(index=False, name=None), conn)
+            total += len(df)
+
+        # Saved last: if the scoring stops, the next run rescores the articles of the changed entries again
+        with conn:
+            conn.execute('DELETE FROM stance_idf')
+            conn.executemany('INSERT INTO stance_idf (entry, idf) VALUES (?, ?)', enumerate(idf.tolist()))
+
+        print(f"Successfully updated the stance of {total} articles ({matched} new or changed) "
+              f"with lexicon {matcher.name} v{matcher.version}.")
+        return total
+
+    except Exception as e:
+        print(f"Error updating stance columns: {e}")
+
+if __name__ == "__main__":
+    db_path = 'data/processed/articles.db'
+    update_stance_columns(storage.get_connection(db_path))
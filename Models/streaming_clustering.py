@@ -0,0 +1,265 @@
+import os
+import sys
+import json
+import numpy as np
+import tqdm
+from datetime import datetime, timezone
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scraping', 'src', 'pipelines'))
+import storage
+from feature_store import FeatureStore
+from clustering_sweep import DB_FEATURES, BIAS_FEATURES
+
+MODEL_DIR = 'data/models/clustering'
+CHUNK_SIZE = 10_000
+
+# Per-article features of the content table (name -> SQL expression). sentiment_stance is
+# the single feature of the 'stance' KMeans of the notebooks (sentiment + pro - anti stance)
+FEATURES = {
+    **DB_FEATURES,
+    'sentiment_stance': 'sentiment_score_vader + pro_immigration_tfidf - anti_immigration_tfidf',
+}
+
+# Bias clusterings of the notebooks: feature store blocks (document vectors), FEATURES,
+# number of clusters and whether the columns are min-max scaled (the bounds are saved
+# with the centroids). 'bias' is kmeans_bias (word2vec + bias scores + stance), the one
+# too wide to hold in memory for a large corpus.
+CLUSTER_MODELS = {
+    'bias': {'blocks': ['word2vec'], 'features': BIAS_FEATURES + ['stance_tfidf'], 'n_clusters': 2, 'scale': True},
+    'bias_only': {'blocks': [], 'features': BIAS_FEATURES, 'n_clusters': 2, 'scale': True},
+    'stance': {'blocks': [], 'features': ['sentiment_stance'], 'n_clusters': 2, 'scale': False},
+}
+
+class StreamingKMeans:
+    def __init__(self, n_clusters, scale=True, random_state=42):
+        """
+        K-Means fitted chunk by chunk with MiniBatchKMeans.partial_fit, so the feature
+        matrix (a memory-mapped feature of the FeatureStore) never has to be in memory.
+        The centroids and the scaling bounds are saved to a .npz file, and new articles
+        are assigned to the nearest saved centroid without refitting.
+
+        Args:
+            n_clusters (int): Number of clusters.
+            scale (bool): Min-max scale the features (bounds from the fitted data).
+            random_state (int): Seed of the initialization and of the chunk order.
+        """
+        self.n_clusters = n_clusters
+        self.scale = scale
+        self.random_state = random_state
+        self.centroids = None
+        self.low = self.high = None
+        self.n_seen = 0
+
+    def _scaled(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self.scale:
+            X = (X - self.low) / np.where(self.high > self.low, self.high - self.low, 1)
+        return X
+
+    def fit(self, matrix, chunk_size=CHUNK_SIZE, epochs=3, batch_size=1024, init_size=20_000):
+        """
+        Fits the centroids over a (possibly memory-mapped) matrix, one chunk at a time:
+        every chunk is read once per epoch and fed to partial_fit in shuffled mini-batches.
+        The chunks are visited in a different random order on every epoch. The centroids
+        start from a full-batch KMeans on a random sample of init_size rows, so the
+        result does not depend on the first mini-batch.
+        """
+        from sklearn.cluster import KMeans, MiniBatchKMeans
+
+        starts = np.arange(0, len(matrix), chunk_size)
+        if self.scale:
+            # Bounds of every column, accumulated over the chunks
+            self.low = np.min([np.min(matrix[start:start + chunk_size], axis=0) for start in starts], axis=0)
+            self.high = np.max([np.max(matrix[start:start + chunk_size], axis=0) for start in starts], axis=0)
+
+        rng = np.random.default_rng(self.random_state)
+        sample = np.sort(rng.choice(len(matrix), min(init_size, len(matrix)), replace=False))
+        init = KMeans(n_clusters=self.n_clusters, random_state=self.random_state).fit(self._scaled(matrix[sample]))
+
+        model = MiniBatchKMeans(n_clusters=self.n_clusters, init=init.cluster_centers_, n_init=1, random_state=self.random_state)
+        for _ in range(epochs):
+            for start in rng.permutation(starts):
+                chunk = self._scaled(matrix[start:start + chunk_size])[rng.permutation(min(chunk_size, len(matrix) - start))]
+                for batch in range(0, len(chunk), batch_size):
+                    model.partial_fit(chunk[batch:batch + batch_size])
+
+        self.centroids = model.cluster_centers_
+        self.n_seen = len(matrix)
+        return self
+
+    def predict(self, X):
+        """
+        Assigns rows to the nearest centroid.
+
+        Returns:
+            tuple: (labels, distances to the assigned centroid).
+        """
+        X = self._scaled(X)
+        distances = (np.einsum('ij,ij->i', X, X)[:, None] - 2 * X @ self.centroids.T
+                     + np.einsum('ij,ij->i', self.centroids, self.centroids)[None, :])
+        labels = distances.argmin(axis=1)
+        return labels, np.sqrt(np.maximum(distances[np.arange(len(X)), labels], 0))
+
+    def predict_chunked(self, matrix, chunk_size=CHUNK_SIZE):
+        labels = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), chunk_size):
+            labels[start:start + chunk_size] = self.predict(matrix[start:start + chunk_size])[0]
+        return labels
+
+    def save(self, path, **metadata):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, centroids=self.centroids,
+                 low=self.low if self.scale else np.empty(0), high=self.high if self.scale else np.empty(0),
+                 metadata=json.dumps({'n_clusters': self.n_clusters, 'scale': self.scale, 'n_seen': self.n_seen,
+                                      'random_state': self.random_state, **metadata}))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            metadata = json.loads(str(saved['metadata']))
+            model = cls(metadata['n_clusters'], metadata['scale'], metadata['random_state'])
+            model.centroids = saved['centroids']
+            if model.scale:
+                model.low, model.high = saved['low'], saved['high']
+        model.n_seen = metadata['n_seen']
+        model.metadata = metadata
+        return model
+
+#Function to get the path of a saved clustering model
+def model_path(name, model_dir=MODEL_DIR):
+    return os.path.join(model_dir, f"{name}.npz")
+
+#Function to get the SQL filter of the articles whose features are all computed
+def ready_condition(features):
+    # A NULL score (sentiment or stance not computed yet) makes its expression NULL
+    return ' AND '.join(['clean_text IS NOT NULL'] + [f'({FEATURES[feature]}) IS NOT NULL' for feature in features])
+
+#Function to keep the rows of a batch whose articles have vectors in every block
+def with_blocks(df, block_ids):
+    for ids in block_ids:
+        df = df[np.isin(df['id'].to_numpy(), ids)]
+    return df
+
+#Function to build the feature rows of a batch of articles (block vectors, then FEATURES)
+def feature_rows(store, blocks, features, df):
+    return np.hstack([store.take(block, df['id'].to_numpy()) for block in blocks] + [df[features].to_numpy()])
+
+#Function to copy per-article features into a feature of the store
+def export_features(db_path, store, name, features, blocks=(), batch_size=CHUNK_SIZE):
+    """
+    Streams the feature store blocks and the FEATURES expressions of the articles whose
+    scores are all computed into a float32 feature of the store. Articles without
+    vectors in a block (not embedded yet) are left out. Returns the content ids of the rows.
+    """
+    conn = storage.get_connection(db_path)
+    where = ready_condition(features)
+    block_ids = [store.load(block)[0] for block in blocks]
+    ids = with_blocks(storage.read_frame(f'SELECT id FROM content WHERE {where} ORDER BY id', db=conn), block_ids)['id'].to_numpy()
+    columns = [f'{FEATURES[feature]} AS {feature}' for feature in features]
+
+    width = sum(store.load(block)[1].shape[1] for block in blocks) + len(features)
+    matrix = store.create(name, ids, width, np.float32)
+    row = 0
+    for df in storage.iter_batches(columns, where=where, batch_size=batch_size, db=conn):
+        df = with_blocks(df, block_ids)
+        matrix[row:row + len(df)] = feature_rows(store, blocks, features, df)
+        row += len(df)
+    matrix.flush()
+    return ids
+
+#Function to store the cluster of some articles
+def save_assignments(conn, name, ids, labels, distances):
+    assigned_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    rows = zip(np.asarray(ids).tolist(), [name] * len(ids), labels.tolist(), distances.tolist(), [assigned_at] * len(ids))
+    return storage.write_batches('''
+        INSERT INTO cluster_assignments (content_id, model, label, distance, assigned_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(content_id, model) DO UPDATE SET
+            label = excluded.label,
+            distance = excluded.distance,
+            assigned_at = excluded.assigned_at
+    ''', rows, conn)
+
+#Function to fit a bias clustering out of core and assign every article
+def fit_model(db_path, store, name, model_dir=MODEL_DIR, chunk_size=CHUNK_SIZE, epochs=3):
+    """
+    Exports the features of a CLUSTER_MODELS entry to the feature store, fits the
+    centroids chunk by chunk, saves them and (re)assigns every article with all its scores.
+
+    Returns:
+        StreamingKMeans: The fitted model.
+    """
+    config = CLUSTER_MODELS[name]
+    feature_name = f"cluster_{name}"
+    ids = export_features(db_path, store, feature_name, config['features'], config['blocks'], chunk_size)
+    matrix = store.load(feature_name)[1]
+
+    model = StreamingKMeans(config['n_clusters'], config['scale']).fit(matrix, chunk_size, epochs)
+    model.save(model_path(name, model_dir), features=config['features'], blocks=config['blocks'])
+
+    conn = storage.get_connection(db_path)
+    # Assignments from the previous centroids are dropped, also those of articles no longer fitted
+    storage.execute('DELETE FROM cluster_assignments WHERE model = ?', (name,), conn)
+    for start in tqdm.tqdm(range(0, len(ids), chunk_size), desc=f"Assigning {name} clusters"):
+        labels, distances = model.predict(matrix[start:start + chunk_size])
+        save_assignments(conn, name, ids[start:start + chunk_size], labels, distances)
+
+    print(f"Fitted {name} on {len(ids)} articles and saved the centroids to {model_path(name, model_dir)}")
+    return model
+
+#Function to assign the articles that have no cluster yet to the saved centroids
+def assign_new(db_path, name, model_dir=MODEL_DIR, batch_size=CHUNK_SIZE, store=None):
+    """
+    Daily scoring: only the articles without an assignment for this model are read and
+    assigned to the nearest saved centroid, so the cost is O(new articles). Articles whose
+    scores (or block vectors) are not computed yet are left for a later run.
+    """
+    model = StreamingKMeans.load(model_path(name, model_dir))
+    features, blocks = model.metadata['features'], model.metadata.get('blocks', [])
+    store = store or FeatureStore('data/features')
+    block_ids = [store.load(block)[0] for block in blocks]
+    conn = storage.get_connection(db_path)
+
+    columns = [f'{FEATURES[feature]} AS {feature}' for feature in features]
+    where = ready_condition(features) + ''' AND NOT EXISTS (
+        SELECT 1 FROM cluster_assignments WHERE cluster_assignments.content_id = content.id AND cluster_assignments.model = ?)'''
+    total = 0
+    for df in storage.iter_batches(columns, where=where, params=(name,), batch_size=batch_size, db=conn):
+        df = with_blocks(df, block_ids)
+        if df.empty:
+            continue
+        labels, distances = model.predict(feature_rows(store, blocks, features, df))
+        total += save_assignments(conn, name, df['id'], labels, distances)
+
+    print(f"Assigned {total} new articles to the {name} clusters.")
+    return total
+
+#Function to compare the streaming clusters with full-batch KMeans on the same matrix
+def compare_with_full_batch(matrix, model, random_state=42):
+    """
+    Fits full-batch KMeans (as the notebooks) on the same scaled matrix and compares the
+    labels (adjusted Rand index, normalized mutual information) and the inertia.
+    """
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import adjusted_rand_score, normalized_mutual_info_score
+
+    X = model._scaled(matrix)
+    full = KMeans(n_clusters=model.n_clusters, random_state=random_state).fit(X)
+    streaming_labels = model.predict_chunked(matrix)
+    streaming_inertia = float(np.sum((X - model.centroids[streaming_labels]) ** 2))
+    return {
+        'adjusted_rand': float(adjusted_rand_score(full.labels_, streaming_labels)),
+        'normalized_mutual_info': float(normalized_mutual_info_score(full.labels_, streaming_labels)),
+        'full_batch_inertia': float(full.inertia_),
+        'streaming_inertia': streaming_inertia,
+    }
+
+if __name__ == "__main__":
+    db_path = 'data/processed/articles.db'
+    store = FeatureStore('data/features')
+    for name in CLUSTER_MODELS:
+        if os.path.exists(model_path(name)):
+            assign_new(db_path, name, store=store)
+        else:
+            model = fit_model(db_path, store, name)
+            print(f"{name} vs full-batch KMeans:", compare_with_full_batch(store.load(f"cluster_{name}")[1], model))
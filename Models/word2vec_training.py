@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scraping', 'src', 'pipelines'))
+import storage
+
+CACHE_DIR = 'data/models/word2vec'
+MODEL_FILE, VECTORS_FILE, PARAMS_FILE = 'word2vec.model', 'word2vec.kv', 'params.json'
+
+# Hyperparameters of the notebooks (seed fixed so the runs can be compared)
+WORD2VEC_PARAMS = {
+    'vector_size': 100,
+    'window': 5,
+    'min_count': 5,
+    'sg': 0,
+    'epochs': 5,
+    'seed': 42,
+}
+
+#Function to write a text column as a corpus file in LineSentence format (one article per line)
+def export_corpus(conn, path, column='clean_text', batch_size=5000):
+    """
+    Streams a text column of the database to a corpus file, one article per line, and
+    hashes it on the way. Word2Vec reads the file again on every epoch, so the articles
+    never have to be held in memory as lists of tokens.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        path (str): Destination file.
+        column (str): Text column (clean_text, lemma_text...).
+        batch_size (int): Number of articles read at a time.
+
+    Returns:
+        tuple: (sha256 of the corpus, number of articles written).
+    """
+    digest = hashlib.sha256()
+    written = 0
+    with open(path, 'w', encoding='utf-8') as file:
+        for df in storage.iter_batches([column], where=f"{column} IS NOT NULL AND {column} != ''",
+                                       batch_size=batch_size, db=conn):
+            lines = ''.join(f"{' '.join(text.split())}\n" for text in df[column])
+            file.write(lines)
+            digest.update(lines.encode('utf-8'))
+            written += len(df)
+    return digest.hexdigest(), written
+
+#Function to get the cache key of a corpus and a set of hyperparameters
+def cache_key(corpus_digest, params):
+    import gensim
+    key = json.dumps({'corpus': corpus_digest, 'params': params, 'gensim': gensim.__version__}, sort_keys=True)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+#Function to load a cached model (memory-mapped, so the vectors are shared and loaded lazily)
+def load_model(model_dir, mmap='r'):
+    from gensim.models import Word2Vec
+    return Word2Vec.load(os.path.join(model_dir, MODEL_FILE), mmap=mmap)
+
+#Function to load the cached word vectors of a model (memory-mapped)
+def load_word_vectors(model_dir, mmap='r'):
+    from gensim.models import KeyedVectors
+    return KeyedVectors.load(os.path.join(model_dir, VECTORS_FILE), mmap=mmap)
+
+#Function to train Word2Vec on a text column of the database, reusing the cached model if the corpus did not change
+def train_word2vec(db_path, column='clean_text', workers=None, cache_dir=CACHE_DIR, **params):
+    """
+    Trains (or loads from the cache) a Word2Vec model on a text column of the database.
+
+    The model is stored in `<cache_dir>/<key>/`, where the key hashes the corpus, the
+    hyperparameters and the gensim version, so it is only retrained when one of them
+    changes. Training reads the corpus file with `corpus_file`, which scales to all the
+    worker threads. Runs with the same seed are only bit-for-bit reproducible with workers=1.
+
+    Args:
+        db_path (str): Path to the SQLite database.
+        column (str): Text column to train on.
+        workers (int): Training threads (defaults to the number of cores).
+        cache_dir (str): Root of the model cache.
+        **params: Word2Vec hyperparameters overriding WORD2VEC_PARAMS.
+
+    Returns:
+        tuple: (memory-mapped Word2Vec model, directory of the cached model).
+    """
+    params = {**WORD2VEC_PARAMS, **params}
+    os.makedirs(cache_dir, exist_ok=True)
+    conn = storage.get_connection(db_path)
+
+    corpus_fd, corpus_path = tempfile.mkstemp(suffix='.txt', dir=cache_dir)
+    os.close(corpus_fd)
+    try:
+        corpus_digest, n_articles = export_corpus(conn, corpus_path, column)
+        model_dir = os.path.join(cache_dir, cache_key(corpus_digest, params))
+        if os.path.exists(os.path.join(model_dir, PARAMS_FILE)):
+            print(f"Corpus unchanged, reusing the Word2Vec model in {model_dir}")
+            return load_model(model_dir), model_dir
+
+        from gensim.models import Word2Vec
+        workers = workers or os.cpu_count() or 1
+        print(f"Training Word2Vec on {n_articles} articles with {workers} workers...")
+        model = Word2Vec(corpus_file=corpus_path, workers=workers, **params)
+
+        # Saved in a temporary directory first, so an interrupted run never leaves a half-written model in the cache
+        partial_dir = tempfile.mkdtemp(dir=cache_dir)
+        # sep_limit=0 stores every array as its own .npy file, so all of them can be memory-mapped
+        model.save(os.path.join(partial_dir, MODEL_FILE), sep_limit=0)
+        model.wv.save(os.path.join(partial_dir, VECTORS_FILE), sep_limit=0)
+        with open(os.path.join(partial_dir, PARAMS_FILE), 'w', encoding='utf-8') as file:
+            json.dump({'corpus': corpus_digest, 'articles': n_articles, 'column': column, 'params': params}, file, indent=4)
+        shutil.rmtree(model_dir, ignore_errors=True)
+        os.replace(partial_dir, model_dir)
+
+        print(f"Word2Vec model saved in {model_dir}")
+        return load_model(model_dir), model_dir
+    finally:
+        os.remove(corpus_path)
+
+if __name__ == "__main__":
+    model, model_dir = train_word2vec('data/processed/articles.db')
+    for word in ["inmigrante", "crisis"]:
+        if word in model.wv:
+            print(f"Words similar to '{word}':", model.wv.most_similar(word))
@@ -1,5 +1,6 @@
 import sqlite3
 import pandas as pd
+import storage
 import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
@@ -20,33 +21,64 @@ class DatabaseOutlierHandler:
 
     def _execute_query(self, query, params=None, fetch=False):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                if fetch:
-                    return pd.read_sql_query(query, conn)
-                
-                cursor = conn.cursor()
-                if params:
-                    cursor.execute(query, params)
-                else:
-                    cursor.execute(query)
-                conn.commit()
+            if fetch:
+                return storage.read_frame(query, params or (), self.db_path)
+
+            storage.execute(query, params or (), self.db_path)
         except sqlite3.Error as e:
             print(f"Database error: {e}")
             return None
 
-    def fetch_data(self):
+    def fetch_data(self, batch_size=5000):
         """
-        Fetch data from content and links tables.
+        Fetch data from content and links tables. The texts are streamed in batches and
+        reduced to their word_count and char_count, so only the metrics stay in memory.
+        
+        Args:
+            batch_size (int): Number of articles read at a time.
         
         Returns:
-            pd.DataFrame: DataFrame with joined data.
+            pd.DataFrame: DataFrame with joined data (id, publish_date, newspaper, word_count, char_count).
         """
-        query = f"""
-            SELECT content.id, content.text,content.publish_date, links.newspaper
-            FROM {self.content_table}
-            JOIN {self.links_table} ON {self.content_table}.id = {self.links_table}.id
+        try:
+            batches = storage.iter_batches(
+                [f"{self.content_table}.publish_date", f"{self.links_table}.newspaper", f"{self.content_table}.text"],
+                table=self.content_table,
+                joins=f"JOIN {self.links_table} ON {self.content_table}.id = {self.links_table}.id",
+                batch_size=batch_size,
+                db=self.db_path,
+            )
+            frames = [self.add_text_metrics(batch).drop(columns="text") for batch in batches]
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return None
+        
+        if not frames:
+            return pd.DataFrame(columns=["id", "publish_date", "newspaper", "word_count", "char_count"])
+        return pd.concat(frames, ignore_index=True)
+
+    def _delete_ids(self, conn, ids):
         """
-        return self._execute_query(query, fetch=True)
+        Delete articles from both tables. The ids are loaded into a temporary table and
+        removed with two set-based deletes, inside the caller's transaction.
+        
+        Returns:
+            int: Number of articles deleted from the content table.
+        """
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS ids_to_delete (id INTEGER PRIMARY KEY)')
+        conn.execute('DELETE FROM temp.ids_to_delete')
+        conn.executemany('INSERT OR IGNORE INTO temp.ids_to_delete (id) VALUES (?)', ((int(i),) for i in ids))
+        
+        deleted = conn.execute(f"""
+            DELETE FROM {self.content_table}
+            WHERE id IN (SELECT id FROM temp.ids_to_delete)
+        """).rowcount
+        conn.execute(f"""
+            DELETE FROM {self.links_table}
+            WHERE id IN (SELECT id FROM temp.ids_to_delete)
+        """)
+        conn.execute('DELETE FROM temp.ids_to_delete')
+        return deleted
 
     def remove_null_dates(self, df, column="publish_date"):
         """
@@ -65,27 +97,9 @@ class DatabaseOutlierHandler:
             print(f"Found {len(null_dates)} articles with null dates")
             
             if not null_dates.empty:
-                with sqlite3.connect(self.db_path) as conn:
-                    cursor = conn.cursor()
-                    
+                with storage.get_connection(self.db_path) as conn:
                     # Delete from both tables
-                    null_ids = tuple(null_dates['id'].tolist())
-                    
-                    # If only one ID, adjust the tuple syntax
-                    if len(null_ids) == 1:
-                        null_ids = f"({null_ids[0]})"
-                    
-                    cursor.execute(f"""
-                        DELETE FROM {self.content_table}
-                        WHERE id IN {null_ids}
-                    """)
-                    
-                    cursor.execute(f"""
-                        DELETE FROM {self.links_table}
-                        WHERE id IN {null_ids}
-                    """)
-                    
-                    conn.commit()
+                    self._delete_ids(conn, null_dates['id'])
                     print(f"Removed {len(null_dates)} articles with null dates from database")
             
             # Remove null dates from DataFrame
@@ -96,6 +110,33 @@ class DatabaseOutlierHandler:
             print(f"Error removing null dates: {e}")
             return df
 
+    @staticmethod
+    def format_dates(dates):
+        """
+        Format dates as YYYY-MM-DD. ISO dates (as scraped by newspaper3k) are cut to
+        their date part, which is what pd.to_datetime(...).strftime('%Y-%m-%d') gives for
+        them; any other format is parsed value by value. Date parts that are not real
+        dates (e.g. 2024-13-45) are nulled, as pd.to_datetime(errors='coerce') does.
+        
+        Args:
+            dates (pd.Series): Non-null dates.
+            
+        Returns:
+            pd.Series: Formatted dates (None for the invalid ones).
+        """
+        dates = dates.astype(str)
+        formatted = dates.str.slice(0, 10)
+        
+        iso = dates.str.match(r'\d{4}-\d{2}-\d{2}')
+        # Validated on the sliced strings, still vectorized
+        valid = pd.to_datetime(formatted.where(iso), format='%Y-%m-%d', errors='coerce').notna()
+        formatted[iso & ~valid] = None
+        
+        other = ~iso
+        if other.any():
+            formatted[other] = dates[other].map(lambda date: pd.to_datetime(date).strftime('%Y-%m-%d'))
+        return formatted
+
     def format_time(self, df, column="publish_date"):
         """
         Format timestamp column after removing null dates.
@@ -110,32 +151,47 @@ class DatabaseOutlierHandler:
         # First remove null dates
         df = self.remove_null_dates(df, column)
         
-        
+        formatted = self.format_dates(df[column])
+        changed = formatted != df[column]
         
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                for idx, row in df.iterrows():
-                    formatted_date = pd.to_datetime(row[column]).strftime('%Y-%m-%d')
-                    cursor.execute(f'''
-                        UPDATE {self.content_table}
-                        SET {column} = ?
-                        WHERE id = ?
-                    ''', (formatted_date, row['id']))
-                    
-                conn.commit()
+            with storage.get_connection(self.db_path) as conn:
+                # Only the dates that change are written (invalid ones as NULL), in a single transaction
+                conn.executemany(f'''
+                    UPDATE {self.content_table}
+                    SET {column} = ?
+                    WHERE id = ?
+                ''', zip(formatted[changed].astype(object).where(formatted[changed].notna(), None).tolist(),
+                         df.loc[changed, 'id'].tolist()))
                 print(f'Successfully updated {column} format in database')
                 
         except sqlite3.Error as e:
             print(f"Error updating dates in database: {e}")
         
+        df = df.assign(**{column: formatted})
         print('DATE ADJUSTED')
         print(df[column].head())
         return df
+
+    @staticmethod
+    def add_text_metrics(df, column="text"):
+        """
+        Add the word_count and char_count columns.
+        
+        Args:
+            df (pd.DataFrame): Input DataFrame
+            column (str): Name of the text column
+            
+        Returns:
+            pd.DataFrame: DataFrame with the metrics
+        """
+        # str.split runs in C; pandas' .str.split/.str.count are slower than this loop
+        df["word_count"] = [len(text.split()) for text in df[column].tolist()]
+        df["char_count"] = df[column].str.len()
+        return df
         
     
-    def detect_outliers(self, df, column='word_count', threshold=1.5):
+    def detect_outliers(self, df, column='word_count', threshold=1.5, by=None):
         """
         Detect outliers using Interquartile Range (IQR) method.
         
@@ -143,6 +199,8 @@ class DatabaseOutlierHandler:
             df (pd.DataFrame): Input DataFrame.
             column (str): Column to check for outliers.
             threshold (float): IQR multiplier for outlier detection.
+            by (str): Compute the bounds per group of this column (e.g. 'newspaper'),
+                as get_outlier_bounds does in the pre-cleaning visualizations.
         
         Returns:
             pd.DataFrame: DataFrame with outlier information.
@@ -152,9 +210,14 @@ class DatabaseOutlierHandler:
         print(df.groupby('newspaper')[column].count())
         print("\n******\n")
 
-        # Calculate IQR and bounds
-        q1 = df[column].quantile(0.25)
-        q3 = df[column].quantile(0.75)
+        # Calculate IQR and bounds (one value, or one per row with the bounds of its group)
+        if by:
+            grouped = df.groupby(by)[column]
+            q1 = grouped.transform('quantile', 0.25)
+            q3 = grouped.transform('quantile', 0.75)
+        else:
+            q1 = df[column].quantile(0.25)
+            q3 = df[column].quantile(0.75)
         iqr = q3 - q1
         lower_bound = q1 - threshold * iqr
         upper_bound = q3 + threshold * iqr
@@ -169,34 +232,16 @@ class DatabaseOutlierHandler:
         return df
 
     def remove_outliers(self, df):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Check if the column already exists
-            cursor.execute(f"PRAGMA table_info({self.content_table})")
-            columns = [info[1] for info in cursor.fetchall()]
-            
-            if "outlier" not in columns:
-                # Add the outlier column if it doesn't exist
-                cursor.execute(f"ALTER TABLE {self.content_table} ADD COLUMN outlier INTEGER")
+        # The outlier, word_count and char_count columns are created by the storage migrations
+        with storage.get_connection(self.db_path) as conn:
+            # Store the flags and metrics of every article in a single executemany
+            update_query = f"UPDATE {self.content_table} SET outlier = ?, word_count = ?, char_count = ? WHERE id = ?"
+            update_data = zip(df["outlier"].astype(int).tolist(), df["word_count"].tolist(),
+                              df["char_count"].tolist(), df["id"].tolist())
+            conn.executemany(update_query, update_data)
             
-            # Update the outlier column based on the DataFrame
-            update_query = f"UPDATE {self.content_table} SET outlier = ? WHERE id = ?"
-            update_data = df[["outlier", "id"]].values.tolist()
-            cursor.executemany(update_query, update_data)
-            
-            # Delete rows where outlier is 1
-            delete_content_query = f"DELETE FROM {self.content_table} WHERE outlier = 1"
-            delete_links_query = f"DELETE FROM {self.links_table} WHERE id IN (SELECT id FROM {self.content_table} WHERE outlier = 1)"
-            
-            # Execute delete queries
-            cursor.execute(delete_content_query)
-            cursor.execute(delete_links_query)
-            
-            # Get number of rows deleted
-            rows_deleted = cursor.rowcount
-            
-            conn.commit()
+            # Delete the outliers from both tables
+            rows_deleted = self._delete_ids(conn, df.loc[df["outlier"], "id"])
         
             print(f"Outliers removed from the '{self.content_table}' and '{self.links_table}' tables.")
             return rows_deleted
@@ -314,27 +359,23 @@ class DatabaseOutlierHandler:
             plt.tight_layout()
             plt.savefig('Scraping/src/visualizations/After_Cleaning/outliers_boxplot_after_delete.png')
 
-def main(db_path, content_table, links_table, remove_outliers=True):
+def main(db_path, content_table, links_table, remove_outliers=True, per_newspaper=False):
     # Initialize handler
     handler = DatabaseOutlierHandler(db_path, content_table, links_table)
 
-    # Fetch data
+    # Fetch data (with the word_count and char_count metrics)
     df = handler.fetch_data()
     
     # Format time column
     df = handler.format_time(df, column="publish_date")
 
-    # Add derived metrics
-    df["word_count"] = df["text"].apply(lambda x: len(x.split()))
-    df["char_count"] = df["text"].apply(len)
-
-    # Detect outliers
-    df_with_outliers = handler.detect_outliers(df, column="word_count")
+    # Detect outliers (with IQR bounds per newspaper if specified)
+    df_with_outliers = handler.detect_outliers(df, column="word_count", by="newspaper" if per_newspaper else None)
 
     # Optional: Print outliers
     print("\nOutliers detected:")
     outliers = df_with_outliers[df_with_outliers["outlier"]]
-    print(outliers[["id", "text", "word_count", "char_count"]])
+    print(outliers[["id", "newspaper", "word_count", "char_count"]])
     print(f"Total outliers: {len(outliers)}")
     
     # Visualize outliers
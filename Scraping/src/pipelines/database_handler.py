@@ -1,90 +1,79 @@
 import sqlite3
 import pandas as pd
-import os
+from itertools import islice
+import storage
+
+# Content is upserted so reloading a CSV updates the articles instead of rebuilding the table
+UPSERT_CONTENT = '''
+    INSERT INTO content (id, title, publish_date, text)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        title = excluded.title,
+        publish_date = excluded.publish_date,
+        text = excluded.text
+'''
 
 # Create the database and tables
-def initialize_database(db_path='data/processed/articles.db'):
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Create `links` table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS links (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        newspaper TEXT NOT NULL,
-        url TEXT UNIQUE NOT NULL
-    )
-    ''')
-
-
-    # Create `content` table
-    cursor.execute('''
-    DROP TABLE IF EXISTS content;
-    
-    ''')
-    cursor.execute('''
-    CREATE TABLE content (
-        id INTEGER PRIMARY KEY, -- Same as links.id
-        title TEXT,
-        publish_date TEXT,
-        text TEXT,
-        FOREIGN KEY (id) REFERENCES links (id) ON DELETE CASCADE
-    );
-    ''')
-    
-
-    conn.commit()
-    conn.close()
+def initialize_database(db_path='data/processed/articles.db', reset_content=False):
+    # The schema (links, content and the derived columns) is owned by the storage migrations
+    conn = storage.get_connection(db_path)
+
+    # Drop `content` only when a full rebuild is requested, then recreate it
+    if reset_content:
+        with conn:
+            # DROP TABLE does not fire the DELETE triggers: the per-article rows of the derived
+            # stages are removed in the same transaction, or the reloaded articles would look processed
+            for table in ('derived_state', 'entities', 'entity_counts', 'cluster_assignments', 'stance_counts', 'stance_idf'):
+                conn.execute(f'DELETE FROM {table}')
+            conn.execute('DROP TABLE IF EXISTS content')
+        storage.migrate(conn, from_version=0)
+
     print("Database initialized.")
 
+# Replace NaN values with None so they are stored as NULL
+def to_records(df):
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
 # Insert links into the database
 def insert_links(csv_file, db_path='data/processed/articles.db'):
     df = pd.read_csv(csv_file)
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    conn = storage.get_connection(db_path)
 
-    for _, row in df.iterrows():
-        try:
-            cursor.execute('''
+    try:
+        with conn:
+            conn.executemany('''
             INSERT OR IGNORE INTO links (newspaper, url)
             VALUES (?, ?)
-            ''', (row['Newspaper'], row['Link']))
-        except sqlite3.Error as e:
-            print(f"Error inserting link: {row['Link']}, {e}")
+            ''', to_records(df[['Newspaper', 'Link']]))
+    except sqlite3.Error as e:
+        print(f"Error inserting links: {e}")
 
-    conn.commit()
-    conn.close()
     print("Inserted links into the database.")
 
 def insert_content(csv_file, db_path='data/processed/articles.db'):
     """
-    Inserts article content from the CSV file into the `content` table.
+    Upserts article content from the CSV file into the `content` table.
+    URL ids are resolved with a single query and all rows are written with one
+    executemany inside a single transaction.
     """
     df = pd.read_csv(csv_file, sep=';')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    for _, row in df.iterrows():
-        try:
-            # Get the `id` from the `links` table for the current URL
-            cursor.execute('SELECT id FROM links WHERE url = ?', (row['URL'],))
-            url_id = cursor.fetchone()
-            
-            if url_id is None:
-                print(f"URL not found in links table: {row['URL']}")
-                continue
-
-            # Insert into the content table using the same `id`
-            cursor.execute('''
-                INSERT OR IGNORE INTO content (id, title, publish_date, text)
-                VALUES (?, ?, ?, ?)
-            ''', (url_id[0], row['Title'], row['Date'], row['Text']))
-        except sqlite3.Error as e:
-            print(f"Error inserting content for URL: {row['URL']}, {e}")
-
-    conn.commit()
-    conn.close()
+    conn = storage.get_connection(db_path)
+
+    # Resolve URL -> id for every article at once
+    url_ids = dict(conn.execute('SELECT url, id FROM links'))
+    df['id'] = df['URL'].map(url_ids)
+
+    for url in df.loc[df['id'].isna(), 'URL']:
+        print(f"URL not found in links table: {url}")
+    df = df.dropna(subset=['id'])
+    df['id'] = df['id'].astype(int)
+
+    try:
+        with conn:
+            conn.executemany(UPSERT_CONTENT, to_records(df[['id', 'Title', 'Date', 'Text']]))
+    except sqlite3.Error as e:
+        print(f"Error inserting content: {e}")
+
     print("Inserted content into the database.")
 
 # Populate the database
@@ -93,6 +82,79 @@ def populate_database(links_csv, content_csv, db_path='data/processed/articles.d
     insert_links(links_csv, db_path)
     insert_content(content_csv, db_path)
 
+# Split an iterable into lists of at most `size` items
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+# URLs that already have content in the database
+def scraped_urls(db_path='data/processed/articles.db'):
+    conn = storage.get_connection(db_path)
+    return {row[0] for row in conn.execute('SELECT links.url FROM links JOIN content ON content.id = links.id')}
+
+def insert_links_stream(links, db_path='data/processed/articles.db', batch_size=500):
+    """
+    Inserts (newspaper, url) pairs into the `links` table, one transaction per batch.
+    """
+    conn = storage.get_connection(db_path)
+    for batch in chunked(links, batch_size):
+        with conn:
+            conn.executemany('''
+            INSERT OR IGNORE INTO links (newspaper, url)
+            VALUES (?, ?)
+            ''', batch)
+    print("Inserted links into the database.")
+
+def insert_articles_stream(articles, db_path='data/processed/articles.db', batch_size=200, export_csv=None):
+    """
+    Consumes a stream of scraped articles (dicts with the all_content.csv columns, the
+    ID aside) and writes them to the `links` and `content` tables in batched transactions.
+    The exported ID of every article is its `links.id`.
+
+    Args:
+        articles (iterable): Articles, e.g. from content_scraper.iter_scraped_articles.
+        db_path (str): Path to the SQLite database.
+        batch_size (int): Number of articles written per transaction.
+        export_csv (str): Optional path of an all_content.csv export written along the way.
+
+    Returns:
+        int: Number of articles written.
+    """
+    conn = storage.get_connection(db_path)
+    total = 0
+
+    for batch in chunked(articles, batch_size):
+        urls = [article['URL'] for article in batch]
+        with conn:
+            conn.executemany('''
+            INSERT OR IGNORE INTO links (newspaper, url)
+            VALUES (?, ?)
+            ''', [(article['Newspaper'], article['URL']) for article in batch])
+
+            placeholders = ','.join('?' * len(urls))
+            url_ids = dict(conn.execute(f'SELECT url, id FROM links WHERE url IN ({placeholders})', urls))
+
+            conn.executemany(UPSERT_CONTENT, [(url_ids[article['URL']], article['Title'], article['Date'], article['Text']) for article in batch])
+
+        # The ID of every article is the one of its link in the database
+        batch = [{'ID': url_ids[article['URL']], **article} for article in batch]
+
+        if export_csv:
+            # First chunk writes the header (and the BOM), the rest are appended
+            first = total == 0
+            pd.DataFrame(batch).to_csv(export_csv, index=False, sep=";", header=first,
+                                       mode="w" if first else "a",
+                                       encoding="utf-8-sig" if first else "utf-8")
+
+        total += len(batch)
+        print(f"Stored {total} articles in the database.")
+
+    return total
+
 # Main execution
 if __name__ == "__main__":
     links_csv_path = "data/all_links.csv"
@@ -3,36 +3,54 @@ import sqlite3 as sql
 import matplotlib.pyplot as plt
 from wordcloud import WordCloud
 import numpy as np
+import storage
 
 
-def fetch_data(db_path):
-    conn = sql.connect(db_path)
-    query = 'SELECT * FROM content'
-    df = pd.read_sql_query(query, conn)
-    return df
+# Keyword searched in the texts for each mentions column
+KEYWORDS = {
+    "mentions_inmigracion": "inmigrantes",
+    "mentions_refugiados": "refugiados",
+    "mentions_asilo": "asilo",
+    "mentions_racismo": "racismo",
+}
 
+# Columns summarized by info (everything but the texts)
+SUMMARY_COLUMNS = ['publish_date', 'outlier', 'word_count', 'char_count', 'token_count']
 
-def info(df):
-    # Resumen de la base de datos
-    print(df.info())
 
-    # Estadísticas descriptivas de las columnas numéricas
-    print(df.describe())
+def fetch_data(db_path, columns=('publish_date', 'text'), batch_size=5000):
+    # Stream only the needed columns, batch by batch
+    return storage.iter_batches(list(columns), db=db_path, batch_size=batch_size)
+
+
+def count_mentions(batches):
+    # Mentions of each keyword per year, accumulated batch by batch
+    counts = []
+    for df in batches:
+        # Ensure 'publish_date' is in datetime format and extract the year
+        df["year"] = pd.to_datetime(df["publish_date"]).dt.year
+
+        # Create separate columns for each keyword
+        for column, keyword in KEYWORDS.items():
+            df[column] = df["text"].str.contains(keyword, case=False).astype(int)
 
+        # Group by year and sum mentions
+        counts.append(df.groupby("year")[list(KEYWORDS)].sum())
 
-    # Ensure 'publish_date' is in datetime format
-    df["publish_date"] = pd.to_datetime(df["publish_date"])
+    if not counts:
+        return pd.DataFrame(columns=list(KEYWORDS))
+    return pd.concat(counts).groupby(level=0).sum()
 
-    # Extract the year from 'publish_date'
-    df["year"] = df["publish_date"].dt.year
 
-    # Create separate columns for each keyword
-    df["mentions_inmigracion"] = df["text"].str.contains("inmigrantes", case=False).astype(int)
-    df["mentions_refugiados"] = df["text"].str.contains("refugiados", case=False).astype(int)
-    df["mentions_asilo"] = df["text"].str.contains("asilo", case=False).astype(int)
-    df["mentions_racismo"] = df["text"].str.contains("racismo", case=False).astype(int)
-    # Group by year and sum mentions
-    mentions_per_year = df.groupby("year")[["mentions_inmigracion", "mentions_refugiados", "mentions_asilo","mentions_racismo"]].sum()
+def info(db_path):
+    # Resumen de la base de datos (sin los textos)
+    df = pd.concat(fetch_data(db_path, SUMMARY_COLUMNS), ignore_index=True)
+    print(df.info())
+
+    # Estadísticas descriptivas de las columnas numéricas
+    print(df.describe())
+
+    mentions_per_year = count_mentions(fetch_data(db_path))
 
     # Plot multiple lines for each keyword
     plt.figure(figsize=(15, 5))
@@ -57,8 +75,7 @@ def info(df):
 
 
 def main(db_path):
-    df = fetch_data(db_path)
-    info(df)
+    info(db_path)
 
     
 
@@ -1,61 +1,116 @@
 import sqlite3 as sql
 import pandas as pd
-from transformers import BertModel,BertTokenizer
-import torch
-import matplotlib.pyplot as plt
-from wordcloud import WordCloud
 import numpy as np
 import tqdm as tqdm
+from functools import lru_cache
+from itertools import islice
+import storage
 
-# Initialize the BERT tokenizer
-tokenizer = BertTokenizer.from_pretrained('bert-base-multilingual-cased')
+BERT_MODEL = 'bert-base-multilingual-cased'
+
+# Initialize the BERT tokenizer (only when first used, from the local cache if it is there)
+@lru_cache(maxsize=None)
+def get_tokenizer():
+    from transformers import BertTokenizer
+    try:
+        return BertTokenizer.from_pretrained(BERT_MODEL, local_files_only=True)
+    except OSError:
+        return BertTokenizer.from_pretrained(BERT_MODEL)
+
+# Rust-backed tokenizer used by the batched tokenization stage
+@lru_cache(maxsize=None)
+def get_fast_tokenizer():
+    from transformers import BertTokenizerFast
+    try:
+        return BertTokenizerFast.from_pretrained(BERT_MODEL, local_files_only=True)
+    except OSError:
+        return BertTokenizerFast.from_pretrained(BERT_MODEL)
+
+# Token ids are stored as int32 BLOBs
+def encode_token_ids(ids):
+    return np.asarray(ids, dtype=np.int32).tobytes()
+
+def decode_token_ids(blob):
+    return np.frombuffer(blob, dtype=np.int32)
+
+# Tokenize a batch of texts in a single pass
+def tokenize_batch(texts, max_length=510):  # 510 to leave space for [CLS] and [SEP]
+    """
+    Tokenizes a batch of texts with one call to the fast tokenizer and derives everything
+    the old path computed with separate tokenizations.
+
+    Args:
+        texts (list): Texts to tokenize.
+        max_length (int): Maximum number of tokens kept per text.
+
+    Returns:
+        list: (truncated_text, token_ids, token_count) per text, where truncated_text is the
+        same string truncate_text builds, token_ids the BERT input ids ([CLS] + tokens + [SEP],
+        without padding) and token_count the length of the text before truncation.
+    """
+    tokenizer = get_fast_tokenizer()
+    encodings = tokenizer(list(texts), add_special_tokens=False).encodings
+
+    results = []
+    for encoding in encodings:
+        tokens = encoding.tokens[:max_length]
+        ids = [tokenizer.cls_token_id] + encoding.ids[:max_length] + [tokenizer.sep_token_id]
+
+        # Same string as truncate_text (padded to max_length) without detokenizing through Python
+        padded = ['[CLS]'] + tokens + ['[PAD]'] * (max_length - len(tokens)) + ['[SEP]']
+        truncated_text = ' '.join(padded).replace(' ##', '').strip()
+
+        results.append((truncated_text, ids, len(encoding.ids)))
+    return results
+
+# Tokenize any iterable of texts batch by batch
+def tokenize_texts(texts, batch_size=256, max_length=510):
+    texts = iter(texts)
+    while True:
+        batch = list(islice(texts, batch_size))
+        if not batch:
+            return
+        yield from tokenize_batch(batch, max_length)
 
 # Connection with the database
 def connect_to_db(db_path):
     try:
-        conn = sql.connect(db_path)
+        conn = storage.get_connection(db_path)
         return conn
     except Exception as e:
         print(f"Error connecting to database: {e}")
         return None
 
-# Fetch the data from the database
-def fetch_text_data(conn):
-    query = 'SELECT id,text FROM content'
-    df = pd.read_sql_query(query, conn)
+# Version of the tokenization stage: bump it when its logic changes so every article is retokenized
+TOKENS_STAGE, TOKENS_VERSION = 'tokens', 1
+
+# Fetch the data from the database (only new or changed articles unless full=True)
+def fetch_text_data(conn, full=False):
+    df = storage.stale_rows(TOKENS_STAGE, TOKENS_VERSION, ['text'], force=full, db=conn)
     return df
 
-#Update the databse with tokens column
-def add_tokens_column(conn):
-    cursor=conn.cursor()
-    cursor.execute('ALTER TABLE content ADD COLUMN truncated_text TEXT')
-    cursor.execute('ALTER TABLE content ADD COLUMN tokens TEXT')
-    conn.commit()
+# Stream the data from the database in batches (only new or changed articles unless full=True)
+def fetch_text_batches(conn, full=False, batch_size=5000):
+    return storage.iter_stale_batches(TOKENS_STAGE, TOKENS_VERSION, ['text'], force=full, batch_size=batch_size, db=conn)
 
-def update_tokens_column(conn,df):
+#Update the databse with the token columns (the columns are created by the storage migrations)
+def update_tokens_column(conn, df, batch_size=256):
     try:
-        try:
-            add_tokens_column(conn)
-        except sql.OperationalError:
-            print('Column already exists')
-
-        # Process each text and update database
-        for index, row in tqdm.tqdm(df.iterrows(), total=len(df), desc="Storing Tokens"):
-            # Truncate and tokenize text
-            truncated_text = truncate_text(row['text'])
-            tokens = tokenizer.tokenize(truncated_text)
-            tokens_str = ','.join(tokens)  # Convert tokens list to string for storage
-            
-            # Update database
-            cursor = conn.cursor()
-            cursor.execute('''
-            UPDATE content 
-            SET truncated_text = ?, tokens = ? 
-            WHERE id = ?
-            ''', (truncated_text, tokens_str, row['id']))
-            
-            
-        conn.commit()
+        # Truncate and tokenize the texts in batches, in a single tokenizer pass
+        def token_rows():
+            tokenized = tokenize_texts(df['text'], batch_size)
+            for article_id, (truncated_text, ids, token_count) in zip(df['id'].tolist(), tqdm.tqdm(tokenized, total=len(df), desc="Storing Tokens")):
+                yield truncated_text, encode_token_ids(ids), token_count, article_id
+
+        # Batched update of the database
+        storage.write_batches('''
+        UPDATE content 
+        SET truncated_text = ?, token_ids = ?, token_count = ? 
+        WHERE id = ?
+        ''', token_rows(), conn, batch_size=1000)
+        # Only frames of fetch_text_batches carry the input hashes of the stage; plain id/text frames are just stored
+        if 'input_hash' in df:
+            storage.mark_processed(TOKENS_STAGE, TOKENS_VERSION, df['id'], df['input_hash'], conn)
         print("Successfully stored tokens in database")
         
     except Exception as e:
@@ -64,6 +119,8 @@ def update_tokens_column(conn,df):
 
 # Function to truncate texts to a maximum token length
 def truncate_text(text, max_length=510):  # 510 to leave space for [CLS] and [SEP]
+    tokenizer = get_tokenizer()
+
     # Tokenize the text
     tokens = tokenizer.tokenize(text)
     
@@ -85,31 +142,15 @@ def truncate_text(text, max_length=510):  # 510 to leave space for [CLS] and [SE
     truncated_text = tokenizer.convert_tokens_to_string(truncated_tokens)
     return truncated_text
 
-# Process the text data for BERT and get token lengths with truncation
-def process_text_with_truncation(df):
-    texts = df['text'].tolist()
-    tokenized_texts = []
-    token_lengths = []
-
-    for text in tqdm.tqdm(texts, desc="Tokenizing texts"):
-        # Truncate the text
-        truncated_text = truncate_text(text)
-        
-        # Tokenize the truncated text using BERT's tokenizer
-        encoded_input = tokenizer.encode_plus(
-            truncated_text,
-            add_special_tokens=True,  # Add [CLS] and [SEP]
-            max_length=512,           # Maximum length allowed by BERT
-            truncation=True,          # Truncate if longer than max_length
-            padding='max_length',     # Pad to max_length
-            return_tensors='pt'       # Return PyTorch tensors
-        )
-        
-        tokenized_texts.append(encoded_input)
-        token_lengths.append(len(tokenizer.tokenize(truncated_text)))
-    print(tokenized_texts[0]['input_ids'])
+# Process the text data for BERT and get token lengths (before truncation)
+def process_text_with_truncation(df, batch_size=256):
+    tokenized = tokenize_texts(df['text'], batch_size)
+    token_lengths = [token_count for _, _, token_count in tqdm.tqdm(tokenized, total=len(df), desc="Tokenizing texts")]
     return token_lengths
 """
+import matplotlib.pyplot as plt
+from wordcloud import WordCloud
+
 # Visualize token lengths distribution with min, max, avg lines
 def plot_token_length_distribution(token_lengths):
     plt.figure(figsize=(20, 10))
@@ -147,6 +188,7 @@ def plot_token_length_distribution(token_lengths):
 
 # Generate a word cloud from the text data
 def generate_word_cloud(texts):
+    tokenizer = get_tokenizer()
     all_tokens = []
     for text in texts:
         # Truncate text before tokenization to ensure it doesn't exceed 512 tokens
@@ -167,23 +209,22 @@ def generate_word_cloud(texts):
 """
 
 # Main function  
-def main(db_path):
+def main(db_path, full=False, batch_size=5000):
     conn = connect_to_db(db_path)
     
-    df = fetch_text_data(conn)
-
-    token_lengths = process_text_with_truncation(df)
-
-    print(df.head(10))
-    # Store tokens in database
-    update_tokens_column(conn,df)
+    # Stream the new or changed articles, so memory does not grow with the corpus
+    for df in fetch_text_batches(conn, full, batch_size):
+        print(f"{len(df)} new or changed articles to tokenize")
+        print(df.head(10))
+        # Store tokens in database (truncated text, token ids and lengths in one pass)
+        update_tokens_column(conn,df)
     
     # Generate visualizations
     #token_lengths = process_text_with_truncation(df.head(10))
     #plot_token_length_distribution(token_lengths)
     #generate_word_cloud(df['text'])
     
-    conn.close()
+    storage.close_connections()
 
 if __name__ == '__main__':
     db_path = 'data/processed/articles.db'
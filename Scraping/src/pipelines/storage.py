@@ -0,0 +1,530 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import pandas as pd
+from datetime import datetime, timezone
+from itertools import islice
+
+DEFAULT_DB_PATH = 'data/processed/articles.db'
+
+# Applied once to every connection handed out by get_connection
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -64000',
+    'PRAGMA busy_timeout = 30000',
+)
+
+# Open connections, one per (database, thread)
+_connections = {}
+_lock = threading.Lock()
+
+
+def _add_column(conn, table, column, column_type):
+    # Databases created before the migrations may already have the column
+    columns = [info[1] for info in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+
+def _create_base_tables(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS links (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        newspaper TEXT NOT NULL,
+        url TEXT UNIQUE NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS content (
+        id INTEGER PRIMARY KEY, -- Same as links.id
+        title TEXT,
+        publish_date TEXT,
+        text TEXT,
+        FOREIGN KEY (id) REFERENCES links (id) ON DELETE CASCADE
+    )
+    ''')
+
+
+def _add_clean_columns(conn):
+    _add_column(conn, 'content', 'clean_text', 'TEXT')
+    _add_column(conn, 'content', 'clean_title', 'TEXT')
+
+
+def _add_token_columns(conn):
+    _add_column(conn, 'content', 'truncated_text', 'TEXT')
+    _add_column(conn, 'content', 'tokens', 'TEXT')
+
+
+def _add_cleaning_columns(conn):
+    _add_column(conn, 'content', 'outlier', 'INTEGER')
+    _add_column(conn, 'content', 'word_count', 'INTEGER')
+    _add_column(conn, 'content', 'char_count', 'INTEGER')
+
+
+def _create_checkpoint_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS scrape_checkpoint (
+        url TEXT PRIMARY KEY,
+        newspaper TEXT,
+        status TEXT NOT NULL,
+        http_status INTEGER,
+        etag TEXT,
+        last_modified TEXT,
+        content_hash TEXT,
+        title TEXT,
+        publish_date TEXT,
+        text TEXT,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_checkpoint_newspaper ON scrape_checkpoint (newspaper)')
+
+
+def _add_lemma_column(conn):
+    _add_column(conn, 'content', 'lemma_text', 'TEXT')
+
+
+def _add_token_id_columns(conn):
+    _add_column(conn, 'content', 'token_ids', 'BLOB')
+    _add_column(conn, 'content', 'token_count', 'INTEGER')
+
+
+def _create_derived_state(conn):
+    # Hash of the scraped title and text, reset by a trigger whenever they change
+    # and recomputed by refresh_content_hashes
+    _add_column(conn, 'content', 'content_hash', 'TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_content_hash ON content (content_hash)')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS content_hash_reset AFTER UPDATE OF title, text ON content
+    BEGIN
+        UPDATE content SET content_hash = NULL WHERE id = NEW.id;
+    END
+    ''')
+
+    # Input hash and processor version of every derived stage of every article
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS derived_state (
+        content_id INTEGER NOT NULL,
+        stage TEXT NOT NULL,
+        input_hash TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        updated_at TEXT,
+        PRIMARY KEY (content_id, stage)
+    )
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS derived_state_cleanup AFTER DELETE ON content
+    BEGIN
+        DELETE FROM derived_state WHERE content_id = OLD.id;
+    END
+    ''')
+
+
+def _add_sentiment_columns(conn):
+    _add_column(conn, 'content', 'sentiment_score_vader', 'REAL')
+    _add_column(conn, 'content', 'sentiment_lexicon', 'INTEGER')
+    _add_column(conn, 'content', 'sentiment_score_textblob', 'REAL')
+
+
+def _add_stance_columns(conn):
+    _add_column(conn, 'content', 'pro_immigration_count', 'INTEGER')
+    _add_column(conn, 'content', 'anti_immigration_count', 'INTEGER')
+    _add_column(conn, 'content', 'pro_immigration_tfidf', 'REAL')
+    _add_column(conn, 'content', 'anti_immigration_tfidf', 'REAL')
+    _add_column(conn, 'content', 'stance_tfidf', 'TEXT')
+
+
+def _create_entity_tables(conn):
+    # One row per named entity mention (character offsets in content.text)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS entities (
+        article_id INTEGER NOT NULL,
+        label TEXT NOT NULL,
+        text TEXT NOT NULL,
+        start INTEGER NOT NULL,
+        end INTEGER NOT NULL
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_entities_article ON entities (article_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_entities_label_text ON entities (label, text)')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS entities_cleanup AFTER DELETE ON content
+    BEGIN
+        DELETE FROM entities WHERE article_id = OLD.id;
+    END
+    ''')
+
+    # Mentions and articles of every entity, rebuilt from entities after each NER run
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS entity_counts (
+        label TEXT NOT NULL,
+        text TEXT NOT NULL,
+        mentions INTEGER NOT NULL,
+        articles INTEGER NOT NULL,
+        PRIMARY KEY (label, text)
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_entity_counts_mentions ON entity_counts (label, mentions DESC)')
+
+
+def _create_clustering_results(conn):
+    # One row per fitted model of a clustering sweep
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS clustering_results (
+        run_id TEXT NOT NULL,
+        configuration TEXT NOT NULL,
+        algorithm TEXT NOT NULL,
+        n_clusters INTEGER,
+        eps REAL,
+        min_samples INTEGER,
+        silhouette REAL,
+        davies_bouldin REAL,
+        inertia REAL,
+        n_outliers INTEGER,
+        n_samples INTEGER,
+        seconds REAL,
+        created_at TEXT
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_clustering_results_run ON clustering_results (run_id, configuration)')
+
+
+def _add_clustering_score_columns(conn):
+    _add_column(conn, 'clustering_results', 'calinski_harabasz', 'REAL')
+    # Confidence interval of the silhouette when it is estimated from a sample
+    _add_column(conn, 'clustering_results', 'silhouette_low', 'REAL')
+    _add_column(conn, 'clustering_results', 'silhouette_high', 'REAL')
+
+
+def _create_cluster_assignments(conn):
+    # Cluster of every article for every persisted clustering model
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS cluster_assignments (
+        content_id INTEGER NOT NULL,
+        model TEXT NOT NULL,
+        label INTEGER NOT NULL,
+        distance REAL,
+        assigned_at TEXT,
+        PRIMARY KEY (content_id, model)
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_cluster_assignments_model ON cluster_assignments (model, label)')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS cluster_assignments_cleanup AFTER DELETE ON content
+    BEGIN
+        DELETE FROM cluster_assignments WHERE content_id = OLD.id;
+    END
+    ''')
+
+
+def _create_pipeline_state(conn):
+    # Fingerprints of the inputs and outputs of every stage of pipeline.py at its last successful run
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS pipeline_state (
+        stage TEXT PRIMARY KEY,
+        input_fingerprint TEXT NOT NULL,
+        output_fingerprint TEXT NOT NULL,
+        seconds REAL,
+        updated_at TEXT
+    )
+    ''')
+
+
+def _create_stance_tables(conn):
+    # Lexicon hits of every article (one row per matched entry), so the stance stage only
+    # matches new or changed articles and refits the IDF from the stored counts
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS stance_counts (
+        content_id INTEGER NOT NULL,
+        entry INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (content_id, entry)
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_stance_counts_entry ON stance_counts (entry)')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS stance_counts_cleanup AFTER DELETE ON content
+    BEGIN
+        DELETE FROM stance_counts WHERE content_id = OLD.id;
+    END
+    ''')
+
+    # IDF of every lexicon entry at the last stance run (entries whose IDF changed are rescored)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS stance_idf (
+        entry INTEGER PRIMARY KEY,
+        idf REAL NOT NULL
+    )
+    ''')
+
+
+# Versioned schema: (version, description, migration). The version reached is stored
+# in PRAGMA user_version, so each migration runs once per database.
+MIGRATIONS = [
+    (1, 'links and content tables', _create_base_tables),
+    (2, 'clean_text and clean_title columns', _add_clean_columns),
+    (3, 'truncated_text and tokens columns', _add_token_columns),
+    (4, 'outlier, word_count and char_count columns', _add_cleaning_columns),
+    (5, 'scrape_checkpoint table', _create_checkpoint_table),
+    (6, 'lemma_text column', _add_lemma_column),
+    (7, 'token_ids and token_count columns', _add_token_id_columns),
+    (8, 'content_hash column and derived_state table', _create_derived_state),
+    (9, 'sentiment columns', _add_sentiment_columns),
+    (10, 'lexicon stance columns', _add_stance_columns),
+    (11, 'entities and entity_counts tables', _create_entity_tables),
+    (12, 'clustering_results table', _create_clustering_results),
+    (13, 'Calinski-Harabasz and silhouette interval columns', _add_clustering_score_columns),
+    (14, 'cluster_assignments table', _create_cluster_assignments),
+    (15, 'pipeline_state table', _create_pipeline_state),
+    (16, 'stance_counts and stance_idf tables', _create_stance_tables),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def migrate(conn, from_version=None):
+    """
+    Brings the schema of a database up to SCHEMA_VERSION.
+
+    Args:
+        conn (sqlite3.Connection): Open connection.
+        from_version (int): Version to start from (defaults to the stored user_version).
+    """
+    if from_version is None:
+        from_version = conn.execute('PRAGMA user_version').fetchone()[0]
+
+    for version, description, migration in MIGRATIONS:
+        if version > from_version:
+            with conn:
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+            print(f"Applied migration {version}: {description}")
+
+
+def get_connection(db_path=DEFAULT_DB_PATH):
+    """
+    Returns the open, PRAGMA-tuned connection of the current thread to db_path,
+    creating it (and migrating the schema) the first time.
+    """
+    key = (os.path.abspath(db_path), threading.get_ident())
+    with _lock:
+        conn = _connections.get(key)
+        if conn is None:
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(db_path, timeout=30)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            migrate(conn)
+            _connections[key] = conn
+    return conn
+
+
+def close_connections():
+    """
+    Closes every connection opened by this module.
+    """
+    with _lock:
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+
+
+def _resolve(db):
+    # Helpers accept either a database path or an open connection
+    if isinstance(db, sqlite3.Connection):
+        return db
+    return get_connection(db)
+
+
+def read_frame(query, params=(), db=DEFAULT_DB_PATH):
+    """
+    Runs a SELECT and returns the result as a DataFrame.
+    """
+    return pd.read_sql_query(query, _resolve(db), params=params)
+
+
+def iter_batches(columns, table='content', joins='', where=None, params=(), batch_size=5000, db=DEFAULT_DB_PATH):
+    """
+    Streams a table in DataFrames of at most `batch_size` rows, ordered by id, reading
+    only the requested columns. Pages are fetched with keyset pagination (id > last id),
+    so every batch costs the same however far into the table it is and memory stays flat.
+
+    Args:
+        columns (list): Columns or SQL expressions to read (e.g. 'links.newspaper').
+        table (str): Table with the `id` key.
+        joins (str): JOIN clauses added after the table.
+        where (str): Extra filter (e.g. 'clean_text IS NOT NULL').
+        params (tuple): Parameters of the filter.
+        batch_size (int): Rows per batch.
+        db (str or sqlite3.Connection): Database path or open connection.
+
+    Yields:
+        pd.DataFrame: id and the requested columns.
+    """
+    conn = _resolve(db)
+    selected = ', '.join([f'{table}.id'] + list(columns))
+    condition = f'{table}.id > ?' + (f' AND ({where})' if where else '')
+    query = f'SELECT {selected} FROM {table} {joins} WHERE {condition} ORDER BY {table}.id LIMIT ?'
+
+    last_id = -1
+    while True:
+        batch = pd.read_sql_query(query, conn, params=(last_id, *params, batch_size))
+        if batch.empty:
+            return
+        yield batch
+        last_id = int(batch['id'].iloc[-1])
+
+
+def execute(query, params=(), db=DEFAULT_DB_PATH):
+    """
+    Runs a single statement in its own transaction. Returns the affected row count.
+    """
+    conn = _resolve(db)
+    with conn:
+        return conn.execute(query, params).rowcount
+
+
+def write_batches(query, rows, db=DEFAULT_DB_PATH, batch_size=1000):
+    """
+    Runs `query` with executemany over `rows` (any iterable), one transaction per batch.
+
+    Args:
+        query (str): Parameterized INSERT/UPDATE/DELETE statement.
+        rows (iterable): Parameter tuples.
+        db (str or sqlite3.Connection): Database path or open connection.
+        batch_size (int): Number of rows per transaction.
+
+    Returns:
+        int: Number of rows written.
+    """
+    conn = _resolve(db)
+    rows = iter(rows)
+    total = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return total
+        with conn:
+            conn.executemany(query, batch)
+        total += len(batch)
+
+
+def content_hash(title, text):
+    # Same hash as the scrape checkpoint stores for an article
+    return hashlib.sha256(f"{title}\n{text}".encode('utf-8')).hexdigest()
+
+
+def refresh_content_hashes(db=DEFAULT_DB_PATH, batch_size=1000):
+    """
+    Computes content_hash for the articles that are new or whose title/text changed
+    (the only ones with a NULL hash). Returns the number of hashed articles.
+    """
+    conn = _resolve(db)
+    total = 0
+    while True:
+        rows = conn.execute('SELECT id, title, text FROM content WHERE content_hash IS NULL LIMIT ?', (batch_size,)).fetchall()
+        if not rows:
+            return total
+        with conn:
+            conn.executemany('UPDATE content SET content_hash = ? WHERE id = ?',
+                             [(content_hash(title, text), article_id) for article_id, title, text in rows])
+        total += len(rows)
+
+
+def _select_stale(conn, stage, version, upstream, force, config=None):
+    # Collects the ids (and input hashes) a stage has to process in a temp table
+    refresh_content_hashes(conn)
+
+    if upstream:
+        input_hash = "u.input_hash || ':' || u.version"
+        upstream_join = 'JOIN derived_state u ON u.content_id = c.id AND u.stage = :upstream'
+    else:
+        input_hash = 'c.content_hash'
+        upstream_join = ''
+    # The configuration of the stage is part of its input: changing it reprocesses every article
+    if config:
+        input_hash = f"{input_hash} || ':' || :config"
+
+    # One table per stage, so the stale rows of two stages can be read at the same time.
+    # Only ids and hashes are compared, so unchanged articles are never read in full.
+    table = f'stale_{stage}'
+    with conn:
+        conn.execute(f'CREATE TEMP TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, input_hash TEXT)')
+        conn.execute(f'DELETE FROM temp.{table}')
+        conn.execute(f'''
+            INSERT INTO temp.{table} (id, input_hash)
+            SELECT c.id, {input_hash}
+            FROM content c
+            {upstream_join}
+            LEFT JOIN derived_state d ON d.content_id = c.id AND d.stage = :stage
+            WHERE :force OR d.content_id IS NULL OR d.version != :version OR d.input_hash != {input_hash}
+        ''', {'stage': stage, 'version': version, 'upstream': upstream, 'force': force, 'config': config})
+    return table
+
+
+def iter_stale_batches(stage, version, columns, upstream=None, force=False, batch_size=5000, config=None, db=DEFAULT_DB_PATH):
+    """
+    Streams the articles a derived stage has to (re)process: the ones it never processed,
+    the ones whose input changed since, and all of them when its version changed.
+
+    The input of a stage is the scraped title/text (content_hash), or the state of an
+    upstream stage (e.g. lemmatization runs on the output of the cleaning stage).
+
+    Args:
+        stage (str): Stage name (e.g. 'clean', 'tokens').
+        version (int): Current version of the stage's processing logic.
+        columns (list): content columns to return.
+        upstream (str): Stage whose output is the input of this one.
+        force (bool): Return every article (with an input) regardless of its state.
+        batch_size (int): Rows per batch.
+        config (str): Configuration of the stage that is not part of its version (e.g. the
+            sentiment scorers), folded into the input hashes.
+        db (str or sqlite3.Connection): Database path or open connection.
+
+    Yields:
+        pd.DataFrame: id, the requested columns and input_hash (to pass to mark_processed).
+    """
+    conn = _resolve(db)
+    table = _select_stale(conn, stage, version, upstream, force, config)
+    yield from iter_batches([f'content.{column}' for column in columns] + [f'temp.{table}.input_hash'], table=f'temp.{table}',
+                            joins=f'JOIN content ON content.id = temp.{table}.id', batch_size=batch_size, db=conn)
+
+
+def stale_rows(stage, version, columns, upstream=None, force=False, config=None, db=DEFAULT_DB_PATH):
+    """
+    Same as iter_stale_batches, returning all the rows in one DataFrame.
+    """
+    batches = list(iter_stale_batches(stage, version, columns, upstream, force, config=config, db=db))
+    if not batches:
+        return pd.DataFrame(columns=['id', *columns, 'input_hash'])
+    return pd.concat(batches, ignore_index=True)
+
+
+def count_stale(stage, version, upstream=None, config=None, db=DEFAULT_DB_PATH):
+    """
+    Number of articles a derived stage still has to (re)process (0 once it is up to date).
+    """
+    conn = _resolve(db)
+    table = _select_stale(conn, stage, version, upstream, False, config)
+    return conn.execute(f'SELECT COUNT(*) FROM temp.{table}').fetchone()[0]
+
+
+def mark_processed(stage, version, ids, input_hashes, db=DEFAULT_DB_PATH):
+    """
+    Records that a stage processed the given articles from the given inputs.
+    """
+    updated_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    rows = ((int(article_id), input_hash, version, updated_at, stage) for article_id, input_hash in zip(ids, input_hashes))
+    return write_batches('''
+        INSERT INTO derived_state (content_id, input_hash, version, updated_at, stage)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(content_id, stage) DO UPDATE SET
+            input_hash = excluded.input_hash,
+            version = excluded.version,
+            updated_at = excluded.updated_at
+    ''', rows, db)
@@ -0,0 +1,93 @@
+import os
+import sys
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scrapers'))
+import url_scraper
+import content_scraper
+import database_handler
+from checkpoint_store import ScrapeCheckpoint
+
+# Links from the sites configuration (crawled on the fly)
+def iter_links_from_config(config_file=url_scraper.CONFIG_PATH):
+    config = url_scraper.get_sites_config(config_file)
+
+    for site_name, site_config in config.items():
+        for link in url_scraper.scrape_article_links(site_name, site_config):
+            yield site_name, link
+
+# Links from an existing all_links.csv
+def iter_links_from_csv(csv_file, chunksize=1000):
+    for chunk in pd.read_csv(csv_file, chunksize=chunksize):
+        for row in chunk.itertuples(index=False):
+            yield row.Newspaper, row.Link
+
+def stream_scrape_to_database(links, db_path='data/processed/articles.db', batch_size=200,
+                              download_workers=16, parse_workers=None, export_dir=None,
+                              retry_failed=True, revalidate=False):
+    """
+    Scrapes the given links and streams the articles straight into the `links` and
+    `content` tables, without the intermediate all_links.csv/all_content.csv files.
+
+    Every result is recorded in the scrape_checkpoint table, in the same transaction as
+    its article. Links that are done (in the checkpoint, or with content in the database)
+    are skipped, so an interrupted run can simply be restarted, and the articles removed
+    by cleaning_data are neither scraped nor added to `links` again.
+
+    Args:
+        links (iterable): (newspaper, url) pairs.
+        db_path (str): Path to the SQLite database.
+        batch_size (int): Number of articles written per transaction.
+        download_workers (int): Number of download threads.
+        parse_workers (int): Number of parse processes.
+        export_dir (str): If given, all_content.csv and errors.csv are also exported there.
+        retry_failed (bool): Retry the links that failed in a previous run.
+        revalidate (bool): Re-request the done links still in the database with
+            If-None-Match/If-Modified-Since, and update the ones that changed.
+    """
+    database_handler.initialize_database(db_path)
+    checkpoint = ScrapeCheckpoint(db_path)
+
+    links = list(links)
+    entries = checkpoint.get_entries(link for _, link in links)
+    # Articles stored before the checkpoint existed are done too
+    stored = database_handler.scraped_urls(db_path)
+
+    new_links, pending, validators = [], [], {}
+    for newspaper, link in links:
+        entry = entries.get(link)
+        if link in stored or (entry is not None and entry['status'] == 'done'):
+            # Only the articles still in the database are revalidated: the cleaned ones stay removed
+            if revalidate and link in stored and entry is not None:
+                validators[link] = (entry['etag'], entry['last_modified'])
+                pending.append((newspaper, link))
+            continue
+
+        new_links.append((newspaper, link))
+        if entry is None or retry_failed:
+            pending.append((newspaper, link))
+    print(f"{len(links) - len(new_links)} links already scraped, {len(pending)} to scrape")
+
+    # Links are small, so the ones not scraped yet are stored up front as insert_links does
+    database_handler.insert_links_stream(new_links, db_path)
+
+    errors = []
+    articles = content_scraper.iter_scraped_articles(pending, download_workers, parse_workers, errors=errors,
+                                                     checkpoint=checkpoint, validators=validators)
+
+    export_csv = None
+    if export_dir:
+        os.makedirs(export_dir, exist_ok=True)
+        export_csv = os.path.join(export_dir, "all_content.csv")
+
+    total = database_handler.insert_articles_stream(articles, db_path, batch_size, export_csv=export_csv)
+    # Failures after the last batch of articles
+    checkpoint.close()
+    print(f"Streamed {total} articles into {db_path} ({len(errors)} errors)")
+
+    if export_dir and errors:
+        pd.DataFrame(errors).to_csv(os.path.join(export_dir, "errors.csv"), index=False, encoding="utf-8-sig")
+
+if __name__ == "__main__":
+    database_path = "data/processed/articles.db"
+    stream_scrape_to_database(iter_links_from_csv("data/all_links.csv"), database_path)
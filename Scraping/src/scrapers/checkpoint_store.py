@@ -0,0 +1,109 @@
+import hashlib
+import os
+import sys
+import sqlite3
+from datetime import datetime, timezone
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pipelines'))
+import storage
+
+
+class ScrapeCheckpoint:
+    def __init__(self, db_path='data/processed/articles.db'):
+        """
+        Per-URL scraping checkpoint stored in the `scrape_checkpoint` table.
+
+        Every scraped URL is recorded as soon as it is processed, with its status
+        ('done' or 'failed'), HTTP status, ETag/Last-Modified headers, a hash of the
+        content and the content itself, so an interrupted run can be resumed.
+
+        Args:
+            db_path (str): Path to the SQLite database.
+        """
+        self.db_path = db_path
+        # The scrape_checkpoint table is created by the storage migrations
+        self.conn = storage.get_connection(db_path)
+
+    def get_entries(self, urls):
+        """
+        Returns the checkpoint rows of the given URLs as a dict {url: row}.
+        """
+        entries = {}
+        urls = list(urls)
+        # Stay below SQLite's limit of bound parameters
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            cursor = self.conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(f'SELECT * FROM scrape_checkpoint WHERE url IN ({placeholders})', chunk)
+            entries.update({row['url']: row for row in cursor})
+        return entries
+
+    def known_links(self, newspaper):
+        """
+        Returns the set of URLs already recorded for a newspaper.
+        """
+        cursor = self.conn.execute('SELECT url FROM scrape_checkpoint WHERE newspaper = ?', (newspaper,))
+        return {row[0] for row in cursor}
+
+    def record_success(self, url, newspaper, content, http_status=200, etag=None, last_modified=None):
+        """
+        Records a scraped article (content is a dict with Title, Date and Text).
+        """
+        content_hash = hashlib.sha256(f"{content['Title']}\n{content['Text']}".encode('utf-8')).hexdigest()
+        self.conn.execute('''
+            INSERT INTO scrape_checkpoint (url, newspaper, status, http_status, etag, last_modified,
+                                           content_hash, title, publish_date, text, error, attempts, updated_at)
+            VALUES (?, ?, 'done', ?, ?, ?, ?, ?, ?, ?, NULL, 1, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                newspaper = excluded.newspaper,
+                status = 'done',
+                http_status = excluded.http_status,
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                content_hash = excluded.content_hash,
+                title = excluded.title,
+                publish_date = excluded.publish_date,
+                text = excluded.text,
+                error = NULL,
+                attempts = scrape_checkpoint.attempts + 1,
+                updated_at = excluded.updated_at
+        ''', (url, newspaper, http_status, etag, last_modified, content_hash,
+              content['Title'], content['Date'], content['Text'], self._now()))
+
+    def record_not_modified(self, url):
+        """
+        Records a successful revalidation (HTTP 304) of an already scraped article.
+        """
+        self.conn.execute('''
+            UPDATE scrape_checkpoint
+            SET http_status = 304, attempts = attempts + 1, updated_at = ?
+            WHERE url = ?
+        ''', (self._now(), url))
+
+    def record_failure(self, url, newspaper, error, http_status=None):
+        """
+        Records a failed URL. Content previously scraped for it is kept.
+        """
+        self.conn.execute('''
+            INSERT INTO scrape_checkpoint (url, newspaper, status, http_status, error, attempts, updated_at)
+            VALUES (?, ?, 'failed', ?, ?, 1, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                status = CASE WHEN scrape_checkpoint.status = 'done' THEN 'done' ELSE 'failed' END,
+                http_status = excluded.http_status,
+                error = excluded.error,
+                attempts = scrape_checkpoint.attempts + 1,
+                updated_at = excluded.updated_at
+        ''', (url, newspaper, http_status, error, self._now()))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        # The connection is shared through the storage module, so it is only committed
+        self.conn.commit()
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc).isoformat(timespec='seconds')
@@ -1,7 +1,41 @@
 import os
+import time
+from itertools import islice
+import requests
 import pandas as pd
-from newspaper import Article
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from newspaper import Article, Config, network
 from tqdm import tqdm
+from checkpoint_store import ScrapeCheckpoint
+
+class DownloadError(Exception):
+    """
+    Failed article download, with the HTTP status of the response (if any).
+    """
+    def __init__(self, message, http_status=None):
+        super().__init__(message)
+        self.http_status = http_status
+
+def save_content(all_content, errors, output_dir="data/processed"):
+    """
+    Saves the scraped content to all_content.csv and the failed URLs to errors.csv.
+    """
+    # Save the extracted content to a CSV file
+    output_file = os.path.join(output_dir, "all_content.csv")
+    content_df = pd.DataFrame(all_content)
+    content_df.to_csv(output_file, index=False, encoding="utf-8-sig", sep=";")
+    print(f"Saved content to {output_file}")
+
+    # Save errors to a separate CSV file
+    if errors:
+        error_file = os.path.join(output_dir, "errors.csv")
+        error_df = pd.DataFrame(errors)
+        error_df.to_csv(error_file, index=False, encoding="utf-8-sig")
+        print(f"Logged {len(errors)} errors to {error_file}")
+
+def report_throughput(count, elapsed):
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"Scraped {count} articles in {elapsed:.1f}s ({rate:.2f} articles/s)")
 
 def scrape_content(csv_file, output_dir="data/processed"):
     """
@@ -16,6 +50,7 @@ def scrape_content(csv_file, output_dir="data/processed"):
 
     all_content = []
     errors = []
+    start = time.perf_counter()
 
     # Iterate through each row with a progress bar
     for _, row in tqdm(df.iterrows(), total=len(df), desc="Scraping content"):
@@ -44,19 +79,248 @@ def scrape_content(csv_file, output_dir="data/processed"):
             errors.append({"URL": url, "Error": str(e)})
             print(f"Failed to scrape {url}: {e}")
 
-    # Save the extracted content to a CSV file
-    output_file = os.path.join(output_dir, "all_content.csv")
-    content_df = pd.DataFrame(all_content)
-    content_df.to_csv(output_file, index=False, encoding="utf-8-sig", sep=";")
-    print(f"Saved content to {output_file}")
+    report_throughput(len(df), time.perf_counter() - start)
+    save_content(all_content, errors, output_dir)
 
-    # Save errors to a separate CSV file
-    if errors:
-        error_file = os.path.join(output_dir, "errors.csv")
-        error_df = pd.DataFrame(errors)
-        error_df.to_csv(error_file, index=False, encoding="utf-8-sig")
-        print(f"Logged {len(errors)} errors to {error_file}")
+# Download step of the parallel engine (I/O bound, runs in threads)
+def download_html(url, etag=None, last_modified=None):
+    """
+    Downloads an article the same way newspaper3k does, sending conditional request
+    headers when an ETag/Last-Modified is known.
+
+    Returns:
+        tuple: (http_status, etag, last_modified, html). html is None on 304 Not Modified.
+    """
+    config = Config()
+    kwargs = network.get_request_kwargs(config.request_timeout, config.browser_user_agent, config.proxies, config.headers)
+    kwargs['headers'] = dict(kwargs['headers'])
+    if etag:
+        kwargs['headers']['If-None-Match'] = etag
+    if last_modified:
+        kwargs['headers']['If-Modified-Since'] = last_modified
+
+    response = None
+    try:
+        response = requests.get(url, **kwargs)
+        if response.status_code == 304:
+            return 304, etag, last_modified, None
+
+        html = network.get_html_2XX_only(url, config, response=response)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        # Same message as the ArticleException raised by newspaper3k
+        raise DownloadError(f'Article `download()` failed with {e} on URL {url}',
+                            response.status_code if response is not None else None)
+
+    return response.status_code, response.headers.get('ETag'), response.headers.get('Last-Modified'), html
+
+# Parse step of the parallel engine (CPU bound, runs in worker processes)
+def parse_html(url, html):
+    article = Article(url, language="es")
+    article.download(input_html=html)
+    article.parse()
+    return {
+        "Title": article.title,
+        "Date": article.publish_date.isoformat() if article.publish_date else None,  # Convert to ISO format
+        "Text": article.text
+    }
+
+def scrape_content_parallel(csv_file, output_dir="data/processed", download_workers=16, parse_workers=None,
+                            checkpoint_db=None, retry_failed=True, revalidate=False):
+    """
+    Parallel version of scrape_content: articles are downloaded by a pool of threads and
+    their HTML is parsed by a pool of processes. Rows and errors keep the order of the
+    input CSV, so all_content.csv and errors.csv are the same as the sequential ones.
+
+    With a checkpoint database every result is recorded as soon as it is available, and
+    a rerun only requests the URLs that are not done yet.
+
+    Args:
+        csv_file (str): CSV with the ID, Newspaper and Link columns.
+        output_dir (str): Directory for all_content.csv and errors.csv.
+        download_workers (int): Number of download threads.
+        parse_workers (int): Number of parse processes (defaults to the CPU count).
+        checkpoint_db (str): SQLite database holding the scrape_checkpoint table (optional).
+        retry_failed (bool): Retry the URLs that failed in a previous run.
+        revalidate (bool): Re-request done URLs with If-None-Match/If-Modified-Since.
+    """
+    df = pd.read_csv(csv_file)
+    os.makedirs(output_dir, exist_ok=True)
+
+    urls = df['Link'].tolist()
+    newspapers = df['Newspaper'].tolist()
+    results = [None] * len(urls)
+
+    checkpoint = ScrapeCheckpoint(checkpoint_db) if checkpoint_db else None
+    entries = checkpoint.get_entries(urls) if checkpoint else {}
+
+    # Decide which URLs need a request in this run
+    to_fetch = []
+    for i, url in enumerate(urls):
+        entry = entries.get(url)
+        if entry is None:
+            to_fetch.append(i)
+        elif entry['status'] == 'done':
+            results[i] = {"Title": entry['title'], "Date": entry['publish_date'], "Text": entry['text']}
+            if revalidate:
+                to_fetch.append(i)
+        elif retry_failed:
+            to_fetch.append(i)
+        else:
+            results[i] = DownloadError(entry['error'], entry['http_status'])
+
+    if checkpoint:
+        print(f"{len(urls) - len(to_fetch)} of {len(urls)} URLs resolved from the checkpoint")
+
+    def is_done(i):
+        return urls[i] in entries and entries[urls[i]]['status'] == 'done'
+
+    recorded = 0
+
+    def record():
+        # Commit the checkpoint regularly so a crash loses at most a few articles
+        nonlocal recorded
+        recorded += 1
+        if recorded % 25 == 0:
+            checkpoint.commit()
+
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=download_workers) as downloader, \
+            ProcessPoolExecutor(max_workers=parse_workers) as parser:
+        downloads = {}
+        for i in to_fetch:
+            entry = entries.get(urls[i]) if is_done(i) else None
+            future = downloader.submit(download_html, urls[i],
+                                       entry['etag'] if entry else None,
+                                       entry['last_modified'] if entry else None)
+            downloads[future] = i
+
+        parses = {}
+        headers = {}
+
+        # Hand every downloaded page to the parser pool as soon as it arrives
+        for future in tqdm(as_completed(downloads), total=len(downloads), desc="Downloading content"):
+            i = downloads[future]
+            try:
+                http_status, etag, last_modified, html = future.result()
+                if html is None:
+                    checkpoint.record_not_modified(urls[i])
+                    record()
+                    continue
+
+                headers[i] = (http_status, etag, last_modified)
+                parses[parser.submit(parse_html, urls[i], html)] = i
+            except Exception as e:
+                if not is_done(i):
+                    results[i] = e
+                if checkpoint:
+                    checkpoint.record_failure(urls[i], newspapers[i], str(e), getattr(e, 'http_status', None))
+                    record()
+
+        for future in tqdm(as_completed(parses), total=len(parses), desc="Parsing content"):
+            i = parses[future]
+            try:
+                results[i] = future.result()
+                if checkpoint:
+                    http_status, etag, last_modified = headers[i]
+                    checkpoint.record_success(urls[i], newspapers[i], results[i], http_status, etag, last_modified)
+                    record()
+            except Exception as e:
+                if not is_done(i):
+                    results[i] = e
+                if checkpoint:
+                    checkpoint.record_failure(urls[i], newspapers[i], str(e))
+                    record()
+
+    if checkpoint:
+        checkpoint.close()
+
+    all_content = []
+    errors = []
+    for row, result in zip(df.itertuples(index=False), results):
+        if isinstance(result, Exception):
+            # Log errors for failed URLs
+            errors.append({"URL": row.Link, "Error": str(result)})
+            print(f"Failed to scrape {row.Link}: {result}")
+            continue
+
+        all_content.append({"ID": row.ID, "Newspaper": row.Newspaper, "URL": row.Link, **result})
+
+    report_throughput(len(to_fetch), time.perf_counter() - start)
+    save_content(all_content, errors, output_dir)
+
+def iter_scraped_articles(links, download_workers=16, parse_workers=None, window=256, errors=None,
+                          checkpoint=None, validators=None):
+    """
+    Streaming version of scrape_content_parallel. Articles are scraped in windows of
+    `window` links with the same thread/process pools, and yielded one by one in input
+    order, so only one window of articles is held in memory.
+
+    With a checkpoint every result is recorded on its connection (committed by the
+    caller, e.g. in the same transaction as the article), and the links with known
+    validators are requested with If-None-Match/If-Modified-Since: unchanged articles
+    (304) are only recorded as revalidated, not yielded.
+
+    Args:
+        links (iterable): (newspaper, url) pairs.
+        download_workers (int): Number of download threads.
+        parse_workers (int): Number of parse processes (defaults to the CPU count).
+        window (int): Number of links scraped together.
+        errors (list): If given, failed URLs are appended to it as {"URL", "Error"} dicts.
+        checkpoint (ScrapeCheckpoint): Checkpoint to record the results to (optional).
+        validators (dict): {url: (etag, last_modified)} of the links to revalidate.
+
+    Yields:
+        dict: Article with the Newspaper, URL, Title, Date and Text keys (the ID is the
+        one of the `links` table, set by database_handler.insert_articles_stream).
+    """
+    links = iter(links)
+    validators = validators or {}
+
+    with ThreadPoolExecutor(max_workers=download_workers) as downloader, \
+            ProcessPoolExecutor(max_workers=parse_workers) as parser:
+        while True:
+            batch = list(islice(links, window))
+            if not batch:
+                break
+
+            downloads = [downloader.submit(download_html, url, *validators.get(url, (None, None))) for _, url in batch]
+            parses = []
+            headers = []
+            for (_, url), future in zip(batch, downloads):
+                try:
+                    http_status, etag, last_modified, html = future.result()
+                    headers.append((http_status, etag, last_modified))
+                    parses.append(None if html is None else parser.submit(parse_html, url, html))
+                except Exception as e:
+                    headers.append((None, None, None))
+                    parses.append(e)
+
+            for (newspaper, url), parse, (http_status, etag, last_modified) in zip(batch, parses, headers):
+                if parse is None:
+                    # 304 Not Modified: the stored article is still current
+                    if checkpoint:
+                        checkpoint.record_not_modified(url)
+                    continue
+
+                try:
+                    if isinstance(parse, Exception):
+                        raise parse
+                    content = parse.result()
+                except Exception as e:
+                    # Log errors for failed URLs
+                    print(f"Failed to scrape {url}: {e}")
+                    if errors is not None:
+                        errors.append({"URL": url, "Error": str(e)})
+                    if checkpoint:
+                        checkpoint.record_failure(url, newspaper, str(e), getattr(e, 'http_status', None))
+                    continue
+
+                if checkpoint:
+                    checkpoint.record_success(url, newspaper, content, http_status, etag, last_modified)
+                yield {"Newspaper": newspaper, "URL": url, **content}
 
 # Example usage
 if __name__ == "__main__":
-    scrape_content("data/all_links.csv")
+    scrape_content_parallel("data/all_links.csv", download_workers=16, checkpoint_db="data/processed/articles.db")
@@ -3,23 +3,75 @@ import requests
 from bs4 import BeautifulSoup
 import os
 import csv
-from urllib.parse import quote
+from urllib.parse import quote, urlparse
 import time
+import asyncio
+from functools import lru_cache
 from tqdm import tqdm
+from checkpoint_store import ScrapeCheckpoint
 
-# Load site configuration from JSON file
-with open('Scraping\src\scrapers\config\sites_config.json', 'r') as f:
-    sites_config = json.load(f)
+# Site configuration, next to this script
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'sites_config.json')
+
+# Load site configuration from JSON file (only read when first needed)
+@lru_cache(maxsize=None)
+def get_sites_config(config_file=CONFIG_PATH):
+    with open(config_file, 'r') as f:
+        return json.load(f)
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+# Function to build the URL of a listing page
+def build_page_url(site_config, page):
+    """
+    Builds the (encoded) URL of a listing page for a site.
+    """
+    base_url = site_config['base_url']
+    pagination_pattern = site_config.get('pagination_pattern', None)
+
+    # Build the URL for each page
+    if pagination_pattern:
+        url = f"{base_url}{pagination_pattern.format(page_number=page)}"
+    else:
+        url = base_url
+
+    # Encode the URL to handle special characters
+    return quote(url, safe=':/?&=')
+
+# Function to extract the article links of a listing page
+def extract_links(content, article_selector, base_url, all_links):
+    """
+    Parses a listing page and appends its new article links to all_links.
+    Returns the links appended.
+    """
+    # Parse the HTML
+    soup = BeautifulSoup(content, 'html.parser')
+    articles = soup.select(article_selector)
+    start = len(all_links)
+
+    # Extract and store links
+    for article in articles:
+        link = article.get('href')
+        if link and link not in all_links:
+            # Ensure the link is absolute
+            if not link.startswith('http'):
+                link = base_url + link
+            all_links.append(link)
+
+    return all_links[start:]
 
 # Function to scrape article links using requests and BeautifulSoup
-def scrape_article_links(site_name, site_config, max_pages=30):
+def scrape_article_links(site_name, site_config, max_pages=30, known_links=None):
     """
     Scrapes article links for a site using requests and BeautifulSoup.
+    If known_links is given, paging stops at the first page containing an already
+    known link and only the new links are returned.
     """
 
     # Handle URL-based pagination
     base_url = site_config['base_url']
-    pagination_pattern = site_config.get('pagination_pattern', None)
     article_selector = site_config.get('article_link_selector', 'a')  # Default selector
     start_page = site_config.get('start_page', 1)
     end_page = site_config.get('end_page', max_pages)
@@ -27,102 +79,279 @@ def scrape_article_links(site_name, site_config, max_pages=30):
     all_links = []
     for page in tqdm(range(start_page, end_page + 1)):
         try:
-            # Build the URL for each page
-            if pagination_pattern:
-                url = f"{base_url}{pagination_pattern.format(page_number=page)}"
-            else:
-                url = base_url
+            url = build_page_url(site_config, page)
 
-            # Encode the URL to handle special characters
-            url = quote(url, safe=':/?&=')
-            
             # Send HTTP request
-            headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-            response = requests.get(url, headers=headers)
+            response = requests.get(url, headers=HEADERS)
             if response.status_code != 200:
                 print(f"Failed to fetch {url}")
                 break
 
-            # Parse the HTML
-            soup = BeautifulSoup(response.content, 'html.parser')
-            articles = soup.select(article_selector)
-
-            # Extract and store links
-            for article in articles:
-                link = article.get('href')
-                if link and link not in all_links:
-                    # Ensure the link is absolute
-                    if not link.startswith('http'):
-                        link = base_url + link
-                    all_links.append(link)
+            page_links = extract_links(response.content, article_selector, base_url, all_links)
+            if known_links and any(link in known_links for link in page_links):
+                break
 
         except Exception as e:
             print(f"Error while scraping {url}: {e}")
 
+    if known_links:
+        return [link for link in all_links if link not in known_links]
+    return all_links
+
+
+class HostLimiter:
+    """
+    Per-domain concurrency and politeness limits for the async crawler.
+    """
+    def __init__(self, max_concurrency=4, min_delay=0.0):
+        """
+        Args:
+            max_concurrency (int): Maximum number of simultaneous requests to the host.
+            min_delay (float): Minimum number of seconds between two requests to the host.
+        """
+        self.max_concurrency = max_concurrency
+        self.min_delay = min_delay
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._lock = asyncio.Lock()
+        self._last_request = None
+
+    async def wait_turn(self):
+        # Space out the start of consecutive requests to the same host
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            if self._last_request is not None:
+                delay = self._last_request + self.min_delay - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self._last_request = loop.time()
+
+
+# Function to build one limiter per domain from the site configuration
+def build_host_limiters(config):
+    """
+    Builds a HostLimiter for each domain in the config. Sites sharing a domain share
+    its limiter, using the strictest limits declared for it.
+    """
+    limits = {}
+    for site_config in config.values():
+        host = urlparse(site_config['base_url']).netloc
+        concurrency = site_config.get('max_concurrency', 4)
+        delay = site_config.get('min_delay', 0.0)
+        if host in limits:
+            concurrency = min(concurrency, limits[host][0])
+            delay = max(delay, limits[host][1])
+        limits[host] = (concurrency, delay)
+
+    return {host: HostLimiter(concurrency, delay) for host, (concurrency, delay) in limits.items()}
+
+
+async def _fetch_page(session, url, limiter):
+    async with limiter.semaphore:
+        await limiter.wait_turn()
+        async with session.get(url) as response:
+            return response.status, await response.read()
+
+
+async def scrape_article_links_async(site_name, site_config, session, limiter, max_pages=30, known_links=None):
+    """
+    Async version of scrape_article_links. Listing pages are requested in windows of
+    `max_concurrency` pages over the shared session, and processed in page order so
+    the returned links are exactly the ones of the sequential crawl.
+    """
+    base_url = site_config['base_url']
+    article_selector = site_config.get('article_link_selector', 'a')  # Default selector
+    start_page = site_config.get('start_page', 1)
+    end_page = site_config.get('end_page', max_pages)
+
+    pages = list(range(start_page, end_page + 1))
+    all_links = []
+    finished = False
+    for i in range(0, len(pages), limiter.max_concurrency):
+        if finished:
+            break
+        urls = [build_page_url(site_config, page) for page in pages[i:i + limiter.max_concurrency]]
+        results = await asyncio.gather(
+            *(_fetch_page(session, url, limiter) for url in urls),
+            return_exceptions=True
+        )
+
+        for url, result in zip(urls, results):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+
+                status, content = result
+                if status != 200:
+                    print(f"Failed to fetch {url}")
+                    finished = True
+                    break
+
+                page_links = extract_links(content, article_selector, base_url, all_links)
+                if known_links and any(link in known_links for link in page_links):
+                    finished = True
+                    break
+
+            except Exception as e:
+                print(f"Error while scraping {url}: {e}")
+
+    if known_links:
+        return [link for link in all_links if link not in known_links]
     return all_links
 
 
+async def scrape_sites_async(config, max_pages=30, known_links=None):
+    """
+    Crawls the listing pages of every site in the config at once, over a single pool of
+    keep-alive connections. Returns a dict {site_name: links} in config order.
+    known_links is an optional dict {site_name: set of links} for incremental crawls.
+    """
+    known_links = known_links or {}
+    import aiohttp
+
+    limiters = build_host_limiters(config)
+    connector = aiohttp.TCPConnector(
+        limit=sum(limiter.max_concurrency for limiter in limiters.values()),
+        keepalive_timeout=30
+    )
+    timeout = aiohttp.ClientTimeout(total=60)
+
+    async with aiohttp.ClientSession(connector=connector, headers=HEADERS, timeout=timeout) as session:
+        tasks = [
+            scrape_article_links_async(
+                site_name,
+                site_config,
+                session,
+                limiters[urlparse(site_config['base_url']).netloc],
+                max_pages=max_pages,
+                known_links=known_links.get(site_name)
+            )
+            for site_name, site_config in config.items()
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    return dict(zip(config.keys(), results))
+
+
 # Function to save all scraped links to a single CSV
-def save_links_to_csv(all_links, output_file="data/all_links.csv"):
+def save_links_to_csv(all_links, output_file="data/all_links.csv", keep_ids=False):
     """
     Save all scraped links to a single CSV file.
     Each row contains an ID, newspaper name, and the link.
-    The ID is sequential across all newspapers.
+    The ID is sequential across all newspapers. With keep_ids=True the links already
+    in output_file keep their ID and only the new links get new ones (after the highest
+    ID), so the IDs of all_content.csv still match after an incremental crawl.
     """
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    previous_ids = {}
+    if keep_ids and os.path.exists(output_file):
+        with open(output_file, "r", newline="", encoding="utf-8") as csvfile:
+            previous_ids = {row["Link"]: int(row["ID"]) for row in csv.DictReader(csvfile)}
+
+    rows = []
+    # Sequential ID across all newspapers
+    next_id = max(previous_ids.values(), default=0) + 1
+    for newspaper, links in all_links.items():
+        for link in links:
+            if link in previous_ids:
+                rows.append((previous_ids[link], newspaper, link))
+            else:
+                rows.append((next_id, newspaper, link))
+                next_id += 1  # Increment the global ID counter
+
     with open(output_file, "w", newline="", encoding="utf-8") as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(["ID", "Newspaper", "Link"])  # Write header
-        
-        # Sequential ID across all newspapers
-        unique_id = 1
-        for newspaper, links in all_links.items():
-            for link in links:
-                writer.writerow([unique_id, newspaper, link])
-                unique_id += 1  # Increment the global ID counter
-    
+        writer.writerows(sorted(rows))
+
     print(f"Saved all links to {output_file}")
 
 
+# Function to load the links saved for a site by a previous run
+def load_site_links(site_name, output_dir="data/raw"):
+    output_file = os.path.join(output_dir, f"{site_name}_links.json")
+    if not os.path.exists(output_file):
+        return []
+    with open(output_file, 'r') as file:
+        return json.load(file)
+
+
+# Function to save the links of a site to its JSON file
+def save_site_links(site_name, links, output_dir="data/raw"):
+    os.makedirs(output_dir, exist_ok=True)
+    output_file = os.path.join(output_dir, f"{site_name}_links.json")
+    with open(output_file, 'w') as file:
+        json.dump(links, file, indent=4)
+
+    print(f"Extracted {len(links)} links for {site_name}. Saved to {output_file}")
+
+
 # Function to scrape all sites
-def scrape_all_sites(config_file, output_dir="data/raw"):
+def scrape_all_sites(config_file, output_dir="data/raw", use_async=False, incremental=False, checkpoint_db=None):
     """
     Scrapes all sites listed in the config file.
+    With use_async=True the listing pages of all sites are fetched concurrently.
+    With incremental=True paging stops once a site reaches links that are already known
+    (from the previous JSON files and the scrape_checkpoint table of checkpoint_db, which
+    the content stage fills: stream_pipeline and scrape_content_parallel) and the new
+    links are added after the previous ones, which keep their IDs in all_links.csv.
     """
     # Load the unified configuration
-    with open(config_file, 'r') as file:
-        config = json.load(file)
+    config = get_sites_config(config_file)
 
     all_links = {}
+    previous_links = {}
+    known_links = {}
 
-    for site_name, site_config in config.items():
-        tqdm.write(f"Starting scrape for: {site_name}")
-        
-        try:
-            # Scrape the site
-            links = scrape_article_links(site_name, site_config)
-            all_links[site_name] = links
+    if incremental:
+        checkpoint = ScrapeCheckpoint(checkpoint_db) if checkpoint_db else None
+        for site_name in config:
+            previous_links[site_name] = load_site_links(site_name, output_dir)
+            known_links[site_name] = set(previous_links[site_name])
+            if checkpoint:
+                known_links[site_name] |= checkpoint.known_links(site_name)
+        if checkpoint:
+            checkpoint.close()
 
-            # Save individual site results (optional)
-            os.makedirs(output_dir, exist_ok=True)
-            output_file = os.path.join(output_dir, f"{site_name}_links.json")
-            with open(output_file, 'w') as file:
-                json.dump(links, file, indent=4)
+    def store_links(site_name, links):
+        if incremental:
+            print(f"Found {len(links)} new links for {site_name}")
+            links = previous_links[site_name] + links
+        all_links[site_name] = links
+        save_site_links(site_name, links, output_dir)
 
-            print(f"Extracted {len(links)} links for {site_name}. Saved to {output_file}")
+    if use_async:
+        results = asyncio.run(scrape_sites_async(config, known_links=known_links))
+        for site_name, links in results.items():
+            if isinstance(links, Exception):
+                print(f"Error while scraping {site_name}: {links}")
+                if incremental:
+                    all_links[site_name] = previous_links[site_name]
+                continue
+            store_links(site_name, links)
 
-        except Exception as e:
-            print(f"Error while scraping {site_name}: {e}")
+    else:
+        for site_name, site_config in config.items():
+            tqdm.write(f"Starting scrape for: {site_name}")
+
+            try:
+                # Scrape the site
+                links = scrape_article_links(site_name, site_config, known_links=known_links.get(site_name))
+
+                # Save individual site results (optional)
+                store_links(site_name, links)
+
+            except Exception as e:
+                print(f"Error while scraping {site_name}: {e}")
+                if incremental:
+                    all_links[site_name] = previous_links[site_name]
 
     # Save all links to a single CSV file
-    save_links_to_csv(all_links, output_file="data/all_links.csv")
+    save_links_to_csv(all_links, output_file="data/all_links.csv", keep_ids=incremental)
 
 
 # Main execution
 if __name__ == "__main__":
     # Dynamically determine the path to the configuration file
-    config_path ="Scraping\src\scrapers\config\sites_config.json"
-    scrape_all_sites(config_path)
+    scrape_all_sites(CONFIG_PATH)
 
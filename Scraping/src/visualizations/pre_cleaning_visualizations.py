@@ -1,16 +1,29 @@
+import os
+import sys
+from collections import Counter
 import pandas as pd
 import matplotlib.pyplot as plt
 from wordcloud import WordCloud
-import sqlite3
 import seaborn as sns
 import numpy as np
 
-# Load the database data into DataFrames
-conn = sqlite3.connect('data/processed/articles.db')
-links_df = pd.read_sql_query('SELECT * FROM links', conn)
-content_df = pd.read_sql_query('SELECT * FROM content', conn)
-
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pipelines'))
+import storage
 
+# Load the database data into DataFrames
+db_path = 'data/processed/articles.db'
+links_df = storage.read_frame('SELECT * FROM links', db=db_path)
+
+# The texts are streamed in batches: each batch is reduced to its article lengths and
+# to the word frequencies of the word cloud, so the texts are never all in memory
+word_frequencies = Counter()
+content_batches = []
+for batch in storage.iter_batches(['content.publish_date', 'links.newspaper', 'content.text'],
+                                  joins='JOIN links ON content.id = links.id', db=db_path):
+    batch['text_length'] = batch['text'].str.split().apply(len)
+    word_frequencies.update(WordCloud().process_text(' '.join(batch['text'])))
+    content_batches.append(batch.drop(columns='text'))
+content_df = pd.concat(content_batches, ignore_index=True)
 
 # Parse the publish_date with time zone handling
 content_df['publish_date'] = pd.to_datetime(content_df['publish_date'], utc=True)
@@ -18,9 +31,6 @@ content_df['publish_date'] = pd.to_datetime(content_df['publish_date'], utc=True
 # (Optional) Remove the time zone if not needed
 content_df['publish_date'] = content_df['publish_date'].dt.tz_localize(None)
 
-# Merge content_df with links_df to get the newspaper name
-content_df = pd.merge(content_df, links_df[['id', 'newspaper']], on='id')
-
 # 1. Newspaper Contribution
 plt.figure(figsize=(10, 6))
 links_df['newspaper'].value_counts().plot(kind='bar', color='skyblue')
@@ -44,8 +54,7 @@ plt.savefig('Scraping/src/visualizations/Pre_Cleaning/publication_dates_before.p
 plt.show()
 
 # 3. Article Lengths by Newspaper
-# Calculate article lengths
-content_df['text_length'] = content_df['text'].str.split().apply(len)
+# Article lengths (computed while streaming the texts)
 
 # Calculate outlier boundaries using IQR method
 def get_outlier_bounds(df, column):
@@ -104,9 +113,8 @@ plt.savefig('Scraping/src/visualizations/Pre_Cleaning/article_lengths_outliers.p
             bbox_inches='tight', dpi=300)
 plt.show()
 
-# 4. Word Cloud
-all_text = ' '.join(content_df['text'])
-wordcloud = WordCloud(width=800, height=400, background_color='white').generate(all_text)
+# 4. Word Cloud (from the word frequencies of all batches)
+wordcloud = WordCloud(width=800, height=400, background_color='white').generate_from_frequencies(word_frequencies)
 plt.figure(figsize=(10, 6))
 plt.imshow(wordcloud, interpolation='bilinear')
 plt.axis('off')
@@ -115,4 +123,4 @@ plt.savefig('Scraping/src/visualizations/Pre_Cleaning/wordcloud_raw_before.png')
 plt.show()
 
 # Close the database connection
-conn.close()
+storage.close_connections()
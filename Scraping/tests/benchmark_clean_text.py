@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+import random
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Models'))
+import preprocessing
+
+# Size of the scraped corpus (one article per link in all_links.csv) and the 100x synthetic one
+REAL_SIZE = 4000
+SCALES = [REAL_SIZE, REAL_SIZE * 100]
+if len(sys.argv) > 1:
+    SCALES = [int(arg) for arg in sys.argv[1:]]
+
+WORDS = ["La", "inmigración", "en", "España", "es", "un", "tema", "de", "debate", "según", "el", "Gobierno",
+         "los", "migrantes", "llegaron", "a", "Canarias", "por", "ACNUR", "niños", "pateras", "año", "más"]
+EXTRAS = ["2024", "15.000", "https://elpais.com/noticia.html", "www.abc.es/espana", "(Europa Press)",
+          "«refugiados»", "—dijo—", "¿cuántos?", "¡basta!", "100%", "COVID-19", "e-mail", "señor_a"]
+
+# Row-by-row cleaning as it was before the batch engine (reference)
+def legacy_clean(texts):
+    return [preprocessing.remove_stopwords(preprocessing.clean_text(text)) for text in texts]
+
+def synthetic_corpus(n_texts, words_per_text=300, seed=0):
+    rng = random.Random(seed)
+    vocabulary = WORDS * 4 + EXTRAS
+    return [' '.join(rng.choice(vocabulary) for _ in range(words_per_text)) + rng.choice(['.', ' \n', '  '])
+            for _ in range(n_texts)]
+
+for n_texts in SCALES:
+    texts = pd.Series(synthetic_corpus(n_texts))
+
+    start = time.perf_counter()
+    reference = legacy_clean(texts)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sequential = preprocessing.clean_texts(texts, workers=1)
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel = preprocessing.clean_texts(texts)
+    parallel_time = time.perf_counter() - start
+
+    identical = reference == sequential == parallel
+    print(f"{n_texts} texts: legacy {legacy_time:.2f}s, fused {sequential_time:.2f}s "
+          f"({legacy_time / sequential_time:.1f}x), fused + pool {parallel_time:.2f}s "
+          f"({legacy_time / parallel_time:.1f}x), identical output: {identical}")
@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'pipelines'))
+import cleaning_data
+import storage
+
+# The row-by-row reference is only run on the small corpus
+SMALL, LARGE = 20_000, 1_000_000
+if len(sys.argv) > 1:
+    SMALL, LARGE = int(sys.argv[1]), int(sys.argv[2])
+
+NEWSPAPERS = ["el_pais", "el_mundo", "ABC", "20_minutos", "la_vanguardia"]
+
+# Cleaning as it was before the set-based engine (reference)
+def legacy_clean(handler):
+    df = pd.read_sql_query("""
+        SELECT content.id, content.text, content.publish_date, links.newspaper
+        FROM content JOIN links ON content.id = links.id
+    """, sqlite3.connect(handler.db_path))
+
+    null_ids = tuple(df.loc[df['publish_date'].isna(), 'id'].tolist())
+    conn = sqlite3.connect(handler.db_path)
+    cursor = conn.cursor()
+    if null_ids:
+        null_ids = f"({null_ids[0]})" if len(null_ids) == 1 else null_ids
+        cursor.execute(f"DELETE FROM content WHERE id IN {null_ids}")
+        cursor.execute(f"DELETE FROM links WHERE id IN {null_ids}")
+        conn.commit()
+    df = df.dropna(subset=['publish_date'])
+
+    for _, row in df.iterrows():
+        formatted_date = pd.to_datetime(row['publish_date']).strftime('%Y-%m-%d')
+        cursor.execute('UPDATE content SET publish_date = ? WHERE id = ?', (formatted_date, row['id']))
+    conn.commit()
+
+    df["word_count"] = df["text"].apply(lambda x: len(x.split()))
+    df["char_count"] = df["text"].apply(len)
+    q1, q3 = df["word_count"].quantile(0.25), df["word_count"].quantile(0.75)
+    df["outlier"] = ~df["word_count"].between(q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1))
+
+    cursor.executemany("UPDATE content SET outlier = ? WHERE id = ?", df[["outlier", "id"]].values.tolist())
+    cursor.execute("DELETE FROM content WHERE outlier = 1")
+    conn.commit()
+    conn.close()
+
+def engine_clean(handler, per_newspaper=False):
+    df = handler.fetch_data()
+    df = handler.format_time(df)
+    df = handler.detect_outliers(df, by="newspaper" if per_newspaper else None)
+    handler.remove_outliers(df)
+
+def build_database(db_path, n_articles, seed=0):
+    rng = random.Random(seed)
+    conn = storage.get_connection(db_path)
+    conn.executemany('INSERT INTO links (id, newspaper, url) VALUES (?, ?, ?)',
+                     ((i, NEWSPAPERS[i % 5], f"https://example.com/{i}") for i in range(1, n_articles + 1)))
+    conn.executemany('INSERT INTO content (id, title, publish_date, text) VALUES (?, ?, ?, ?)', (
+        (i, f"Titular {i}",
+         None if rng.random() < 0.02 else f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00+01:00",
+         ' '.join(["x"] * int(rng.lognormvariate(5, 0.6))))
+        for i in range(1, n_articles + 1)))
+    conn.commit()
+
+def timed(label, clean, db_path):
+    handler = cleaning_data.DatabaseOutlierHandler(db_path, "content", "links")
+    start = time.perf_counter()
+    clean(handler)
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {elapsed:.2f}s")
+    return elapsed
+
+def content_state(db_path):
+    return sqlite3.connect(db_path).execute('SELECT id, publish_date FROM content ORDER BY id').fetchall()
+
+tmp_dir = tempfile.mkdtemp()
+for name, size in [("legacy", SMALL), ("engine", SMALL), ("large", LARGE), ("per_newspaper", LARGE)]:
+    build_database(os.path.join(tmp_dir, f"{name}.db"), size)
+
+legacy_time = timed(f"legacy, {SMALL} articles", legacy_clean, os.path.join(tmp_dir, "legacy.db"))
+engine_time = timed(f"engine, {SMALL} articles", engine_clean, os.path.join(tmp_dir, "engine.db"))
+print(f"Speedup: {legacy_time / engine_time:.1f}x, same content table: "
+      f"{content_state(os.path.join(tmp_dir, 'legacy.db')) == content_state(os.path.join(tmp_dir, 'engine.db'))}")
+
+timed(f"engine, {LARGE} articles", engine_clean, os.path.join(tmp_dir, "large.db"))
+timed(f"engine with per-newspaper bounds, {LARGE} articles",
+      lambda handler: engine_clean(handler, per_newspaper=True), os.path.join(tmp_dir, "per_newspaper.db"))
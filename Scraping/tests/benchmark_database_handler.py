@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'pipelines'))
+import database_handler
+
+N_ARTICLES = 100_000
+
+# Row-by-row loaders as they were before the bulk path (reference)
+def legacy_insert_links(csv_file, db_path):
+    df = pd.read_csv(csv_file)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    for _, row in df.iterrows():
+        cursor.execute('INSERT OR IGNORE INTO links (newspaper, url) VALUES (?, ?)', (row['Newspaper'], row['Link']))
+    conn.commit()
+    conn.close()
+
+def legacy_insert_content(csv_file, db_path):
+    df = pd.read_csv(csv_file, sep=';')
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    for _, row in df.iterrows():
+        cursor.execute('SELECT id FROM links WHERE url = ?', (row['URL'],))
+        url_id = cursor.fetchone()
+        if url_id is None:
+            continue
+        cursor.execute('INSERT OR IGNORE INTO content (id, title, publish_date, text) VALUES (?, ?, ?, ?)',
+                       (url_id[0], row['Title'], row['Date'], row['Text']))
+    conn.commit()
+    conn.close()
+
+# Synthetic corpus with the shape of all_links.csv / all_content.csv
+tmp_dir = tempfile.mkdtemp()
+links_csv = os.path.join(tmp_dir, "all_links.csv")
+content_csv = os.path.join(tmp_dir, "all_content.csv")
+
+newspapers = ["el_pais", "el_mundo", "ABC", "20_minutos", "la_vanguardia"]
+links = pd.DataFrame({
+    "ID": range(1, N_ARTICLES + 1),
+    "Newspaper": [newspapers[i % 5] for i in range(N_ARTICLES)],
+    "Link": [f"https://example.com/noticia/{i}.html" for i in range(N_ARTICLES)],
+})
+links.to_csv(links_csv, index=False)
+pd.DataFrame({
+    "ID": links["ID"],
+    "Newspaper": links["Newspaper"],
+    "URL": links["Link"],
+    "Title": [f"Titular {i}" for i in range(N_ARTICLES)],
+    "Date": "2024-01-01T10:00:00+01:00",
+    "Text": "La inmigración en España es un tema de debate. " * 20,
+}).to_csv(content_csv, index=False, encoding="utf-8-sig", sep=";")
+
+results = {}
+for name, load_links, load_content in [
+    ("legacy", legacy_insert_links, legacy_insert_content),
+    ("bulk", database_handler.insert_links, database_handler.insert_content),
+]:
+    db_path = os.path.join(tmp_dir, f"{name}.db")
+    database_handler.initialize_database(db_path)
+
+    start = time.perf_counter()
+    load_links(links_csv, db_path)
+    load_content(content_csv, db_path)
+    results[name] = time.perf_counter() - start
+
+    count = sqlite3.connect(db_path).execute('SELECT COUNT(*) FROM content').fetchone()[0]
+    print(f"{name}: loaded {count} articles in {results[name]:.2f}s")
+
+print(f"Speedup: {results['legacy'] / results['bulk']:.1f}x")
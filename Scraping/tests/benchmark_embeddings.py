@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+import random
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Models'))
+import embeddings
+from gensim.models import Word2Vec
+
+N_ARTICLES = 20_000
+if len(sys.argv) > 1:
+    N_ARTICLES = int(sys.argv[1])
+
+# Per-token averaging as it was in the notebooks (reference)
+def get_article_vector(tokens, model):
+    vectors = [model.wv[word] for word in tokens if word in model.wv]
+    if len(vectors) > 0:
+        return np.mean(vectors, axis=0)
+    else:
+        return np.zeros(model.vector_size)
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+rng = random.Random(0)
+vocabulary = [f"palabra{i}" for i in range(20_000)]
+weights = [1 / (rank + 1) for rank in range(len(vocabulary))]  # Zipf-like word frequencies
+# Split once, as df["tokens"] in the notebooks
+tokens = [rng.choices(vocabulary, weights, k=rng.randint(100, 600)) for _ in range(N_ARTICLES)]
+
+model, train_time = timed(lambda: Word2Vec(sentences=tokens[:2000], vector_size=100, window=5, min_count=5, workers=1, epochs=1))
+print(f"Word2Vec trained on 2000 articles in {train_time:.2f}s ({len(model.wv.key_to_index)} words)")
+
+legacy, legacy_time = timed(lambda: np.vstack([get_article_vector(article, model) for article in tokens]))
+vectorized, vectorized_time = timed(lambda: embeddings.document_vectors(tokens, model.wv))
+print(f"{N_ARTICLES} articles: per-token loop {legacy_time:.2f}s, ids + sparse product {vectorized_time:.2f}s "
+      f"({legacy_time / vectorized_time:.1f}x), same vectors: {np.allclose(legacy, vectorized, atol=1e-5)}")
+
+# Words mapped to ids once, then reused for the IDF and for both weightings
+counts, ids_time = timed(lambda: embeddings.token_count_matrix(tokens, model.wv.key_to_index))
+_, mean_time = timed(lambda: embeddings.weighted_mean(counts, model.wv.vectors))
+idf, idf_time = timed(lambda: embeddings.DocumentFrequency(len(model.wv.key_to_index))
+                      .partial_fit(embeddings.idf_counts(counts)).idf().astype(np.float32))
+_, tfidf_time = timed(lambda: embeddings.weighted_mean(counts, model.wv.vectors, idf))
+print(f"With the ids mapped once ({ids_time:.2f}s): mean {mean_time:.2f}s ({legacy_time / mean_time:.0f}x), "
+      f"IDF fit {idf_time:.2f}s, TF-IDF weighted mean {tfidf_time:.2f}s")
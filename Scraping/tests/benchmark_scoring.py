@@ -0,0 +1,30 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Models'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'pipelines'))
+import storage
+import artifacts
+from feature_store import FeatureStore
+
+# Usage: benchmark_scoring.py [db_path] [registry_dir]
+db_path = sys.argv[1] if len(sys.argv) > 1 else 'data/processed/articles.db'
+registry = artifacts.ArtifactRegistry(sys.argv[2] if len(sys.argv) > 2 else artifacts.REGISTRY_DIR)
+
+start = time.perf_counter()
+artifacts.fit_artifacts(db_path, registry, FeatureStore('data/features'))
+fit_time = time.perf_counter() - start
+
+start = time.perf_counter()
+scorer = artifacts.ArticleScorer(registry)
+load_time = time.perf_counter() - start
+
+ids = [row[0] for row in storage.get_connection(db_path).execute('SELECT id FROM content ORDER BY id DESC LIMIT 1000')]
+for n_articles in [1, 10, len(ids)]:
+    start = time.perf_counter()
+    artifacts.score_articles(ids[:n_articles], db_path, scorer=scorer)
+    elapsed = time.perf_counter() - start
+    print(f"{n_articles} articles scored in {elapsed * 1000:.1f} ms")
+
+print(f"Fit (or reuse) of the artifacts {fit_time:.2f}s, loading them {load_time * 1000:.1f} ms")
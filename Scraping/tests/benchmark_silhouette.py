@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+from sklearn.datasets import make_blobs
+from sklearn.metrics import silhouette_score
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Models'))
+import cluster_evaluation
+
+# sklearn's silhouette_score is only run up to SKLEARN_LIMIT samples
+EXACT_SIZES = [2_000, 5_000, 10_000, 20_000]
+SAMPLED_SIZES = [100_000, 1_000_000]
+SKLEARN_LIMIT = 10_000
+N_FEATURES, N_CLUSTERS = 100, 5
+
+# Runs a function and returns (result, seconds, peak MB allocated during the call)
+def measured(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def dataset(n_samples):
+    X, labels = make_blobs(n_samples, n_features=N_FEATURES, centers=N_CLUSTERS, cluster_std=4, random_state=0)
+    return X.astype(np.float32), labels
+
+for n_samples in EXACT_SIZES:
+    X, labels = dataset(n_samples)
+    exact, exact_time, exact_memory = measured(lambda: cluster_evaluation.silhouette_score_chunked(X, labels))
+    sampled, sampled_time, sampled_memory = measured(lambda: cluster_evaluation.silhouette_score_sampled(X, labels))
+    line = (f"n={n_samples}: chunked exact {exact:.4f} in {exact_time:.2f}s / {exact_memory:.0f} MB, "
+            f"sampled {sampled['silhouette']:.4f} [{sampled['silhouette_low']:.4f}, {sampled['silhouette_high']:.4f}] "
+            f"in {sampled_time:.2f}s / {sampled_memory:.0f} MB")
+    if n_samples <= SKLEARN_LIMIT:
+        reference, reference_time, reference_memory = measured(lambda: silhouette_score(X, labels))
+        line += f", sklearn {reference:.4f} in {reference_time:.2f}s / {reference_memory:.0f} MB"
+    print(line)
+
+for n_samples in SAMPLED_SIZES:
+    X, labels = dataset(n_samples)
+    scores, elapsed, memory = measured(lambda: cluster_evaluation.evaluate_clustering(X, labels, mode='sampled'))
+    print(f"n={n_samples}: sampled silhouette {scores['silhouette']:.4f} "
+          f"[{scores['silhouette_low']:.4f}, {scores['silhouette_high']:.4f}], "
+          f"Davies-Bouldin {scores['davies_bouldin']:.4f}, Calinski-Harabasz {scores['calinski_harabasz']:.0f} "
+          f"in {elapsed:.2f}s / {memory:.0f} MB")
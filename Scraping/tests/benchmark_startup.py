@@ -0,0 +1,44 @@
+import os
+import sys
+import subprocess
+import statistics
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+SCRAPERS = os.path.join(ROOT, 'Scraping', 'src', 'scrapers')
+PIPELINES = os.path.join(ROOT, 'Scraping', 'src', 'pipelines')
+MODELS = os.path.join(ROOT, 'Models')
+RUNS = 5
+
+# Entry points: (name, directory of the script, module). Models/preprocessing and
+# pipelines/preprocessing share a module name, so each one is imported from its own directory.
+ENTRY_POINTS = [
+    ("url_scraper", SCRAPERS, "url_scraper"),
+    ("content_scraper", SCRAPERS, "content_scraper"),
+    ("database_handler", PIPELINES, "database_handler"),
+    ("stream_pipeline", PIPELINES, "stream_pipeline"),
+    ("pipelines/preprocessing", PIPELINES, "preprocessing"),
+    ("Models/preprocessing", MODELS, "preprocessing"),
+]
+
+# Measures the import in a fresh interpreter, so nothing is cached between runs
+IMPORT_SNIPPET = '''
+import sys, time
+sys.path.insert(0, {directory!r})
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+'''
+
+def import_time(directory, module):
+    result = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET.format(directory=directory, module=module)],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+for name, directory, module in ENTRY_POINTS:
+    try:
+        times = [import_time(directory, module) for _ in range(RUNS)]
+        print(f"{name}: import {statistics.median(times) * 1000:.0f} ms (median of {RUNS})")
+    except RuntimeError as e:
+        print(f"{name}: import failed ({e})")
@@ -0,0 +1,38 @@
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from sklearn.datasets import make_blobs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Models'))
+import streaming_clustering
+from feature_store import FeatureStore
+
+SIZES = [10_000, 100_000, 1_000_000]
+if len(sys.argv) > 1:
+    SIZES = [int(arg) for arg in sys.argv[1:]]
+
+store = FeatureStore(tempfile.mkdtemp())
+for n_samples in SIZES:
+    # Three bias-like features (sentiment, pro and anti scores) in two groups
+    X, _ = make_blobs(n_samples, n_features=3, centers=2, cluster_std=2.5, random_state=0)
+    store.save("bias", np.arange(n_samples), X)
+    matrix = store.load("bias")[1]
+
+    start = time.perf_counter()
+    model = streaming_clustering.StreamingKMeans(n_clusters=2).fit(matrix)
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.predict(matrix[:1000])
+    assign_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    quality = streaming_clustering.compare_with_full_batch(matrix, model)
+    full_time = time.perf_counter() - start
+
+    print(f"n={n_samples}: streaming fit {fit_time:.2f}s, 1000 new articles assigned in {assign_time * 1000:.1f} ms, "
+          f"full-batch KMeans (+ comparison) {full_time:.2f}s, ARI {quality['adjusted_rand']:.4f}, "
+          f"NMI {quality['normalized_mutual_info']:.4f}, inertia {quality['streaming_inertia']:.1f} "
+          f"vs {quality['full_batch_inertia']:.1f}")
@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'pipelines'))
+import preprocessing
+import storage
+
+N_ARTICLES = 4000
+
+# Optional local vocab.txt, to run the benchmark without downloading the BERT model
+if len(sys.argv) > 1:
+    from transformers import BertTokenizer, BertTokenizerFast
+    slow_tokenizer = BertTokenizer(sys.argv[1], do_lower_case=False)
+    fast_tokenizer = BertTokenizerFast(sys.argv[1], do_lower_case=False)
+    preprocessing.get_tokenizer = lambda: slow_tokenizer
+    preprocessing.get_fast_tokenizer = lambda: fast_tokenizer
+
+# Tokenization as it was before the batched stage (reference): lengths from
+# truncate_text + encode_plus + tokenize, then truncate_text + tokenize again for
+# the tokens column, with one UPDATE per row
+def legacy_tokenization(df, conn):
+    tokenizer = preprocessing.get_tokenizer()
+    token_lengths = []
+    for text in df['text']:
+        truncated_text = preprocessing.truncate_text(text)
+        tokenizer.encode_plus(truncated_text, add_special_tokens=True, max_length=512,
+                              truncation=True, padding='max_length')
+        token_lengths.append(len(tokenizer.tokenize(truncated_text)))
+
+    cursor = conn.cursor()
+    for row in df.itertuples(index=False):
+        truncated_text = preprocessing.truncate_text(row.text)
+        tokens_str = ','.join(tokenizer.tokenize(truncated_text))
+        cursor.execute('UPDATE content SET truncated_text = ?, tokens = ? WHERE id = ?', (truncated_text, tokens_str, row.id))
+    conn.commit()
+    return token_lengths
+
+WORDS = ["La", "inmigración", "en", "España", "es", "un", "tema", "de", "debate", "según", "el", "Gobierno",
+         "los", "migrantes", "llegaron", "a", "Canarias", "por", "ACNUR", "niños", "pateras", "año", "más",
+         "2024", "«refugiados»", "¿cuántos?", "COVID-19"]
+rng = random.Random(0)
+df = pd.DataFrame({
+    "id": range(1, N_ARTICLES + 1),
+    "text": [' '.join(rng.choice(WORDS) for _ in range(rng.randint(50, 900))) for _ in range(N_ARTICLES)],
+})
+
+tmp_dir = tempfile.mkdtemp()
+for name in ["legacy", "batched"]:
+    conn = storage.get_connection(os.path.join(tmp_dir, f"{name}.db"))
+    conn.executemany('INSERT INTO links (id, newspaper, url) VALUES (?, ?, ?)',
+                     [(i, "el_pais", f"https://example.com/{i}") for i in df['id']])
+    conn.executemany('INSERT INTO content (id, text) VALUES (?, ?)', df[['id', 'text']].values.tolist())
+    conn.commit()
+
+start = time.perf_counter()
+legacy_tokenization(df, storage.get_connection(os.path.join(tmp_dir, "legacy.db")))
+legacy_time = time.perf_counter() - start
+
+start = time.perf_counter()
+batched_conn = storage.get_connection(os.path.join(tmp_dir, "batched.db"))
+preprocessing.update_tokens_column(batched_conn, df)
+batched_time = time.perf_counter() - start
+
+legacy_text = sqlite3.connect(os.path.join(tmp_dir, "legacy.db")).execute('SELECT truncated_text FROM content ORDER BY id').fetchall()
+batched_text = batched_conn.execute('SELECT truncated_text FROM content ORDER BY id').fetchall()
+print(f"{N_ARTICLES} articles: legacy {legacy_time:.2f}s, batched {batched_time:.2f}s "
+      f"({legacy_time / batched_time:.1f}x), same truncated_text: {legacy_text == batched_text}")
@@ -0,0 +1,101 @@
+import os
+import sys
+import tempfile
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'scrapers'))
+import content_scraper
+
+# Local stub of the newspaper article pages:
+#   /article-<n>.html -> article page with an ETag (304 when If-None-Match matches)
+#   /missing-<n>.html -> 404
+def article_page(number):
+    paragraphs = ''.join(f"<p>Párrafo {i} del artículo {number}: el ayuntamiento presentó ayer un informe sobre "
+                         f"la acogida de personas refugiadas y los servicios sociales del municipio.</p>" for i in range(6))
+    return (f"<html><head><title>Artículo {number}</title>"
+            f'<meta property="article:published_time" content="2024-03-{number + 1:02d}T10:00:00+00:00">'
+            f"</head><body><h1>Artículo {number}</h1><article>{paragraphs}</article></body></html>").encode("utf-8")
+
+
+requests_seen = Counter()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        requests_seen[self.path] += 1
+        name = self.path.strip("/")
+
+        if not name.startswith("article-"):
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        number = int(name[len("article-"):-len(".html")])
+        etag = f'"v{number}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = article_page(number)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    workdir = tempfile.mkdtemp()
+    links = [(i, "site_a" if i % 2 else "site_b", f"{base}/{'missing' if i % 5 == 4 else 'article'}-{i}.html") for i in range(20)]
+    csv_file = os.path.join(workdir, "all_links.csv")
+    pd.DataFrame(links, columns=["ID", "Newspaper", "Link"]).to_csv(csv_file, index=False)
+
+    def read_outputs(output_dir):
+        content = pd.read_csv(os.path.join(output_dir, "all_content.csv"), sep=";", encoding="utf-8-sig")
+        errors = pd.read_csv(os.path.join(output_dir, "errors.csv"), encoding="utf-8-sig")
+        return content, errors
+
+    # Sequential scrape (reference)
+    content_scraper.scrape_content(csv_file, os.path.join(workdir, "sequential"))
+    sequential = read_outputs(os.path.join(workdir, "sequential"))
+
+    # Parallel scrape
+    content_scraper.scrape_content_parallel(csv_file, os.path.join(workdir, "parallel"), download_workers=4, parse_workers=2)
+    parallel = read_outputs(os.path.join(workdir, "parallel"))
+
+    if sequential[0].equals(parallel[0]) and sequential[1].equals(parallel[1]):
+        print(f"{len(parallel[0])} articles and {len(parallel[1])} errors, parallel scrape matches sequential scrape.")
+    else:
+        print(f"Mismatch:\n sequential=\n{sequential[0]}\n{sequential[1]}\n parallel=\n{parallel[0]}\n{parallel[1]}")
+
+    # Checkpointed scrape: the first run requests every URL, a rerun without retries
+    # requests none and a revalidating rerun only gets 304s, with the same outputs
+    checkpoint_db = os.path.join(workdir, "checkpoint.db")
+    runs = {}
+    for run, options in [("first", {}), ("resume", {"retry_failed": False}), ("revalidate", {"retry_failed": False, "revalidate": True})]:
+        requests_seen.clear()
+        output_dir = os.path.join(workdir, run)
+        content_scraper.scrape_content_parallel(csv_file, output_dir, download_workers=4, parse_workers=2,
+                                                checkpoint_db=checkpoint_db, **options)
+        runs[run] = (sum(requests_seen.values()), read_outputs(output_dir))
+
+    expected_requests = {"first": len(links), "resume": 0, "revalidate": sum(1 for _, _, url in links if "/article-" in url)}
+    for run, (requests_made, (content, errors)) in runs.items():
+        if requests_made == expected_requests[run] and content.equals(sequential[0]) and errors.equals(sequential[1]):
+            print(f"{run} run: {requests_made} requests, checkpointed scrape matches sequential scrape.")
+        else:
+            print(f"Mismatch in the {run} run: {requests_made} requests (expected {expected_requests[run]})\n{content}\n{errors}")
+
+    server.shutdown()
@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Models'))
+from feature_store import FeatureStore, export_token_ids
+import storage
+
+store = FeatureStore(tempfile.mkdtemp())
+rng = np.random.default_rng(0)
+
+# Feature stored in a shuffled id order, with gaps in the ids
+ids = rng.permutation(np.arange(1, 3001) * 3)
+matrix = rng.random((len(ids), 16), dtype=np.float32)
+store.save("word2vec", ids, matrix)
+reference = pd.DataFrame(matrix, index=ids)
+
+# take returns the rows of the requested ids in the requested order (reference: DataFrame.loc)
+requested = rng.choice(ids, size=500)
+if np.array_equal(store.take("word2vec", requested), reference.loc[requested].to_numpy()):
+    print(f"take of {len(requested)} ids (with repeats) matches DataFrame.loc.")
+else:
+    print("Mismatch between take and DataFrame.loc.")
+
+stored_ids, stored = store.load("word2vec")
+if np.array_equal(stored_ids, ids) and np.array_equal(stored, matrix) and isinstance(stored, np.memmap):
+    print("load returns the saved ids and the memory-mapped matrix.")
+else:
+    print("Mismatch between load and save.")
+
+# Ids that are not stored raise KeyError, including ids past the last stored one
+not_raised = []
+for missing in (4, ids.max() + 3, 0):
+    try:
+        store.take("word2vec", np.append(requested[:3], missing))
+        not_raised.append(int(missing))
+    except KeyError:
+        pass
+if not_raised:
+    print(f"Mismatch: take did not raise for the missing ids {not_raised}")
+else:
+    print("take raises KeyError for ids that are not stored.")
+
+# A column of vectors (df["vector"]) is stored as the same matrix
+store.save("vectors", ids, pd.Series(list(matrix)))
+if np.array_equal(store.take("vectors", requested), store.take("word2vec", requested)):
+    print("A column of vectors is stored as the same matrix.")
+else:
+    print("Mismatch between a column of vectors and its matrix.")
+
+# export_token_ids pads/cuts the token_ids BLOBs of the database to the feature width
+db_path = os.path.join(store.root, "articles.db")
+conn = storage.get_connection(db_path)
+tokens = {i: rng.integers(1, 30000, size=rng.integers(0, 20), dtype=np.int32) for i in range(1, 201)}
+with conn:
+    conn.executemany('INSERT INTO links (id, newspaper, url) VALUES (?, ?, ?)', [(i, "site_a", f"https://example.com/{i}") for i in tokens])
+    conn.executemany('INSERT INTO content (id, token_ids) VALUES (?, ?)', [(i, token_ids.tobytes()) for i, token_ids in tokens.items()])
+export_token_ids(db_path, store, width=12, chunk_size=64)
+
+content_ids = list(tokens)[::-1]
+expected = np.array([np.pad(tokens[i][:12], (0, 12 - len(tokens[i][:12]))) for i in content_ids])
+lengths = np.array([[min(len(tokens[i]), 12)] for i in content_ids])
+if np.array_equal(store.take("token_ids", content_ids), expected) and np.array_equal(store.take("token_ids_length", content_ids), lengths):
+    print(f"export_token_ids stored the padded token ids of {len(tokens)} articles.")
+else:
+    print("Mismatch in export_token_ids.")
+
+storage.close_connections()
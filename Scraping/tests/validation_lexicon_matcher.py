@@ -0,0 +1,80 @@
+import os
+import sys
+import random
+from collections import Counter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Models'))
+from lexicon_matcher import load_matcher
+
+matcher = load_matcher()
+entries = [entry.split() for entry in matcher.entries]
+
+#Function to match a text by brute force: at every word, the longest entry starting there (reference)
+def reference_matches(text):
+    words = text.split()
+    matches = []
+    i = 0
+    while i < len(words):
+        found = [index for index, entry in enumerate(entries) if words[i:i + len(entry)] == entry]
+        if found:
+            longest = max(found, key=lambda index: len(entries[index]))
+            matches.append(longest)
+            i += len(entries[longest])
+        else:
+            i += 1
+    return matches
+
+# Known cases: the longest entry wins and is counted once
+cases = {
+    "derechos humanos de los refugiados": Counter({"derechos humanos": 1}),
+    "derechos y derechos humanos": Counter({"derechos": 1, "derechos humanos": 1}),
+    "marea migratoria y marea alta": Counter({"marea migratoria": 1}),
+    "seguridad social seguridad crisis crisis": Counter({"seguridad social": 1, "crisis": 2}),
+    "problema migratorio": Counter({"problema migratorio": 1}),
+    "migratorio problema": Counter(),
+}
+for text, expected in cases.items():
+    counts = matcher.count(text)
+    if counts != expected:
+        print(f"Mismatch for '{text}':\n expected={dict(expected)}\n matcher={dict(counts)}")
+print(f"Checked {len(cases)} known cases.")
+
+# Random texts mixing single and multi-word entries, their prefixes and filler words
+random.seed(0)
+vocabulary = [word for entry in entries for word in entry] + ["gobierno", "ciudad", "informe", "ayer", "marea", "problema"]
+texts = [' '.join(random.choices(vocabulary, k=random.randint(0, 60))) for _ in range(2000)]
+
+reference = [Counter(reference_matches(text)) for text in texts]
+matched = [Counter(matcher.match_ids(text)) for text in texts]
+if reference == matched:
+    print(f"{len(texts)} texts, trie matching matches the brute-force longest match.")
+else:
+    first = next(i for i in range(len(texts)) if reference[i] != matched[i])
+    print(f"Mismatch for '{texts[first]}':\n reference={reference[first]}\n matcher={matched[first]}")
+
+# The batch outputs agree with the per-text counts
+matrix = matcher.count_matrix(texts)
+frame = matcher.count_frame(texts)
+matrix_counts = [Counter({matcher.entries[entry]: count for entry, count in zip(row.indices, row.data)}) for row in matrix]
+frame_counts = [{category: row[f"{category}_count"] for category in matcher.categories} for _, row in frame.iterrows()]
+if matrix_counts == matcher.count_batch(texts) and frame_counts == [matcher.count_categories(text) for text in texts]:
+    print("count_matrix and count_frame match count and count_categories.")
+else:
+    print("Mismatch between the batch and the per-text counts.")
+
+# Texts without multi-word entries: the articles with hits are the ones the notebook's
+# lexicon_analysis (set of words) found, per category
+single_words = {category: {entry for entry, entry_category in zip(matcher.entries, matcher.entry_category)
+                           if entry_category == category and ' ' not in entry} for category in matcher.categories}
+multi_word = {word for entry in entries if len(entry) > 1 for word in entry}
+filler = [word for word in vocabulary if word not in multi_word]
+texts = [' '.join(random.choices(filler, k=random.randint(0, 60))) for _ in range(2000)]
+notebook = [{category: sum(word in words for word in set(text.split())) for category, words in single_words.items()} for text in texts]
+distinct = [{category: 0 for category in matcher.categories} for _ in texts]
+for row, counts in zip(distinct, matcher.count_batch(texts)):
+    for entry in counts:
+        row[matcher.entry_category[matcher.entries.index(entry)]] += 1
+if notebook == distinct:
+    print(f"{len(texts)} texts, distinct hits match the notebook's lexicon_analysis.")
+else:
+    print("Mismatch with the notebook's lexicon_analysis.")
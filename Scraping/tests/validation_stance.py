@@ -0,0 +1,121 @@
+import os
+import sys
+import random
+import tempfile
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Models'))
+import preprocessing
+import stance
+import storage
+from lexicon_matcher import load_matcher
+
+matcher = load_matcher()
+pro_immigration_list = [entry for entry, category in zip(matcher.entries, matcher.entry_category) if category == stance.PRO_CATEGORY]
+anti_immigration_list = [entry for entry, category in zip(matcher.entries, matcher.entry_category) if category == stance.ANTI_CATEGORY]
+
+#Function to score the stance as the notebook did (TfidfVectorizer over the lexicon, reference)
+def notebook_stance(texts):
+    df = pd.DataFrame({"clean_text": list(texts)})
+    vectorizer = TfidfVectorizer(vocabulary=pro_immigration_list + anti_immigration_list)
+    tfidf_matrix = vectorizer.fit_transform(df["clean_text"])
+    tfidf_df = pd.DataFrame(tfidf_matrix.toarray(), columns=vectorizer.get_feature_names_out())
+    df = pd.concat([df.reset_index(drop=True), tfidf_df.reset_index(drop=True)], axis=1)
+
+    df["pro_immigration_tfidf"] = df[pro_immigration_list].sum(axis=1)
+    df["anti_immigration_tfidf"] = df[anti_immigration_list].sum(axis=1)
+
+    def detect_stance_tfidf(pro_score, anti_score):
+        if pro_score > anti_score:
+            return "PRO"
+        elif anti_score > pro_score:
+            return "ANTI"
+        else:
+            return "NEU"
+
+    df["stance_tfidf"] = df.apply(lambda row: detect_stance_tfidf(row["pro_immigration_tfidf"], row["anti_immigration_tfidf"]), axis=1)
+    return df[["pro_immigration_tfidf", "anti_immigration_tfidf", "stance_tfidf"]]
+
+#Function to compare stance scores with the notebook's
+def compare(label, scores, texts):
+    expected = notebook_stance(texts)
+    same_scores = np.allclose(scores["pro_immigration_tfidf"].to_numpy(dtype=float), expected["pro_immigration_tfidf"]) and \
+        np.allclose(scores["anti_immigration_tfidf"].to_numpy(dtype=float), expected["anti_immigration_tfidf"])
+    same_labels = scores["stance_tfidf"].tolist() == expected["stance_tfidf"].tolist()
+    if same_scores and same_labels:
+        labels = {label: int(count) for label, count in expected["stance_tfidf"].value_counts().items()}
+        print(f"{label}: {len(texts)} articles, stance matches the notebook {labels}.")
+    else:
+        print(f"{label}: mismatch with the notebook (scores equal: {same_scores}, labels equal: {same_labels})")
+
+# The notebook's TfidfVectorizer only sees single words, so the texts only hold single-word
+# entries (the multi-word ones are counted once by the matcher, see validation_lexicon_matcher)
+random.seed(0)
+single_words = [entry for entry in matcher.entries if ' ' not in entry]
+filler = ["gobierno", "ciudad", "informe", "ayuntamiento", "consejería", "municipio", "servicios", "vecinos"]
+
+#Function to generate an article text with a few lexicon words
+def random_text():
+    return ' '.join(random.choices(single_words, k=random.randint(0, 6)) + random.choices(filler, k=random.randint(1, 40)))
+
+# classify_stance labels as the notebook's detect_stance_tfidf, ties included
+pro, anti = np.array([0.0, 0.5, 0.2, 0.3]), np.array([0.0, 0.2, 0.5, 0.3])
+if stance.classify_stance(pro, anti).tolist() == ["NEU", "PRO", "ANTI", "NEU"]:
+    print("classify_stance matches detect_stance_tfidf.")
+else:
+    print(f"Mismatch in classify_stance: {stance.classify_stance(pro, anti).tolist()}")
+
+# In memory: streamed IDF (batches of 100) and sparse scoring
+texts = [random_text() for _ in range(1000)]
+document_frequency = stance.DocumentFrequency(len(matcher.entries))
+for start in range(0, len(texts), 100):
+    document_frequency.partial_fit(matcher.count_matrix(texts[start:start + 100]))
+compare("score_stance", stance.score_stance(texts, matcher, document_frequency.idf()), texts)
+
+# Fixture database: the incremental stage stores the notebook's scores, a second run
+# rescores nothing and editing one article only rematches that article
+db_path = os.path.join(tempfile.mkdtemp(), "articles.db")
+conn = storage.get_connection(db_path)
+with conn:
+    conn.executemany('INSERT INTO links (id, newspaper, url) VALUES (?, ?, ?)', [(i, "site_a", f"https://example.com/{i}") for i in range(1, 301)])
+    conn.executemany('INSERT INTO content (id, title, text) VALUES (?, ?, ?)', [(i, f"Noticia {i}", random_text()) for i in range(1, 301)])
+
+#Function to clean the new or changed articles and score their stance
+def run_stages():
+    for df in preprocessing.fetch_text_batches(conn, batch_size=128):
+        preprocessing.update_clean_columns(conn, df, workers=1)
+    stale = storage.count_stale(stance.STANCE_STAGE, stance.STANCE_VERSION, upstream=preprocessing.CLEAN_STAGE,
+                                config=stance.stage_config(matcher), db=conn)
+    rescored = stance.update_stance_columns(conn, matcher, batch_size=128)
+    stored = storage.read_frame('SELECT clean_text, pro_immigration_tfidf, anti_immigration_tfidf, stance_tfidf FROM content ORDER BY id', db=conn)
+    return stale, rescored, stored
+
+stale, rescored, stored = run_stages()
+compare(f"First run ({stale} stale, {rescored} rescored)", stored, stored["clean_text"])
+
+stale, rescored, stored = run_stages()
+if stale == rescored == 0:
+    print("Second run matched and rescored 0 articles.")
+else:
+    print(f"Mismatch in the second run: {stale} stale, {rescored} rescored")
+
+with conn:
+    conn.execute('UPDATE content SET text = text || ? WHERE id = ?', (" crisis invasión crisis", 42))
+stale, rescored, stored = run_stages()
+if stale == 1:
+    print(f"Editing one article made exactly that article stale ({rescored} rescored for the new IDF).")
+else:
+    print(f"Mismatch after editing one article: {stale} stale")
+compare("After the edit", stored, stored["clean_text"])
+
+# The stored counts are the ones of the whole corpus
+counts = conn.execute('SELECT SUM(count) FROM stance_counts').fetchone()[0]
+expected = matcher.count_matrix(stored["clean_text"]).sum()
+if counts == expected:
+    print(f"stance_counts holds the {expected} lexicon hits of the corpus.")
+else:
+    print(f"Mismatch in stance_counts: {counts} hits stored, {expected} in the corpus")
+
+storage.close_connections()
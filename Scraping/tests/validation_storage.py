@@ -0,0 +1,122 @@
+import os
+import sys
+import sqlite3
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Models'))
+import preprocessing
+import storage
+
+# Fixture database with the schema of the original database_handler (and the clean
+# columns the original preprocessing added with ALTER TABLE), before any migration
+db_path = os.path.join(tempfile.mkdtemp(), "articles.db")
+conn = sqlite3.connect(db_path)
+conn.executescript('''
+CREATE TABLE links (id INTEGER PRIMARY KEY AUTOINCREMENT, newspaper TEXT NOT NULL, url TEXT UNIQUE NOT NULL);
+CREATE TABLE content (
+    id INTEGER PRIMARY KEY,
+    title TEXT,
+    publish_date TEXT,
+    text TEXT,
+    FOREIGN KEY (id) REFERENCES links (id) ON DELETE CASCADE
+);
+ALTER TABLE content ADD COLUMN clean_text TEXT;
+ALTER TABLE content ADD COLUMN clean_title TEXT;
+''')
+articles = [(i, f"Noticia {i}: El Gobierno aprueba 3 medidas", "2024-03-01",
+             f"El ayuntamiento de la ciudad {i} presentó ayer (https://example.com/{i}) un informe sobre la acogida "
+             f"de {i * 10} personas refugiadas y los servicios sociales del municipio.") for i in range(1, 41)]
+conn.executemany('INSERT INTO links (id, newspaper, url) VALUES (?, ?, ?)',
+                 [(i, "site_a", f"https://example.com/{i}") for i, _, _, _ in articles])
+conn.executemany('INSERT INTO content (id, title, publish_date, text) VALUES (?, ?, ?, ?)', articles)
+conn.commit()
+conn.close()
+
+# Migrations: the schema reaches SCHEMA_VERSION, the rows are kept and a second run does nothing
+conn = storage.get_connection(db_path)
+user_version = conn.execute('PRAGMA user_version').fetchone()[0]
+kept = conn.execute('SELECT id, title, publish_date, text FROM content ORDER BY id').fetchall()
+schema = conn.execute('SELECT sql FROM sqlite_master ORDER BY name').fetchall()
+storage.migrate(conn)
+if user_version == storage.SCHEMA_VERSION and kept == articles and schema == conn.execute('SELECT sql FROM sqlite_master ORDER BY name').fetchall():
+    print(f"Migrated the fixture database to version {user_version}, {len(kept)} articles kept.")
+else:
+    print(f"Migration mismatch: version {user_version} (expected {storage.SCHEMA_VERSION}), {len(kept)} articles kept")
+
+#Function to run the clean stage and return the ids it processed
+def run_clean_stage():
+    processed = []
+    for df in preprocessing.fetch_text_batches(conn, batch_size=16):
+        preprocessing.update_clean_columns(conn, df, workers=1)
+        processed.extend(df['id'].tolist())
+    return processed
+
+#Function to compare the stored clean columns with the original cleaning (clean_text + remove_stopwords)
+def check_clean_columns(label):
+    rows = conn.execute('SELECT id, title, text, clean_title, clean_text FROM content ORDER BY id').fetchall()
+    mismatches = [article_id for article_id, title, text, clean_title, clean_text in rows
+                  if clean_text != preprocessing.remove_stopwords(preprocessing.clean_text(text))
+                  or clean_title != preprocessing.remove_stopwords(preprocessing.clean_text(title))]
+    if mismatches:
+        print(f"{label}: clean columns of the articles {mismatches} differ from the original cleaning.")
+    else:
+        print(f"{label}: clean columns match the original cleaning.")
+
+# First run: every article is stale and processed
+processed = run_clean_stage()
+if processed == [article[0] for article in articles]:
+    print(f"First run processed the {len(processed)} articles.")
+else:
+    print(f"Mismatch in the first run: processed {processed}")
+check_clean_columns("First run")
+
+# Second run: nothing changed, so nothing is stale
+processed = run_clean_stage()
+if not processed and storage.count_stale(preprocessing.CLEAN_STAGE, preprocessing.CLEAN_VERSION, db=conn) == 0:
+    print("Second run processed 0 articles.")
+else:
+    print(f"Mismatch in the second run: processed {processed}")
+
+# Downstream stage (lemmatization without spaCy): only its state is recorded
+lemma = storage.stale_rows(preprocessing.LEMMA_STAGE, preprocessing.LEMMA_VERSION, ['clean_text'], upstream=preprocessing.CLEAN_STAGE, db=conn)
+storage.mark_processed(preprocessing.LEMMA_STAGE, preprocessing.LEMMA_VERSION, lemma['id'], lemma['input_hash'], conn)
+
+# The content_hash trigger resets the hash of an edited article only, and only when its title/text changes
+hashes = dict(conn.execute('SELECT id, content_hash FROM content'))
+with conn:
+    conn.execute('UPDATE content SET publish_date = ? WHERE id = ?', ("2024-03-02", 7))
+    conn.execute('UPDATE content SET text = text || ? WHERE id = ?', (" Actualización: la consejería amplía las plazas.", 12))
+reset = [article_id for article_id, article_hash in conn.execute('SELECT id, content_hash FROM content ORDER BY id') if article_hash != hashes[article_id]]
+if reset == [12]:
+    print("content_hash_reset trigger reset the hash of the edited article only.")
+else:
+    print(f"Mismatch in the content_hash trigger: reset hashes of {reset}")
+
+# Editing one article marks exactly that row stale, then exactly that row downstream once it is cleaned again
+stale = storage.stale_rows(preprocessing.CLEAN_STAGE, preprocessing.CLEAN_VERSION, ['text'], db=conn)['id'].tolist()
+processed = run_clean_stage()
+downstream = storage.stale_rows(preprocessing.LEMMA_STAGE, preprocessing.LEMMA_VERSION, ['clean_text'], upstream=preprocessing.CLEAN_STAGE, db=conn)
+if stale == processed == downstream['id'].tolist() == [12] and len(lemma) == len(articles):
+    print("Editing one article marked exactly that row stale, in the stage and downstream of it.")
+else:
+    print(f"Mismatch after editing one article: stale {stale}, processed {processed}, downstream {downstream['id'].tolist()}")
+check_clean_columns("After the edit")
+
+# A new version of the stage, or another configuration, makes every article stale again
+new_version = storage.count_stale(preprocessing.CLEAN_STAGE, preprocessing.CLEAN_VERSION + 1, db=conn)
+new_config = storage.count_stale(preprocessing.CLEAN_STAGE, preprocessing.CLEAN_VERSION, config='other', db=conn)
+if new_version == new_config == len(articles):
+    print(f"A new version or configuration made the {len(articles)} articles stale.")
+else:
+    print(f"Mismatch: {new_version} stale with a new version, {new_config} with a new configuration")
+
+# Deleting an article removes its derived state
+with conn:
+    conn.execute('DELETE FROM content WHERE id = ?', (5,))
+left = conn.execute('SELECT COUNT(*) FROM derived_state WHERE content_id = ?', (5,)).fetchone()[0]
+if left == 0:
+    print("Deleting an article removed its derived state.")
+else:
+    print(f"Mismatch: {left} derived_state rows left for a deleted article")
+
+storage.close_connections()
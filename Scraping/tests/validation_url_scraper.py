@@ -0,0 +1,91 @@
+import asyncio
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'scrapers'))
+import url_scraper
+
+# Local stub of the newspaper listing pages:
+#   /site_a/<n>/  -> pages 1..6, page 7 answers 404 (end of pagination)
+#   /site_b/pag<n> -> pages 2..4, page 5 answers 500
+def listing_page(site, page):
+    links = [f'<div class="item"><a href="/{site}/article-{page}-{i}.html">{i}</a></div>' for i in range(5)]
+    # Repeated and absolute links, as the real listings have
+    links.append(f'<div class="item"><a href="/{site}/article-{max(page - 1, 1)}-0.html">dup</a></div>')
+    links.append(f'<div class="item"><a href="http://example.com/{site}/{page}.html">abs</a></div>')
+    return f"<html><body>{''.join(links)}</body></html>".encode("utf-8")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        site, page = parts[0], parts[-1].replace("pag", "")
+        last_page = {"site_a": 6, "site_b": 4}.get(site, 0)
+
+        if not page.isdigit() or int(page) > last_page:
+            self.send_response(404 if site == "site_a" else 500)
+            self.end_headers()
+            return
+
+        body = listing_page(site, int(page))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+base = f"http://127.0.0.1:{server.server_port}"
+
+config = {
+    "site_a": {
+        "base_url": f"{base}/site_a/",
+        "pagination_pattern": "{page_number}/",
+        "article_link_selector": ".item a",
+        "start_page": 1,
+        "end_page": 10,
+        "max_concurrency": 3,
+        "min_delay": 0.01
+    },
+    "site_b": {
+        "base_url": f"{base}/site_b/",
+        "pagination_pattern": "pag{page_number}",
+        "article_link_selector": ".item a",
+        "start_page": 2,
+        "max_concurrency": 2,
+        "min_delay": 0.0
+    }
+}
+
+# Sequential crawl (reference)
+sequential = {name: url_scraper.scrape_article_links(name, site_config, max_pages=8) for name, site_config in config.items()}
+
+# Async crawl
+concurrent = asyncio.run(url_scraper.scrape_sites_async(config, max_pages=8))
+
+for site_name in config:
+    if sequential[site_name] == concurrent[site_name]:
+        print(f"{site_name}: {len(concurrent[site_name])} links, async crawl matches sequential crawl.")
+    else:
+        print(f"Mismatch for {site_name}:\n sequential={sequential[site_name]}\n async={concurrent[site_name]}")
+
+# Incremental crawl: the links of the third listing page on (7 links per page) are
+# already known, so paging must stop there and only the links before them are new
+known = {"site_a": set(sequential["site_a"][14:]), "site_b": set()}
+expected = [link for link in sequential["site_a"] if link not in known["site_a"]]
+incremental = url_scraper.scrape_article_links("site_a", config["site_a"], max_pages=8, known_links=known["site_a"])
+incremental_async = asyncio.run(url_scraper.scrape_sites_async(config, max_pages=8, known_links=known))["site_a"]
+
+if incremental == incremental_async == expected:
+    print(f"site_a: incremental crawl found the {len(expected)} new links.")
+else:
+    print(f"Incremental mismatch:\n expected={expected}\n sequential={incremental}\n async={incremental_async}")
+
+server.shutdown()
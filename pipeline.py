@@ -0,0 +1,383 @@
+import os
+import sys
+import glob
+import time
+import hashlib
+import argparse
+import importlib.util
+import multiprocessing
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(ROOT_DIR, 'Models')
+PIPELINES_DIR = os.path.join(ROOT_DIR, 'Scraping', 'src', 'pipelines')
+SCRAPERS_DIR = os.path.join(ROOT_DIR, 'Scraping', 'src', 'scrapers')
+
+# The Models modules import their siblings by name (e.g. `from preprocessing import ...`),
+# so Models goes first: Scraping/src/pipelines has another preprocessing.py
+sys.path.insert(0, MODELS_DIR)
+sys.path.append(PIPELINES_DIR)
+sys.path.append(SCRAPERS_DIR)
+import storage
+
+# Every path is relative to the root of the repository (the scripts are run from there)
+DB_PATH = 'data/processed/articles.db'
+LINKS_CSV = 'data/all_links.csv'
+FEATURES_DIR = 'data/features'
+
+#Function to load a module of the repository from its file
+def load_module(directory, name):
+    """
+    Imports `<directory>/<name>.py`. The Models modules are registered under their own
+    name, so their sibling imports reuse them; the others get the name of their folder as
+    prefix (pipelines_preprocessing), so they never shadow a Models module.
+    """
+    module_name = name if directory == MODELS_DIR else f"{os.path.basename(directory)}_{name}"
+    if module_name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(directory, f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[module_name]
+
+# Stages (run in the worker processes, with the database path and whether the stage is
+# forced: the per-article stages then reprocess every article, not only the stale ones)
+def run_links(db_path, force=False):
+    url_scraper = load_module(SCRAPERS_DIR, 'url_scraper')
+    url_scraper.scrape_all_sites(url_scraper.CONFIG_PATH, incremental=True, checkpoint_db=db_path)
+
+def run_content(db_path, force=False):
+    stream_pipeline = load_module(PIPELINES_DIR, 'stream_pipeline')
+    stream_pipeline.stream_scrape_to_database(stream_pipeline.iter_links_from_csv(LINKS_CSV), db_path)
+
+def run_outliers(db_path, force=False):
+    cleaning_data = load_module(PIPELINES_DIR, 'cleaning_data')
+    cleaning_data.main(db_path, content_table="content", links_table="links", remove_outliers=True)
+
+#Function to fail a per-article stage that left articles unprocessed
+def check_processed(db_path, stage, version, upstream=None, config=None):
+    # The stage functions print their errors instead of raising them: without this check a
+    # failed stage would be saved as up to date and skipped on the next runs
+    remaining = storage.count_stale(stage, version, upstream, config, db=db_path)
+    if remaining:
+        raise RuntimeError(f"{remaining} articles were not processed by the {stage} stage (see the errors above)")
+
+def run_clean(db_path, force=False):
+    preprocessing = load_module(MODELS_DIR, 'preprocessing')
+    preprocessing.main(db_path, lemmatize=False, full=force)
+    check_processed(db_path, preprocessing.CLEAN_STAGE, preprocessing.CLEAN_VERSION)
+
+def run_lemma(db_path, force=False):
+    preprocessing = load_module(MODELS_DIR, 'preprocessing')
+    preprocessing.update_lemma_column(storage.get_connection(db_path), full=force)
+    check_processed(db_path, preprocessing.LEMMA_STAGE, preprocessing.LEMMA_VERSION, upstream=preprocessing.CLEAN_STAGE)
+
+def run_tokens(db_path, force=False):
+    preprocessing = load_module(PIPELINES_DIR, 'preprocessing')
+    preprocessing.main(db_path, full=force)
+    check_processed(db_path, preprocessing.TOKENS_STAGE, preprocessing.TOKENS_VERSION)
+
+def run_sentiment(db_path, force=False):
+    sentiment = load_module(MODELS_DIR, 'sentiment')
+    sentiment.update_sentiment_columns(storage.get_connection(db_path), full=force)
+    check_processed(db_path, sentiment.SENTIMENT_STAGE, sentiment.SENTIMENT_VERSION, upstream='clean',
+                    config=sentiment.stage_config(sentiment.DEFAULT_SCORERS))
+
+def run_stance(db_path, force=False):
+    stance = load_module(MODELS_DIR, 'stance')
+    # The articles are marked processed before they are rescored, so a failed rescoring
+    # does not show in derived_state: the stage returns None when it fails
+    if stance.update_stance_columns(storage.get_connection(db_path), full=force) is None:
+        raise RuntimeError("The stance stage failed (see the errors above)")
+    check_processed(db_path, stance.STANCE_STAGE, stance.STANCE_VERSION, upstream='clean',
+                    config=stance.stage_config(stance.load_matcher()))
+
+def run_ner(db_path, force=False):
+    ner = load_module(MODELS_DIR, 'ner')
+    ner.update_entities(storage.get_connection(db_path), full=force)
+    check_processed(db_path, ner.NER_STAGE, ner.NER_VERSION)
+
+def run_embeddings(db_path, force=False):
+    embeddings = load_module(MODELS_DIR, 'embeddings')
+    model, model_dir = load_module(MODELS_DIR, 'word2vec_training').train_word2vec(db_path)
+    store = load_module(MODELS_DIR, 'feature_store').FeatureStore(FEATURES_DIR)
+    embeddings.embed_articles(db_path, model.wv, store)
+    for name, label in embeddings.ENTITY_FEATURES.items():
+        embeddings.embed_entities(db_path, model.wv, store, label, name)
+
+def run_artifacts(db_path, force=False):
+    artifacts = load_module(MODELS_DIR, 'artifacts')
+    store = load_module(MODELS_DIR, 'feature_store').FeatureStore(FEATURES_DIR)
+    artifacts.fit_artifacts(db_path, artifacts.ArtifactRegistry(), store)
+
+def run_sweep(db_path, force=False):
+    store = load_module(MODELS_DIR, 'feature_store').FeatureStore(FEATURES_DIR)
+    print(load_module(MODELS_DIR, 'clustering_sweep').run_sweep(db_path, store).head(10))
+
+# Dependency graph of the stages: upstream stages ('after'), and the inputs and outputs
+# whose fingerprints decide whether a stage is up to date. Resources are file globs
+# (relative to the repository) or database resources:
+#   db:corpus               ids and content hashes of the articles
+#   db:state:<stage>        derived_state rows of a per-article stage
+#   db:<table>[.<columns>]  rows of a table (all or some columns)
+# The code of a stage is one of its inputs, so editing it reruns the stage.
+STAGES = {
+    # The web cannot be fingerprinted: the scraping stages run whenever they are selected
+    'links': {
+        'run': run_links, 'after': [], 'always': True,
+        'inputs': ['Scraping/src/scrapers/config/sites_config.json'],
+        'outputs': ['data/raw/*_links.json', LINKS_CSV],
+    },
+    'content': {
+        'run': run_content, 'after': ['links'], 'always': True,
+        'inputs': [LINKS_CSV],
+        'outputs': ['db:corpus'],
+    },
+    'outliers': {
+        'run': run_outliers, 'after': ['content'],
+        'inputs': ['db:corpus', 'Scraping/src/pipelines/cleaning_data.py'],
+        'outputs': ['db:corpus', 'db:content.outlier,word_count,char_count'],
+    },
+    'clean': {
+        'run': run_clean, 'after': ['outliers'],
+        'inputs': ['db:corpus', 'Models/preprocessing.py'],
+        'outputs': ['db:state:clean'],
+    },
+    'lemma': {
+        'run': run_lemma, 'after': ['clean'],
+        'inputs': ['db:state:clean', 'Models/preprocessing.py'],
+        'outputs': ['db:state:lemma'],
+    },
+    'tokens': {
+        'run': run_tokens, 'after': ['outliers'],
+        'inputs': ['db:corpus', 'Scraping/src/pipelines/preprocessing.py'],
+        'outputs': ['db:state:tokens'],
+    },
+    'sentiment': {
+        'run': run_sentiment, 'after': ['clean'],
+        'inputs': ['db:state:clean', 'Models/sentiment.py', 'Models/spanish_*_words.txt'],
+        'outputs': ['db:state:sentiment'],
+    },
+    # Only new or changed articles are matched against the lexicon, but the IDF is refitted
+    # on the whole corpus: a new article changes the weight of every entry, so the articles
+    # with lexicon hits are rescored (from their stored counts) and the stages downstream rerun
+    'stance': {
+        'run': run_stance, 'after': ['clean'],
+        'inputs': ['db:state:clean', 'Models/stance.py', 'Models/lexicon_matcher.py', 'Models/lexicons/*.json'],
+        'outputs': ['db:state:stance', 'db:content.pro_immigration_tfidf,anti_immigration_tfidf,stance_tfidf'],
+    },
+    'ner': {
+        'run': run_ner, 'after': ['outliers'],
+        'inputs': ['db:corpus', 'Models/ner.py'],
+        'outputs': ['db:state:ner', 'db:entity_counts'],
+    },
+    'embeddings': {
+        'run': run_embeddings, 'after': ['clean', 'ner'],
+        'inputs': ['db:state:clean', 'db:entity_counts', 'Models/embeddings.py', 'Models/word2vec_training.py'],
+        'outputs': [f'{FEATURES_DIR}/word2vec.npy', f'{FEATURES_DIR}/*_vec.npy'],
+    },
+    'artifacts': {
+        'run': run_artifacts, 'after': ['embeddings', 'sentiment', 'stance'],
+        'inputs': ['db:state:clean', 'db:state:sentiment', 'db:content.pro_immigration_tfidf,anti_immigration_tfidf',
+                   'Models/artifacts.py', 'Models/streaming_clustering.py'],
+        'outputs': ['data/models/artifacts/*/*/metadata.json', 'db:cluster_assignments'],
+    },
+    # After artifacts, which rewrites the word2vec feature the sweep memory-maps
+    'sweep': {
+        'run': run_sweep, 'after': ['embeddings', 'sentiment', 'stance', 'artifacts'],
+        'inputs': [f'{FEATURES_DIR}/word2vec.npy', f'{FEATURES_DIR}/*_vec.npy', 'db:state:sentiment',
+                   'db:content.pro_immigration_tfidf,anti_immigration_tfidf,stance_tfidf',
+                   'Models/clustering_sweep.py', 'Models/cluster_evaluation.py'],
+        'outputs': ['db:clustering_results'],
+    },
+}
+SCRAPING_STAGES = ['links', 'content']
+
+class Fingerprints:
+    def __init__(self, db_path, batch_size=10_000):
+        """
+        Content fingerprints (sha256) of the resources of the stages. Every resource is
+        hashed at most once until a stage that writes it finishes (see invalidate).
+
+        Args:
+            db_path (str): Path to the SQLite database.
+            batch_size (int): Rows hashed at a time.
+        """
+        self.conn = storage.get_connection(db_path)
+        self.batch_size = batch_size
+        self._cache = {}
+
+    def _rows(self, resource):
+        if resource == 'db:corpus':
+            storage.refresh_content_hashes(self.conn)
+            return self.conn.execute('SELECT id, content_hash FROM content ORDER BY id')
+        if resource.startswith('db:state:'):
+            return self.conn.execute('SELECT content_id, input_hash, version FROM derived_state WHERE stage = ? ORDER BY content_id',
+                                     (resource[len('db:state:'):],))
+        table, _, columns = resource[len('db:'):].partition('.')
+        return self.conn.execute(f'SELECT rowid, {columns or "*"} FROM {table} ORDER BY rowid')
+
+    def resource(self, resource):
+        if resource not in self._cache:
+            digest = hashlib.sha256()
+            if resource.startswith('db:'):
+                cursor = self._rows(resource)
+                while True:
+                    rows = cursor.fetchmany(self.batch_size)
+                    if not rows:
+                        break
+                    digest.update(repr(rows).encode('utf-8'))
+            else:
+                # Missing files hash as nothing, so creating one changes the fingerprint
+                for path in sorted(glob.glob(resource)):
+                    digest.update(path.encode('utf-8'))
+                    with open(path, 'rb') as file:
+                        for block in iter(lambda: file.read(1 << 20), b''):
+                            digest.update(block)
+            self._cache[resource] = digest.hexdigest()
+        return self._cache[resource]
+
+    def combine(self, resources):
+        return hashlib.sha256(''.join(f"{resource}={self.resource(resource)}\n" for resource in resources).encode('utf-8')).hexdigest()
+
+    def invalidate(self, resources):
+        for resource in resources:
+            self._cache.pop(resource, None)
+
+#Function to get the stages to run: the selected ones and everything upstream of them
+def select_stages(targets=None, scrape=False):
+    if targets:
+        selected, stack = set(), list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in selected:
+                selected.add(name)
+                # Scraping is only done on request, even if a selected stage is downstream of it
+                stack += [upstream for upstream in STAGES[name]['after'] if scrape or upstream not in SCRAPING_STAGES]
+    else:
+        selected = {name for name in STAGES if scrape or name not in SCRAPING_STAGES}
+    # STAGES is in topological order
+    return [name for name in STAGES if name in selected]
+
+#Function to run one stage (in a worker process)
+def run_stage(name, db_path, force=False):
+    start = time.perf_counter()
+    STAGES[name]['run'](db_path, force)
+    storage.close_connections()
+    return time.perf_counter() - start
+
+#Function to record the fingerprints of a stage after a successful run
+def save_state(conn, name, input_fingerprint, output_fingerprint, seconds):
+    storage.execute('''
+        INSERT INTO pipeline_state (stage, input_fingerprint, output_fingerprint, seconds, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(stage) DO UPDATE SET
+            input_fingerprint = excluded.input_fingerprint,
+            output_fingerprint = excluded.output_fingerprint,
+            seconds = excluded.seconds,
+            updated_at = excluded.updated_at
+    ''', (name, input_fingerprint, output_fingerprint, seconds, datetime.now(timezone.utc).isoformat(timespec='seconds')), conn)
+
+#Function to run the pipeline
+def run_pipeline(db_path=DB_PATH, targets=None, scrape=False, force=False, workers=None, dry_run=False):
+    """
+    Runs the stages of the dependency graph, each one as soon as its upstream stages are
+    done, so independent stages (e.g. sentiment, stance and NER) run at the same time in
+    separate processes. A stage is skipped when the fingerprints of its inputs and of its
+    outputs are the ones recorded at its last run; most stages are also incremental on
+    their own (derived_state), so a rerun after a small change only redoes the affected work.
+
+    Args:
+        db_path (str): Path to the SQLite database.
+        targets (list): Stages to bring up to date, with their upstream stages (all if None).
+        scrape (bool): Also scrape new links and articles.
+        force (bool): Rerun the targets (every stage if there are no targets) even if up to date;
+            the forced per-article stages reprocess every article.
+        workers (int): Maximum number of stages running at the same time.
+        dry_run (bool): Only report which stages are out of date.
+
+    Returns:
+        dict: Stage -> 'skipped', 'ran', 'stale' (dry run), 'failed' or 'blocked'.
+    """
+    plan = select_stages(targets, scrape)
+    forced = set(targets or plan) if force else set()
+    conn = storage.get_connection(db_path)
+    state = {stage: (input_fingerprint, output_fingerprint) for stage, input_fingerprint, output_fingerprint
+             in conn.execute('SELECT stage, input_fingerprint, output_fingerprint FROM pipeline_state')}
+    fingerprints = Fingerprints(db_path)
+
+    def upstream(name):
+        return [stage for stage in STAGES[name]['after'] if stage in plan]
+
+    results, pending, running = {}, list(plan), {}
+    # Spawned workers: a forked one would share the SQLite connections of this process
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        while pending or running:
+            for name in list(pending):
+                if any(results.get(stage) in ('failed', 'blocked') for stage in upstream(name)):
+                    pending.remove(name)
+                    results[name] = 'blocked'
+                    print(f"{name}: not run, an upstream stage failed")
+                    continue
+                if not all(results.get(stage) in ('skipped', 'ran', 'stale') for stage in upstream(name)):
+                    continue
+
+                pending.remove(name)
+                stage = STAGES[name]
+                fresh = (name not in forced and not stage.get('always')
+                         and state.get(name) == (fingerprints.combine(stage['inputs']), fingerprints.combine(stage['outputs'])))
+                if dry_run:
+                    # Downstream of a stale stage the inputs will change once it runs
+                    stale = not fresh or any(results[before] == 'stale' for before in upstream(name))
+                    results[name] = 'stale' if stale else 'skipped'
+                    print(f"{name}: {'out of date' if stale else 'up to date'}")
+                elif fresh:
+                    results[name] = 'skipped'
+                    print(f"{name}: up to date, skipped")
+                else:
+                    print(f"{name}: running")
+                    running[executor.submit(run_stage, name, db_path, name in forced)] = name
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    seconds = future.result()
+                except Exception as e:
+                    results[name] = 'failed'
+                    print(f"Error in stage {name}: {e}")
+                    continue
+
+                # The inputs are fingerprinted after the run too: a stage may change them (outliers)
+                fingerprints.invalidate(STAGES[name]['outputs'])
+                save_state(conn, name, fingerprints.combine(STAGES[name]['inputs']),
+                           fingerprints.combine(STAGES[name]['outputs']), seconds)
+                results[name] = 'ran'
+                print(f"{name}: done in {seconds:.1f}s")
+
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the stages of the bias pipeline that are out of date.")
+    parser.add_argument('stages', nargs='*', metavar='stage',
+                        help=f"stages to bring up to date, with their upstream stages (default: all). One of: {', '.join(STAGES)}")
+    parser.add_argument('--db', default=os.path.join(ROOT_DIR, DB_PATH), help="SQLite database")
+    parser.add_argument('--scrape', action='store_true', help="also scrape new links and articles")
+    parser.add_argument('--force', action='store_true', help="rerun the selected stages even if they are up to date, reprocessing every article")
+    parser.add_argument('--workers', type=int, default=None, help="maximum number of stages running at the same time")
+    parser.add_argument('--dry-run', action='store_true', help="only show which stages are out of date")
+    args = parser.parse_args(argv)
+    unknown = [stage for stage in args.stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)} (choose from {', '.join(STAGES)})")
+
+    db_path = os.path.abspath(args.db)
+    os.chdir(ROOT_DIR)
+    results = run_pipeline(db_path, args.stages, args.scrape, args.force, args.workers, args.dry_run)
+    return 1 if any(result in ('failed', 'blocked') for result in results.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())